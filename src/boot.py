@@ -3,22 +3,24 @@
 This file is executed on every boot (including wake-boot from deepsleep)
 """
 import gc
+import logging
 import time
 import esp
 import network
 import webrepl
 try:
-    from config import Config
-    from status import state
+    from config import get_config
+    from status import logging as log, state
 except ImportError:
     # Try to (hardcoded) connect to WIFI and start webrepl
     import recovery_boot
     raise
 
 esp.osdebug(None)
+logging.basicConfig(buffer=log.rolling)  # The log records are formatted when the log is read
 gc.collect()
 
-network_config = Config('network_config.json')
+network_config = get_config('network_config.json')
 
 
 def connect_wifi(essid, password, accesspoints, timeout=60):
@@ -45,7 +47,6 @@ def connect_wifi(essid, password, accesspoints, timeout=60):
         start_time = time.time()
         while not wlan.isconnected():
             print('.', end='')
-            state.update()
             if time.time() - start_time > timeout:
                 print('\nFailed to connect within %ds' % timeout)
                 wlan.disconnect()
@@ -1,12 +1,23 @@
 """File providing support to read and calibrate analog input measurements."""
 import logging
+import time
+from array import array
 
 from machine import ADC, Pin, SoftI2C as I2C
+import uasyncio as asyncio
 from ads1x15 import ads1x15
 
 LOG = logging.getLogger('analog_in')
 LOG.setLevel(logging.INFO)
 
+# ADS1115 registers (see the datasheet and ads1x15.py)
+_REGISTER_CONVERT = 0
+_REGISTER_CONFIG = 1
+_REGISTER_LOWTHRESH = 2
+_REGISTER_HITHRESH = 3
+_OS_NOTBUSY = 0x8000
+_RATES = (8, 16, 32, 64, 128, 250, 475, 860)  # Data rates of the ADS1115 [samples/s]
+
 class Adc:
     """Base class for a single analog to digital converter."""
 
@@ -54,38 +65,116 @@ class Ads1115(Adc):
     class _Ads1115():
         """The ADS1115 supports up to 4 16-bit analog inputs.
         The last input can be used as a reference measurement.
+
+        All registered channels are converted in a single asynchronous scan task.
+        A completed scan is published as a snapshot, so a value and its reference are always from the same scan.
+        During a conversion, the scan task awaits the ALERT/RDY pin (if connected) or polls the ADS1115 with sleep_ms(),
+        so other tasks can run while the ADS1115 is converting.
         """
         UNUSED_PIN = 4
 
         def __init__(self, ads1115_config: dict):
             """Initialize the ADS1115.
             It is controlled by I2C and requires the scl and sda pins in the hardware configuration.
+            Optional configuration items:
+                rate        Data rate index of the ADS1115 (0..7 => 8..860 samples/s).
+                interval    Scan all channels every interval. [s]
+                ALERT       The ESP pin connected to ALERT/RDY of the ADS1115 (e.g. "ESP.4").
+                conversion  "blocking" to use the blocking read() of the driver.
             """
             scl_pin = int(ads1115_config.get('SDA').split('.')[-1])  # ADS.sda is connected to ESP.scl
             sda_pin = int(ads1115_config.get('SCL').split('.')[-1])  # ADS.scl is connected to ESP.sda
             i2c = I2C(scl=Pin(scl_pin), sda=Pin(sda_pin))
+            self.adc = None
             if 0x48 not in i2c.scan():
                 LOG.error('ADS1115 not detected!')
             else:
                 self.adc = ads1x15.ADS1115(i2c, 0x48)
-            self.active_pins = set()
-            self.pins_read = list(range(4))
-            self.values = list(0 for _ in range(5))
+            self.rate = int(ads1115_config.get('rate', 4))
+            self.interval = float(ads1115_config.get('interval', 0.3))
+            self.channels = list()
+            # The latest snapshot and the scan in progress (the UNUSED_PIN entry stays 0)
+            self.values = array('i', bytes(4 * (self.UNUSED_PIN + 1)))
+            self._scan = array('i', bytes(4 * (self.UNUSED_PIN + 1)))
+            self.ticks_ms = None  # Start time of the latest snapshot
+            self._task = None
+            self.blocking = ads1115_config.get('conversion') == 'blocking'
+            self._ready = None
+            if self.adc is not None and not self.blocking and 'ALERT' in ads1115_config:
+                # Configure ALERT/RDY as conversion ready output (see the datasheet)
+                self.adc._write_register(_REGISTER_LOWTHRESH, 0)  # pylint: disable=protected-access
+                self.adc._write_register(_REGISTER_HITHRESH, 0x8000)  # pylint: disable=protected-access
+                self._ready = asyncio.ThreadSafeFlag()
+                self._alert = Pin(int(ads1115_config['ALERT'].split('.')[-1]), Pin.IN, Pin.PULL_UP)
+                self._alert.irq(handler=lambda _: self._ready.set(), trigger=Pin.IRQ_FALLING)
 
-        def read(self, pin, ref_pin=UNUSED_PIN, ref_gain=0):
-            """Read the raw values for all used pins."""
-            if ref_pin < self.UNUSED_PIN:
-                assert pin != ref_pin
-                self.active_pins.add(ref_pin)
-            if pin in self.pins_read or pin not in self.active_pins:
-                self.active_pins.add(pin)
-                self.pins_read = [pin]
-                for pin_to_read in self.active_pins:
-                    self.values[pin_to_read] = self.adc.read(channel1=pin_to_read)
+        def register(self, pin: int):
+            """Add the pin to the scanned channels and start scanning."""
+            if pin < self.UNUSED_PIN and pin not in self.channels:
+                self.channels.append(pin)
+                self.channels.sort()
+            if self._task is None and self.adc is not None:
+                self._task = asyncio.create_task(self.run())
+
+        async def run(self):
+            """Scan all registered channels every interval."""
+            interval_ms = int(self.interval * 1000)
+            while True:
+                start = time.ticks_ms()
+                scan = self._scan
+                try:
+                    if self.blocking:
+                        await self._scan_blocking(scan)
+                    else:
+                        await self._scan_async(scan)
+                except OSError as ex:
+                    LOG.error('ADS1115 scan failed: %s', ex)
+                else:
+                    self._scan = self.values
+                    self.values = scan
+                    self.ticks_ms = start
+                await asyncio.sleep_ms(max(0, interval_ms - time.ticks_diff(time.ticks_ms(), start)))
+
+        async def _scan_blocking(self, scan):
+            """Convert all channels with the blocking read() of the driver."""
+            for pin in self.channels:
+                scan[pin] = self.adc.read(self.rate, pin)
+                await asyncio.sleep_ms(0)
+
+        async def _scan_async(self, scan):
+            """Convert all channels, awaiting the end of every conversion."""
+            conversion_ms = 1000 // _RATES[self.rate] + 1
+            previous = None
+            for pin in self.channels:
+                self.adc.set_conv(self.rate, pin)
+                result = self.adc.read_rev()  # Read the previous conversion and start the conversion of this pin
+                if previous is not None:
+                    scan[previous] = result
+                previous = pin
+                await self._wait_ready(conversion_ms)
+            if previous is not None:
+                result = self.adc._read_register(_REGISTER_CONVERT)  # pylint: disable=protected-access
+                scan[previous] = result if result < 32768 else result - 65536
+
+        async def _wait_ready(self, conversion_ms: int):
+            """Wait until the conversion is ready."""
+            if self._ready is not None:
+                try:
+                    await asyncio.wait_for_ms(self._ready.wait(), 2 * conversion_ms + 10)
+                except asyncio.TimeoutError:
+                    LOG.warning('ADS1115 ALERT/RDY timeout')
             else:
-                self.pins_read.append(pin)
-            return dict(raw=self.values[pin],
-                        ref_raw=self.values[ref_pin] * ref_gain)
+                await asyncio.sleep_ms(conversion_ms)
+            # Also verify the state after the ALERT/RDY pulse, to be robust for a late pulse of a previous conversion
+            while not self.adc._read_register(_REGISTER_CONFIG) & _OS_NOTBUSY:  # pylint: disable=protected-access
+                await asyncio.sleep_ms(1)
+
+        def read(self, pin, ref_pin=UNUSED_PIN, ref_gain=0):
+            """Get the raw values of the latest snapshot."""
+            values = self.values
+            return dict(raw=values[pin],
+                        ref_raw=values[ref_pin] * ref_gain,
+                        ticks_ms=self.ticks_ms)
 
     def __init__(self, device_config: dict, pin: int):
         if device_config.get('device') != 'ADS1115':
@@ -97,6 +186,9 @@ class Ads1115(Adc):
         self.ref_pin = int(device_config.get('u_ref.pin'))
         self.ref_gain = float(device_config.get('u_ref.gain'))
         self.pin = pin
+        assert pin != self.ref_pin
+        self.adc.register(self.ref_pin)
+        self.adc.register(pin)
 
     def read(self):
         """Read the analog input value."""
@@ -1,24 +1,36 @@
 """Calibrate a raw value to a calibrated floating point value."""
-from collections import OrderedDict
+from array import array
 
 import logging
-from config import Config
+from config import get_config
 
 
 class Calibration():
     """Convert raw measured values to calibrated floating point values."""
 
-    def __init__(self, calibration_file, steps: int, min_temp: float, max_temp: float):
+    def __init__(self, calibration_file, steps: int, min_temp: float, max_temp: float, delay: float = 2.0):
         """Constructor
         @param calibration_file Filename to store calibration data.
         @param steps            Maximum value 2^ADC_nr_of_bits
         @param min_temp         The estimated minimum temperature (raw value=0).
         @param max_temp         The estimated maximum temperature (raw value=steps-1)
+        @param delay            Write the calibration data when it is not changed for this duration [s] (see Config).
         """
-        self._config = Config(calibration_file)
-        self._steps = dict()  # Update with _update_steps()
+        self._config = get_config(calibration_file, delay)
+        # Sorted calibration points and the slope of each segment between them. Update with _update_steps()
+        self._raw = array('i')
+        self._temperature = array('f')
+        self._slope = array('f')
         cal_values = self._config.get()
         self.key_formatter = 't%0{}d'.format(len(str(steps)))
+        with self._config.batch():
+            self._set_limits(cal_values, steps, min_temp, max_temp)
+        self._update_steps()
+        self._callbacks = [self._changed]  # The callbacks of this calibration on the (shared) config
+        self._config.add_callback(self._changed)
+
+    def _set_limits(self, cal_values: dict, steps: int, min_temp: float, max_temp: float):
+        """Set the calibrated values of the lowest and the highest raw value (if not specified yet)."""
         if cal_values:
             raw_values = sorted(cal_values)
             lowest = raw_values[0]
@@ -44,59 +56,79 @@ class Calibration():
         else:
             self._config.set(self._format_raw(0), min_temp)
             self._config.set(self._format_raw(steps - 1), max_temp)
-        self._update_steps()
 
     def _format_raw(self, raw_value) -> str:
         """Convert the raw_value to a json key_value."""
         return self.key_formatter % int(raw_value)
 
+    def _changed(self, *_):
+        self._update_steps()
+
     def _update_steps(self):
-        # make config sorted
-        self._steps = OrderedDict([(int(key[1:]), value)
-                                   for (key, value) in sorted(self._config.get().items(), key=lambda t: t[0])])
-        keys = list(self._steps)
-        self._min_raw = keys[0]
-        self._max_raw = keys[-1]
+        """Rebuild the sorted calibration points and the slope of every segment."""
+        items = sorted((int(key[1:]), value) for (key, value) in self._config.get().items())
+        self._raw = array('i', [key for (key, _) in items])
+        self._temperature = array('f', [value for (_, value) in items])
+        self._slope = array('f', [(items[i + 1][1] - items[i][1]) / (items[i + 1][0] - items[i][0])
+                                  for i in range(len(items) - 1)])
+        self._min_raw = self._raw[0]
+        self._max_raw = self._raw[-1]
 
     def get(self, raw_value: int) -> float:
         """Convert the given raw value to a calibrated temperature value."""
-        lower = self._min_raw
-        higher = self._max_raw
-        for stored in self._steps:
-            if stored <= raw_value:
-                lower = stored
-            elif stored > raw_value:
-                higher = stored
-                break
-        logging.debug('lower: %s, measured: %s, higher: %s', lower, raw_value, higher)
-        if higher == lower:
-            return self._steps[lower]
-        return self._steps[lower] + ((raw_value - lower) * (self._steps[higher] - self._steps[lower]) / (higher - lower))
+        raw = self._raw
+        if raw_value <= self._min_raw:
+            return self._temperature[0]
+        if raw_value >= self._max_raw:
+            return self._temperature[-1]
+        # Binary search for the segment: raw[lower] <= raw_value < raw[higher]
+        lower = 0
+        higher = len(raw) - 1
+        while higher - lower > 1:
+            middle = (lower + higher) >> 1
+            if raw[middle] <= raw_value:
+                lower = middle
+            else:
+                higher = middle
+        return self._temperature[lower] + (raw_value - raw[lower]) * self._slope[lower]
 
     def set(self, raw_value: int, calibrated_value):
         """Update the calibration matrix with the given raw_value that represents the calibrated_value."""
-        self._config.set(self._format_raw(raw_value), float(calibrated_value))
-        self._update_steps()
+        self._config.set(self._format_raw(raw_value), float(calibrated_value))  # Calls _update_steps()
 
     def remove(self, raw_value):
         """Remove the given calibrated value from the calibration matrix."""
-        self._config.remove(self._format_raw(raw_value))
-        self._update_steps()
+        self._config.remove(self._format_raw(raw_value))  # Calls _update_steps()
+
+    def add_callback(self, callback):
+        """Call callback(key, value) after the calibration is changed (see Config.add_callback)."""
+        self._callbacks.append(callback)
+        self._config.add_callback(callback)
+
+    def close(self):
+        """Remove the callbacks of this calibration from the shared config (the calibration is not used anymore)."""
+        for callback in self._callbacks:
+            self._config.remove_callback(callback)
+        self._callbacks.clear()
+
+    def commit(self):
+        """Write the pending changes of the calibration data."""
+        self._config.commit()
 
     def web_page(self, temperature_variable_name: str):
         """Get a webpage body containing the stored calibration values."""
         html = '<table>\n'
         prev_value = -273
         html += '<tr><th>raw value</th><th>actual temperature [&deg;C]</th><th>delete</th></tr>\n'
-        max_raw = list(self._steps)[-1]
-        for (key, value) in self._steps.items():
+        for key in self._raw:
+            value = self._config.get(self._format_raw(key))
             remove = ''
             if value < prev_value:
                 style = ' style="color:red"'
             else:
                 prev_value = value
                 style = ''
-            if key in [0, max_raw]:
+            if key in [0, self._max_raw]:
                 remove = '-'
             else:
                 remove = '<b><a href="/calibration?%s.calibration.remove=%d">x</a></b>' % (temperature_variable_name, key)
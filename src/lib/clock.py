@@ -0,0 +1,47 @@
+"""Clock used by the brewery to measure durations and to wait.
+
+The recipe, the controllers and the sensors get their time from a Clock instance,
+so a simulation or a test can run them on a different (e.g. virtual) time.
+"""
+import time
+import uasyncio as asyncio
+
+
+class Clock():
+    """The system time and the sleeps of the asyncio event loop."""
+
+    def __init__(self) -> None:
+        self._ticks = time.ticks_ms()
+        self._monotonic = 0
+
+    def time(self) -> float:
+        """Get the current time. [s]"""
+        return time.time()
+
+    def ticks_ms(self) -> int:
+        """Get the millisecond counter (see time.ticks_diff())."""
+        return time.ticks_ms()
+
+    def monotonic_ms(self) -> int:
+        """Get the milliseconds since the creation of the clock, to measure durations (this does not wrap around,
+        and does not jump when the time is synchronized). Call it at least every 6 days (ticks_ms() wraps). [ms]
+        """
+        ticks = self.ticks_ms()
+        self._monotonic += time.ticks_diff(ticks, self._ticks)
+        self._ticks = ticks
+        return self._monotonic
+
+    def monotonic(self) -> float:
+        """Get the seconds since the creation of the clock (see monotonic_ms()). [s]"""
+        return self.monotonic_ms() / 1000
+
+    async def sleep(self, seconds: float):
+        """Wait for the given duration. [s]"""
+        await asyncio.sleep(seconds)
+
+    async def sleep_ms(self, ms: int):
+        """Wait for the given duration. [ms]"""
+        await asyncio.sleep_ms(ms)
+
+
+SYSTEM_CLOCK = Clock()
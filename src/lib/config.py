@@ -1,8 +1,28 @@
-"""Support file to handle configuration files."""
+"""Support file to handle configuration files.
+
+Use get_config() to share a config file: each file is loaded once, on first access, and every module gets the same
+Config. The items returned by get() are shared as well, so change them with set() (not in place): set() notifies
+the callbacks of the dependants.
+
+A change is written to a temporary file, which is renamed to the config file. So a reset during a write
+does not corrupt the config file.
+
+usage:
+    config = Config('calibration.json', delay=2)  # Write the changes 2s after the last change
+    config.set('t00000', -20.0)
+    with config.batch():  # Write multiple changes at once (at the end of the batch)
+        config.set('t00000', -20.0)
+        config.set('t32767', 120.0)
+    config.commit()  # Write the pending changes now
+
+    hardware = get_config('config.json')['hardware']
+    get_config('config.json').add_callback(lambda key, value: print(key, value), 'hardware')
+"""
 import json
 import os
+import time
 try:
-    from typing import Dict, Union
+    from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 except ImportError:
     ...
 
@@ -10,12 +30,25 @@ except ImportError:
 class Config():
     """Class for serializing configuration items."""
 
-    def __init__(self, filename: str) -> None:
+    def __init__(self, filename: str, delay: Optional[float] = None) -> None:
+        """Constructor.
+        params:
+            filename  The json file of the config items.
+            delay     Write the changes when there are no more changes for this duration. [s]
+                      None: write every change immediately (also when no asyncio event loop is running).
+        """
         self.filename = filename
-        try:
-            with open(self.filename) as file:
-                self.__config = json.load(file)
-        except OSError:
+        self.delay = delay
+        self.writes = 0  # Number of times the file is written
+        self._dirty = False
+        self._depth = 0  # Nesting depth of the batches
+        self._changed_at = 0  # Time of the last change (to restart the delay of the pending write) [ms]
+        self._pending = False  # A delayed write is scheduled
+        self._callbacks: List[Tuple[Optional[str], Callable[[str, Any], None]]] = list()
+        self.__config = self._load(filename)
+        if self.__config is None:
+            self.__config = self._load(filename + '.tmp')  # A reset happened while replacing the file
+        if self.__config is None:
             path = ''
             for part in filename.split('/')[:-1]:
                 try:
@@ -25,6 +58,17 @@ class Config():
                 path += part + '/'
             self.__config = dict()
 
+    @staticmethod
+    def _load(filename: str) -> Optional[dict]:
+        try:
+            with open(filename) as file:
+                return json.load(file)
+        except OSError:
+            return None
+        except ValueError as ex:
+            print(f'WARNING: {filename} is corrupt: {ex}')
+            return None
+
     def get(self, key=None, default=None) -> Union[str, Dict[str, Union[str, Dict[str, str]]]]:
         """Get a config item."""
         if key is None:
@@ -38,11 +82,109 @@ class Config():
     def set(self, key, value):
         """Set a config item."""
         self.__config[key] = value
-        with open(self.filename, 'w') as file:
-            file.write(json.dumps(self.__config))
+        self._changed()
+        self._notify(key, value)
 
     def remove(self, key):
-        """Set a config item."""
+        """Remove a config item."""
         del self.__config[key]
-        with open(self.filename, 'w') as file:
+        self._changed()
+        self._notify(key, None)
+
+    def add_callback(self, callback: Callable[[str, Any], None], key: Optional[str] = None):
+        """Call callback(key, value) when an item is changed (value None: removed).
+        params:
+            callback  The function to call.
+            key       Only call it for this item (None: for all items).
+        """
+        self._callbacks.append((key, callback))
+
+    def remove_callback(self, callback: Callable[[str, Any], None]):
+        """Do not call the callback anymore (see add_callback)."""
+        self._callbacks = [item for item in self._callbacks if item[1] != callback]
+
+    def _notify(self, key, value):
+        for filter_key, callback in self._callbacks:
+            if filter_key is None or filter_key == key:
+                callback(key, value)
+
+    def batch(self) -> 'Config':
+        """Get a context manager to write all changes within the context at once."""
+        return self
+
+    def __enter__(self) -> 'Config':
+        self._depth += 1
+        return self
+
+    def __exit__(self, *args):
+        self._depth -= 1
+        if self._depth == 0 and not self._pending:
+            self.commit()
+
+    def commit(self):
+        """Write the pending changes."""
+        if not self._dirty:
+            return
+        temporary = self.filename + '.tmp'
+        with open(temporary, 'w') as file:
             file.write(json.dumps(self.__config))
+        try:
+            os.rename(temporary, self.filename)
+        except OSError:  # The file system does not replace an existing file (FAT)
+            os.remove(self.filename)
+            os.rename(temporary, self.filename)
+        self.writes += 1
+        self._dirty = False
+
+    def _changed(self):
+        """Write the changes now, at the end of the batch, or after the delay."""
+        self._dirty = True
+        if self.delay is not None and self._schedule():
+            return
+        if not self._depth:
+            self.commit()
+
+    def _schedule(self) -> bool:
+        """Restart the delay of the write, return False when there is no event loop."""
+        try:
+            import uasyncio as asyncio
+            self._changed_at = time.ticks_ms()
+        except (ImportError, AttributeError):  # Not on MicroPython (or the simulation)
+            return False
+        if not self._pending:
+            coroutine = self._commit_later()
+            try:
+                asyncio.create_task(coroutine)
+            except RuntimeError:  # No running event loop
+                coroutine.close()
+                return False
+            self._pending = True
+        return True
+
+    async def _commit_later(self):
+        """Write the changes when there are no more changes for the delay (or when the task is cancelled)."""
+        import uasyncio as asyncio
+        try:
+            delay_ms = int(self.delay * 1000)
+            remaining = delay_ms
+            while remaining > 0:
+                await asyncio.sleep_ms(remaining)
+                remaining = delay_ms - time.ticks_diff(time.ticks_ms(), self._changed_at)
+        finally:
+            self._pending = False
+            self.commit()
+
+
+_configs: Dict[str, Config] = dict()  # filename -> shared config
+
+
+def get_config(filename: str, delay: Optional[float] = None) -> Config:
+    """Get the shared config of the file, the file is loaded on the first call.
+    params:
+        filename  The json file of the config items.
+        delay     See Config (only used by the first call).
+    """
+    config = _configs.get(filename)
+    if config is None:
+        config = _configs[filename] = Config(filename, delay)
+    return config
@@ -0,0 +1,252 @@
+"""Temperature control strategies.
+
+A control strategy calculates the heater output (0..1) from the measured and the target temperature.
+The output is applied to the heater by a time proportioning window (see switch.TimeProportioning),
+e.g. an output of 0.3 and a window of 10s switches the heater on for 3s every 10s.
+"""
+import math
+try:
+    from typing import Dict
+except ImportError:
+    ...
+from config import Config, get_config
+from thermal_model import ThermalModel
+
+
+class Controller():
+    """Base class of a control strategy."""
+    window: float = 0  # Duration of the time proportioning window [s] (0: apply the output immediately)
+
+    def update(self, temperature: float, target: float) -> float:
+        """Calculate the heater output (0..1) for the measured temperature."""
+        raise NotImplementedError
+
+    def feedback(self, output: float):
+        """The output (0..1) that is applied instead of the output of the last update (e.g. the heater is switched off
+        early), so the state of the strategy follows the heater.
+        """
+
+
+class BangBang(Controller):
+    """Switch the heater on below the target and off above the target.
+    The hysteresis band (centered around the target) avoids toggling the heater near the target.
+    """
+
+    def __init__(self, hysteresis: float = 0.0) -> None:
+        self.hysteresis = hysteresis
+        self.output = 0.0
+
+    def update(self, temperature: float, target: float) -> float:
+        if temperature < target - self.hysteresis / 2:
+            self.output = 1.0
+        elif temperature > target + self.hysteresis / 2:
+            self.output = 0.0
+        return self.output
+
+    def feedback(self, output: float):
+        self.output = output
+
+
+class Pid(Controller):
+    """Discrete PID controller.
+
+    The integral is limited to the output range and is not increased while the output is saturated (anti-windup).
+    The derivative is calculated on the measurement, so a change of the target does not cause a kick.
+    """
+
+    def __init__(self, kp: float, ki: float, kd: float, interval: float, window: float = 180.0) -> None:
+        """Constructor.
+        params:
+            kp, ki, kd  Gains [1/°C], [1/(°C.s)] and [s/°C].
+            interval    Duration between two updates. [s]
+            window      Duration of the time proportioning window. [s]
+        """
+        self.kp = kp
+        self.ki = ki
+        self.kd = kd
+        self.interval = interval
+        self.window = window
+        self.integral = 0.0
+        self.last_temperature = None
+        self._integral = 0.0  # The integral before the last update
+        self._output = 0.0  # The output of the last update
+
+    def update(self, temperature: float, target: float) -> float:
+        error = target - temperature
+        if self.last_temperature is None:
+            self.last_temperature = temperature
+        derivative = -self.kd * (temperature - self.last_temperature) / self.interval
+        self.last_temperature = temperature
+        proportional = self.kp * error
+        integral = self.integral + self.ki * error * self.interval
+        output = proportional + integral + derivative
+        # Anti-windup: only integrate when the output is not saturated in the direction of the error
+        self._integral = self.integral
+        if (output < 1.0 or error < 0) and (output > 0.0 or error > 0):
+            self.integral = min(max(integral, 0.0), 1.0)
+        self._output = min(max(proportional + self.integral + derivative, 0.0), 1.0)
+        return self._output
+
+    def feedback(self, output: float):
+        if output < self._output:  # Anti-windup: the integral is not increased while the output is limited
+            self.integral = min(self.integral, self._integral)
+
+
+class RelayAutotune(Controller):
+    """Determine the PID gains with a relay feedback test (Åström–Hägglund), and continue as PID controller.
+
+    The heater is switched as a relay around the target, which results in a controlled oscillation.
+    The amplitude and period of the oscillation determine the ultimate gain and period of the kettle.
+    The gains are calculated with the Tyreus–Luyben rules (less overshoot than Ziegler–Nichols)
+    and are stored in the given config.
+    When the oscillation is not measured within the timeout (e.g. the target changes all the time), the relay continues
+    as bang-bang controller and no gains are stored: the autotune is done again after a restart.
+    """
+
+    def __init__(self, gains: Config, interval: float, window: float = 180.0, hysteresis: float = 0.2,
+                 cycles: int = 3, timeout: float = 3 * 3600) -> None:
+        """Constructor.
+        params:
+            gains       Config to store the PID gains.
+            interval    Duration between two updates. [s]
+            window      Duration of the time proportioning window of the PID controller. [s]
+            hysteresis  Hysteresis band of the relay. [°C]
+            cycles      Number of oscillations to measure.
+            timeout     Longest duration of the autotune, including heating up to the target. [s]
+        """
+        self.gains = gains
+        self.interval = interval
+        self.pid_window = window
+        self.relay = BangBang(hysteresis)
+        self.cycles = cycles
+        self.max_ticks = int(timeout / interval)
+        self.controller = None  # The control strategy after the autotune
+        self.ticks = 0
+        self.switched_off = list()  # Ticks at which the relay switched off (start of an oscillation)
+        self.amplitudes = list()
+        self.minimum = float('inf')
+        self.maximum = float('-inf')
+
+    def update(self, temperature: float, target: float) -> float:
+        if self.controller is not None:
+            return self.controller.update(temperature, target)
+        self.ticks += 1
+        previous = self.relay.output
+        output = self.relay.update(temperature, target)
+        if self.switched_off:
+            self.minimum = min(self.minimum, temperature)
+            self.maximum = max(self.maximum, temperature)
+        if previous and not output:
+            if self.switched_off:
+                self.amplitudes.append((self.maximum - self.minimum) / 2)
+            self.switched_off.append(self.ticks)
+            self.minimum = float('inf')
+            self.maximum = float('-inf')
+            # The first oscillation is skipped, it is affected by the heating up to the target
+            if len(self.switched_off) > self.cycles + 1:
+                self._tune()
+        if self.controller is None and self.ticks >= self.max_ticks:
+            print(f'WARNING: autotune: no oscillation within {self.max_ticks * self.interval:.0f}s, '
+                  'continuing as bang-bang controller')
+            self.controller = self.relay
+        return output
+
+    def feedback(self, output: float):
+        if self.controller is not None:  # The relay is not corrected: it measures the oscillation
+            self.controller.feedback(output)
+
+    def _tune(self):
+        """Calculate and store the PID gains."""
+        cycles = self.switched_off[1:]
+        period = (cycles[-1] - cycles[0]) * self.interval / (len(cycles) - 1)
+        amplitude = sum(self.amplitudes[1:]) / len(self.amplitudes[1:])
+        ultimate_gain = 4 * 0.5 / (math.pi * amplitude)  # Relay output amplitude: 0.5
+        kp = ultimate_gain / 3.2
+        ki = kp / (2.2 * period)
+        kd = kp * period / 6.3
+        print(f'INFO: autotune: Ku={ultimate_gain:.3f}, Tu={period:.0f}s => kp={kp:.4f}, ki={ki:.6f}, kd={kd:.3f}')
+        with self.gains.batch():  # One write of the config
+            self.gains.set('kp', kp)
+            self.gains.set('ki', ki)
+            self.gains.set('kd', kd)
+        self.controller = Pid(kp, ki, kd, self.interval, self.pid_window)
+        self.window = self.pid_window
+
+
+class Coasting(Controller):
+    """Switch the heater off early, when the model of the kettle predicts that the temperature coasts onto the target
+    (with the heat stored in the heater element). The model is fitted with the applied output, the control strategy
+    gets it as feedback. After it is switched off early, the heater stays off until the kettle coasts to the hysteresis
+    below the target: it is not switched on for short pulses near the target.
+    A target above the maximum of the model (boiling) is heated without coasting.
+    """
+
+    def __init__(self, controller: Controller, model: ThermalModel, hysteresis: float = 0.5) -> None:
+        """Constructor.
+        params:
+            controller  The control strategy.
+            model       The model of the kettle (its tick is the interval of the updates).
+            hysteresis  After coasting, the heater stays off until the predicted temperature is this much below the
+                        target. [°C]
+        """
+        self.controller = controller
+        self.model = model
+        self.hysteresis = hysteresis
+        self.coasting = False  # The heater was switched off early
+
+    @property
+    def window(self) -> float:
+        return self.controller.window
+
+    def update(self, temperature: float, target: float) -> float:
+        requested = self.controller.update(temperature, target)
+        output = requested
+        predicted = self.model.predict(temperature)
+        if target >= self.model.maximum or predicted <= target - self.hysteresis:
+            self.coasting = False  # Boiling, or the kettle coasts to below the hysteresis
+        if output and target < self.model.maximum and (self.coasting or predicted >= target):
+            output = 0.0
+            self.coasting = True
+        if output != requested:
+            self.controller.feedback(output)
+        self.model.update(temperature, output)
+        return output
+
+    def feedback(self, output: float):
+        self.controller.feedback(output)
+
+
+def create(settings: Dict[str, str], interval: float) -> Controller:
+    """Create the control strategy from the settings.
+
+    settings:
+        strategy    "bang-bang" (default) or "pid".
+        hysteresis  Hysteresis band of the bang-bang controller. [°C]
+        gains       Config file with the PID gains. If there are no gains (yet), these are determined by autotuning.
+        window      Duration of the time proportioning window of the PID controller. [s]
+                    A shorter window has less ripple, but toggles the heater more often (at most twice per window).
+        autotune    Longest duration of the autotune of the PID controller. [s]
+        model       Settings of the model of the kettle: the heater is switched off early to coast onto the target.
+                    interval       Interval of the samples of the model. [s]
+                    max dead time  The longest dead time of the kettle. [s]
+                    hysteresis     After coasting, the heater stays off until the predicted temperature is this
+                                   much below the target. [°C]
+    """
+    strategy = settings.get('strategy', 'bang-bang')
+    if strategy == 'bang-bang':
+        controller = BangBang(float(settings.get('hysteresis', 0)))
+    elif strategy == 'pid':
+        gains = get_config(settings.get('gains', 'kettle_pid.json'))
+        window = float(settings.get('window', 180))
+        if gains.get('kp') is None:
+            controller = RelayAutotune(gains, interval, window, timeout=float(settings.get('autotune', 3 * 3600)))
+        else:
+            controller = Pid(gains['kp'], gains['ki'], gains['kd'], interval, window)
+    else:
+        raise ValueError(f'Unsupported control strategy: {strategy}')
+    model = settings.get('model')
+    if model is None:
+        return controller
+    return Coasting(controller, ThermalModel(interval, float(model.get('interval', 10)),
+                                             float(model.get('max dead time', 300))),
+                    float(model.get('hysteresis', 0.5)))
@@ -1,50 +1,257 @@
-"""File providing localtime support."""
+"""File providing localtime support.
+
+A Now snapshot of the realtime clock can be updated and formatted without allocating memory:
+    snapshot = Now()
+    timestamp = bytearray(TIMESTAMP_SIZE)
+    format_datetime(snapshot.update(), timestamp)  # b'2024-05-01 13:45:07'
+
+Localtime is a Clock that is synchronized with an (S)NTP server by a background task:
+    localtime = Localtime()
+    asyncio.create_task(localtime.run())
+    localtime.time()  # The local time [s], it does not jump when it is synchronized
+    localtime.monotonic()  # To measure durations [s]
+"""
+import struct
 import time
-import network
-import ntptime
-from machine import RTC, reset
-from config import Config
+try:
+    from typing import Optional, Tuple
+except ImportError:
+    ...
+import socket
+from machine import RTC
+from clock import Clock
+from config import get_config
+
+TIMESTAMP_SIZE = 19  # 'YYYY-MM-DD HH:MM:SS', a buffer of 23 bytes gets the milliseconds as well: '.mmm'
+_rtc = RTC()
+# The time of the start of the day of the last snapshot (mktime() is only needed once per day)
+_day = 0  # year * 10000 + month * 100 + day
+_day_start = 0
+
+
+class Now():
+    """Snapshot of the realtime clock."""
+    __slots__ = ('year', 'mon', 'day', 'dow', 'hour', 'min', 'sec', 'msec')
+
+    def __init__(self):
+        self.update()
+
+    def update(self) -> 'Now':
+        """Take a new snapshot of the realtime clock."""
+        (self.year, self.mon, self.day, self.dow, self.hour, self.min, self.sec, self.msec) = _rtc.datetime()
+        return self
+
+    def get_time(self) -> int:
+        """Convert this time snapshot to a time value. [s]"""
+        global _day, _day_start  # pylint: disable=global-statement
+        day = (self.year * 100 + self.mon) * 100 + self.day
+        if day != _day:
+            _day_start = int(time.mktime((self.year, self.mon, self.day, 0, 0, 0, 0, 0, -1)))
+            _day = day
+        return _day_start + (self.hour * 60 + self.min) * 60 + self.sec
+
+    def get_time_ms(self) -> int:
+        """Convert this time snapshot to a time value in milliseconds (an int: a float can not hold it). [ms]"""
+        return self.get_time() * 1000 + self.msec
+
+
+def _digits(buffer: bytearray, end: int, value: int, count: int):
+    """Write the value as count decimal digits into the buffer, in front of end."""
+    while count:
+        count -= 1
+        end -= 1
+        buffer[end] = 0x30 + value % 10
+        value //= 10
+
+
+def format_datetime(snapshot: Now, buffer: bytearray) -> int:
+    """Write 'YYYY-MM-DD HH:MM:SS' (and '.mmm' if it fits) of the snapshot into the buffer.
+    Return the number of bytes written.
+    """
+    _digits(buffer, 4, snapshot.year, 4)
+    buffer[4] = buffer[7] = 0x2d  # -
+    _digits(buffer, 7, snapshot.mon, 2)
+    _digits(buffer, 10, snapshot.day, 2)
+    buffer[10] = 0x20  # space
+    _digits(buffer, 13, snapshot.hour, 2)
+    buffer[13] = buffer[16] = 0x3a  # :
+    _digits(buffer, 16, snapshot.min, 2)
+    _digits(buffer, 19, snapshot.sec, 2)
+    if len(buffer) < TIMESTAMP_SIZE + 4:
+        return TIMESTAMP_SIZE
+    buffer[19] = 0x2e  # .
+    _digits(buffer, 23, snapshot.msec, 3)
+    return TIMESTAMP_SIZE + 4
 
-system_config = Config('system_config.json')
 
-class Localtime():
-    """Synchronized realtime clock using NTP."""
-    def __init__(self, utc_offset=None):
-        self.utc_offset = utc_offset or system_config.get('utc_offset')
-        self.__synced = None
-        self._sync()
+NTP_DELTA = 2208988800 if time.gmtime(0)[0] == 1970 else 3155673600  # NTP epoch (1900) -> epoch of time.time() [s]
 
-    def _sync(self):
+
+class Localtime(Clock):
+    """Local time synchronized with SNTP.
+    The time is the monotonic clock plus an offset. Every synchronization measures the offset. The drift of the
+    clock is estimated from successive measurements, and a measured error is corrected gradually (slewed):
+    the time runs at most `slew` faster or slower, so durations measured with the time stay accurate.
+    Only the first synchronization (or an error larger than `step`) sets the time at once.
+    """
+
+    def __init__(self, utc_offset=None, server: str = 'pool.ntp.org', port: int = 123, interval: float = 24 * 3600,
+                 timeout: float = 1, retries: int = 3, slew: float = 0.0005, step: float = 60):
+        """Constructor.
+        params:
+            utc_offset  Offset of the local time to UTC (default: system_config.json). [hours]
+            server      The (S)NTP server.
+            port        The UDP port of the server.
+            interval    Time between the synchronizations. [s]
+            timeout     Time to wait for the answer of the server. [s]
+            retries     Number of requests per synchronization.
+            slew        Maximum rate of the correction of an error. [s/s]
+            step        Set the time at once when the error is larger. [s]
+        """
+        super().__init__()
+        self.utc_offset = utc_offset if utc_offset is not None else get_config('system_config.json').get('utc_offset', 0)
+        self.server = server
+        self.port = port
+        self.interval = interval
+        self.timeout = timeout
+        self.retries = retries
+        self.slew = slew
+        self.step = step
+        self._address = None
+        # The offset of the time to the monotonic clock at the reference (monotonic) time [ms], the drift [ms/ms]
+        # and the error that is being corrected [ms]
+        self._reference = self.monotonic_ms()
+        self._offset = int(time.time() * 1000) - self._reference
+        self._drift = 0.0
+        self._error = 0
+        self._measurement: Optional[Tuple[int, int]] = None  # The last measurement: monotonic time, offset [ms]
+        self.synced = False
+        self.syncs = 0  # Number of successful synchronizations
+        self.failures = 0  # Number of failed requests
+
+    def _offset_at(self, monotonic: int) -> float:
+        """Get the offset of the time at the given monotonic time. [ms]"""
+        elapsed = monotonic - self._reference
+        limit = self.slew * elapsed
+        correction = max(-limit, min(limit, self._error))
+        return self._offset + self._drift * elapsed + correction
+
+    def time_ms(self) -> int:
+        """Get the local time. [ms]"""
+        monotonic = self.monotonic_ms()
+        return monotonic + int(self._offset_at(monotonic))
+
+    def time(self) -> int:
+        """Get the local time. [s]"""
+        return self.time_ms() // 1000
+
+    def drift(self) -> float:
+        """Get the estimated drift of the monotonic clock (positive: the clock is slow). [s/s]"""
+        return self._drift
+
+    def _update(self, monotonic: int, offset: int):
+        """Update the time with a measured offset (local time - monotonic time) at the monotonic time. [ms]"""
+        predicted = self._offset_at(monotonic)
+        if not self.synced or abs(offset - predicted) > self.step * 1000:
+            if self.synced:
+                print(f'WARNING: the time is off by {(offset - predicted) / 1000:.1f}s, it is set at once')
+            self._offset = offset
+            self._error = 0
+            self._measurement = None
+            if not self.synced:
+                self._set_rtc(monotonic + offset)
+            self.synced = True
+        else:
+            if self._measurement is not None and monotonic - self._measurement[0] >= 600000:
+                previous_monotonic, previous_offset = self._measurement
+                self._drift = (offset - previous_offset) / (monotonic - previous_monotonic)
+            self._offset = predicted
+            self._error = offset - predicted
+        self._reference = monotonic
+        if self._measurement is None or monotonic - self._measurement[0] >= 600000:  # The drift needs 10 minutes
+            self._measurement = (monotonic, offset)
+
+    @staticmethod
+    def _set_rtc(local_ms: int):
+        """Set the realtime clock (and time.time()) to the local time."""
+        year, month, day, hour, minute, second, weekday = time.localtime(local_ms // 1000)[:7]
+        _rtc.init((year, month, day, weekday, hour, minute, second, 0))
+
+    async def sync(self) -> bool:
+        """Synchronize the time with the server (using `retries` requests), return True on success."""
+        for attempt in range(self.retries):
+            try:
+                measurement = await self._request()
+            except OSError as ex:
+                print(f'WARNING: SNTP request to {self.server} failed: {ex}')
+                measurement = None
+            if measurement is not None:
+                self._update(*measurement)
+                self.syncs += 1
+                return True
+            self.failures += 1
+            await self.sleep(attempt + 1)  # Back off before the next request
+        return False
+
+    async def _request(self) -> Optional[Tuple[int, int]]:
+        """Do a SNTP request, return the monotonic time and the measured offset of the local time [ms]
+        (None: no valid answer within the timeout).
+        """
+        if self._address is None:
+            self._address = socket.getaddrinfo(self.server, self.port)[0][-1]
+        request = bytearray(48)
+        request[0] = 0x1b  # version 3, mode 3 (client)
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         try:
-            ntptime.settime()   # Synchronize the system time using NTP
-        except Exception as ex:
-            print('ERROR: ntp.settime() failed. err:', ex)
-            if network.WLAN().isconnected():
-                reset()
-        # year, month, day, day_of_week, hour, minute, second, millisecond
-        datetime_ymd_w_hms_m = list(RTC().datetime())
-        datetime_ymd_w_hms_m[4] += self.utc_offset
-        RTC().init(datetime_ymd_w_hms_m)
-        self.__synced = datetime_ymd_w_hms_m[2]
-        del datetime_ymd_w_hms_m
-
-    def now(self):
-        """Retrieve a snapshot of the current time in milliseconds accurate."""
-        class Now():
-            """Class representing a snapshot of the current time."""
-            def __init__(self):
-                (self.year, self.mon, self.day, self.dow,
-                 self.hour, self.min, self.sec, self.msec) = RTC().datetime()
-                self._time = None
-            def get_time(self) -> float:
-                """Convert this time snapshot to a time float value."""
-                if self._time is None:
-                    self._time =  time.mktime([self.year, self.mon, self.day,
-                                               self.hour, self.min, self.sec, 0, 0])
-                    # self._time += self.msec / 1000    # float overflow when adding msec :(
-                return self._time
-        snapshot = Now()
-        if snapshot.day != self.__synced and snapshot.hour == 4:  # sync every day @ 4am
-            self._sync()
-            snapshot = Now()
-        return snapshot
+            sock.setblocking(False)
+            start = self.monotonic_ms()
+            struct.pack_into('!Q', request, 40, start)  # Transmit timestamp: returned as originate timestamp
+            sock.sendto(request, self._address)
+            while True:
+                try:
+                    answer = sock.recv(48)
+                except OSError:  # No answer yet
+                    if self.monotonic_ms() - start > self.timeout * 1000:
+                        return None
+                    await self.sleep_ms(10)
+                    continue
+                end = self.monotonic_ms()
+                if len(answer) == 48 and answer[0] & 7 == 4 and answer[1] and answer[24:32] == request[40:48]:
+                    break
+        finally:
+            sock.close()
+        received = self._ntp_ms(answer, 32)
+        transmitted = self._ntp_ms(answer, 40)
+        # The offset of the (UTC) time of the server to the monotonic clock: the round trip (except the time in the
+        # server) is assumed to be symmetric
+        return end, self.utc_offset * 3600000 + ((received - start) + (transmitted - end)) // 2
+
+    @staticmethod
+    def _ntp_ms(answer: bytes, offset: int) -> int:
+        """Get a NTP timestamp of the answer, in ms since the epoch of time.time()."""
+        seconds, fraction = struct.unpack_from('!II', answer, offset)
+        return (seconds - NTP_DELTA) * 1000 + (fraction * 1000 >> 32)
+
+    async def run(self):
+        """Synchronize the time every interval. When the server does not answer, retry after a minute,
+        and double the time until the next retry (up to the interval).
+        """
+        retry = 60
+        while True:
+            if await self.sync():
+                delay = self.interval
+                retry = 60
+            else:
+                delay = min(retry, self.interval)
+                retry *= 2
+            while delay > 0:  # Wake up at least every hour, to keep the monotonic clock up to date
+                await self.sleep(min(delay, 3600))
+                self.monotonic_ms()
+                delay -= 3600
+
+    def now(self, snapshot: Optional[Now] = None) -> Now:
+        """Retrieve a snapshot of the realtime clock in milliseconds accurate.
+        params:
+            snapshot  The snapshot to update (None: a new snapshot).
+        """
+        return Now() if snapshot is None else snapshot.update()
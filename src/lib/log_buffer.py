@@ -0,0 +1,234 @@
+"""Log of structured records in a preallocated ring buffer: the messages are formatted when the log is read.
+
+A record contains: size, ticks [ms], level, logger id, format id and the packed arguments.
+The format strings and the logger names are stored once, a record refers to them by their index. The tables are
+limited (MAX_FORMATS, MAX_LOGGERS): when a table is full, a record of a new format string or logger name stores it
+inline, as the first str arguments (the logger name before the format string).
+The arguments are packed with a type tag: an int (32 bits) or a float takes 5 bytes (an int of 64 bits 9 bytes),
+a str takes its length + 2 (longer strings are truncated), None and bools take 1 or 2 bytes.
+Other arguments are stored as str.
+When the buffer is full, the oldest records are overwritten (or new records are dropped, see `overwrite`).
+
+usage:
+    buffer = LogBuffer(2048)
+    buffer.append(logging.INFO, 'kettle', 'temperature: %.1f', (65.3,))
+    for sequence, ticks, level, name, message in buffer.read(after=cursor):  # Every reader has its own cursor
+        cursor = sequence
+"""
+try:
+    from typing import Dict, Iterator, List, Tuple
+except ImportError:
+    ...
+import struct
+import time
+
+HEADER = '<BIBBH'  # record size, ticks [ms], level, logger id, format id
+HEADER_SIZE = struct.calcsize(HEADER)
+MAX_RECORD = 255
+MAX_STRING = 120
+MAX_FORMATS = 128  # Number of format strings in the table
+MAX_LOGGERS = 32  # Number of logger names in the table
+INLINE_FORMAT = 0xffff  # Format id of a record that stores its format string inline
+INLINE_LOGGER = 0xff  # Logger id of a record that stores its logger name inline
+LEVELS = {50: 'CRIT', 40: 'ERROR', 30: 'WARN', 20: 'INFO', 10: 'DEBUG', 0: '-'}
+
+
+def _size(arg) -> int:
+    """Get the packed size of the argument."""
+    if arg is None or isinstance(arg, bool):
+        return 1 if arg is None else 2
+    if isinstance(arg, float) or (isinstance(arg, int) and -0x80000000 <= arg <= 0x7fffffff):
+        return 5
+    if isinstance(arg, int) and -0x8000000000000000 <= arg <= 0x7fffffffffffffff:
+        return 9
+    return 2 + min(len(arg if isinstance(arg, str) else str(arg)), MAX_STRING)
+
+
+class LogBuffer():
+    """Ring buffer of log records."""
+
+    def __init__(self, size: int = 2048, overwrite: bool = True) -> None:
+        """Constructor.
+        params:
+            size       Size of the buffer. [bytes]
+            overwrite  Overwrite the oldest records when the buffer is full (else: drop the new records).
+        """
+        self._buffer = bytearray(size)
+        self._view = memoryview(self._buffer)
+        self.overwrite = overwrite
+        self._head = 0  # Position of the next record
+        self._tail = 0  # Position of the oldest record
+        self.count = 0  # Number of records in the buffer
+        self.sequence = 0  # Number of records written (the sequence number of the next record)
+        self.dropped = 0  # Number of records dropped or overwritten
+        self._format_ids: Dict[str, int] = dict()
+        self._formats: List[str] = list()
+        self._logger_ids: Dict[str, int] = dict()
+        self._loggers: List[str] = list()
+
+    def append(self, level: int, logger: str, fmt: str, args: tuple = ()):
+        """Store a record (only a new format string, a new logger name or a str argument allocates memory)."""
+        size = HEADER_SIZE
+        logger_id = self._logger_ids.get(logger)
+        if logger_id is None:
+            if len(self._loggers) < MAX_LOGGERS:
+                logger_id = self._logger_ids[logger] = len(self._loggers)
+                self._loggers.append(logger)
+            else:
+                logger_id = INLINE_LOGGER
+                size += _size(logger)
+        format_id = self._format_ids.get(fmt)
+        if format_id is None:
+            if len(self._formats) < MAX_FORMATS:
+                format_id = self._format_ids[fmt] = len(self._formats)
+                self._formats.append(fmt)
+            else:
+                format_id = INLINE_FORMAT
+                size += _size(fmt)
+        for arg in args:
+            size += _size(arg)
+        if size > MAX_RECORD:
+            self.dropped += 1
+            return
+        position = self._reserve(size)
+        if position is None:
+            self.dropped += 1
+            return
+        struct.pack_into(HEADER, self._buffer, position, size, time.ticks_ms(), level, logger_id, format_id)
+        position += HEADER_SIZE
+        if logger_id == INLINE_LOGGER:
+            position = self._pack(position, logger)
+        if format_id == INLINE_FORMAT:
+            position = self._pack(position, fmt)
+        for arg in args:
+            position = self._pack(position, arg)
+        self.sequence += 1
+
+    def _pack(self, position: int, arg) -> int:
+        """Pack the argument at the position, return the position after it."""
+        buffer = self._buffer
+        if arg is None:
+            buffer[position] = 0x6e  # n
+            return position + 1
+        if isinstance(arg, bool):
+            buffer[position] = 0x62  # b
+            buffer[position + 1] = 1 if arg else 0
+            return position + 2
+        if isinstance(arg, float):
+            buffer[position] = 0x66  # f
+            struct.pack_into('<f', buffer, position + 1, arg)
+            return position + 5
+        if isinstance(arg, int) and -0x80000000 <= arg <= 0x7fffffff:
+            buffer[position] = 0x69  # i
+            struct.pack_into('<i', buffer, position + 1, arg)
+            return position + 5
+        if isinstance(arg, int) and -0x8000000000000000 <= arg <= 0x7fffffffffffffff:
+            buffer[position] = 0x71  # q
+            struct.pack_into('<q', buffer, position + 1, arg)
+            return position + 9
+        text = arg if isinstance(arg, str) else str(arg)
+        length = min(len(text), MAX_STRING)
+        data = text.encode()
+        if len(data) != length:  # Truncated, or not ASCII: the length in characters was reserved
+            data = data[:length]
+            length = len(data)
+        buffer[position] = 0x73  # s
+        buffer[position + 1] = length
+        self._view[position + 2:position + 2 + length] = data
+        return position + 2 + length
+
+    def _reserve(self, size: int):
+        """Get the position for a record of the given size (the overwritten records are removed)."""
+        end = len(self._buffer)
+        if size > end:
+            return None
+        if self._head + size > end:
+            if not self.overwrite:
+                return None
+            while self.count and self._tail >= self._head:  # The records at the end of the buffer
+                self._remove()
+            if self._head < end:
+                self._buffer[self._head] = 0  # End of the records: continue at the start of the buffer
+            self._head = 0
+        while self.count and self._head <= self._tail < self._head + size:
+            if not self.overwrite:
+                return None
+            self._remove()
+        position = self._head
+        if not self.count:
+            self._tail = position
+        self._head += size
+        self.count += 1
+        return position
+
+    def _remove(self):
+        """Remove the oldest record."""
+        self._tail += self._buffer[self._tail]
+        self.count -= 1
+        self.dropped += 1
+        if self._tail >= len(self._buffer) or (self.count and self._buffer[self._tail] == 0):
+            self._tail = 0
+
+    def _unpack(self, position: int) -> Tuple[int, int, str, str]:
+        """Get the ticks, level, logger name and message of the record at the position."""
+        size, ticks, level, logger_id, format_id = struct.unpack_from(HEADER, self._buffer, position)
+        end = position + size
+        position += HEADER_SIZE
+        args = list()
+        while position < end:
+            tag = self._buffer[position]
+            if tag == 0x6e:
+                args.append(None)
+                position += 1
+            elif tag == 0x62:
+                args.append(bool(self._buffer[position + 1]))
+                position += 2
+            elif tag in (0x66, 0x69):
+                args.append(struct.unpack_from('<f' if tag == 0x66 else '<i', self._buffer, position + 1)[0])
+                position += 5
+            elif tag == 0x71:
+                args.append(struct.unpack_from('<q', self._buffer, position + 1)[0])
+                position += 9
+            else:
+                length = self._buffer[position + 1]
+                args.append(bytes(self._view[position + 2:position + 2 + length]).decode())
+                position += 2 + length
+        name = args.pop(0) if logger_id == INLINE_LOGGER else self._loggers[logger_id]
+        fmt = args.pop(0) if format_id == INLINE_FORMAT else self._formats[format_id]
+        try:
+            message = fmt % tuple(args) if args else fmt
+        except (TypeError, ValueError):
+            message = f'{fmt} {args}'
+        return ticks, level, name, message
+
+    def read(self, after: int = -1) -> Iterator[Tuple[int, int, int, str, str]]:
+        """Get the (sequence number, ticks, level, logger name, message) of the records after the given sequence
+        number, oldest first. The records are formatted one by one, records that are overwritten meanwhile are skipped.
+        """
+        sequence = max(after + 1, self.sequence - self.count)
+        position = None
+        while sequence < self.sequence:
+            oldest = self.sequence - self.count
+            if position is None or sequence < oldest:  # (Re)start at the oldest record (that is needed)
+                position = self._tail
+                skip = max(sequence, oldest) - oldest
+                sequence = oldest
+                for _ in range(skip):
+                    position = self._start(position)
+                    position += self._buffer[position]
+                    sequence += 1
+            position = self._start(position)  # (The end of the records may have been marked meanwhile)
+            yield (sequence,) + self._unpack(position)
+            position += self._buffer[position]
+            sequence += 1
+
+    def _start(self, position: int) -> int:
+        """Get the position of the record at the position: the start of the buffer after the end of the records."""
+        if position >= len(self._buffer) or self._buffer[position] == 0:
+            return 0
+        return position
+
+    def lines(self, after: int = -1) -> Iterator[str]:
+        """Get the records after the given sequence number as text: 'ticks LEVEL:logger:message'."""
+        for _, ticks, level, name, message in self.read(after):
+            yield f'{ticks} {LEVELS.get(level, level)}:{name}:{message}'
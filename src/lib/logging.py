@@ -1,4 +1,7 @@
 # Copied from https://github.com/micropython/micropython-lib/blob/master/logging/logging.py
+# Changed: the level of the logger is checked before anything is done, every logger has its own handlers, and with
+# basicConfig(buffer=LogBuffer()) the records are stored unformatted (the message is formatted when it is read), the
+# records of level WARNING and above are printed as well. At most MAX_LOGGERS loggers are kept by getLogger().
 import sys
 
 CRITICAL = 50
@@ -17,6 +20,7 @@ _level_dict = {
 }
 
 _stream = sys.stderr
+_buffer = None
 
 class LogRecord:
     def __init__(self):
@@ -34,12 +38,10 @@ class Handler:
 
 class Logger:
 
-    level = NOTSET
-    handlers = []
-    record = LogRecord()
-
     def __init__(self, name):
         self.name = name
+        self.level = NOTSET
+        self.handlers = []
 
     def _level_str(self, level):
         l = _level_dict.get(level)
@@ -55,37 +57,51 @@ class Logger:
 
     def log(self, level, msg, *args):
         if self.isEnabledFor(level):
-            levelname = self._level_str(level)
-            if args:
-                msg = msg % args
-            if self.handlers:
-                d = self.record.__dict__
-                d["levelname"] = levelname
-                d["levelno"] = level
-                d["message"] = msg
-                d["name"] = self.name
-                for h in self.handlers:
-                    h.emit(self.record)
-            else:
-                print(levelname, ":", self.name, ":", msg, sep="", file=_stream)
+            self._log(level, msg, args)
+
+    def _log(self, level, msg, args):
+        if _buffer is not None:
+            _buffer.append(level, self.name, msg, args)
+            if not self.handlers and level < WARNING:  # Warnings and errors are printed (to the serial port) as well
+                return
+        levelname = self._level_str(level)
+        if args:
+            msg = msg % args
+        if self.handlers:
+            record = LogRecord()  # Every record is new: a handler may keep it
+            d = record.__dict__
+            d["levelname"] = levelname
+            d["levelno"] = level
+            d["message"] = msg
+            d["name"] = self.name
+            for h in self.handlers:
+                h.emit(record)
+        else:
+            print(levelname, ":", self.name, ":", msg, sep="", file=_stream)
 
     def debug(self, msg, *args):
-        self.log(DEBUG, msg, *args)
+        if self.isEnabledFor(DEBUG):
+            self._log(DEBUG, msg, args)
 
     def info(self, msg, *args):
-        self.log(INFO, msg, *args)
+        if self.isEnabledFor(INFO):
+            self._log(INFO, msg, args)
 
     def warning(self, msg, *args):
-        self.log(WARNING, msg, *args)
+        if self.isEnabledFor(WARNING):
+            self._log(WARNING, msg, args)
 
     def error(self, msg, *args):
-        self.log(ERROR, msg, *args)
+        if self.isEnabledFor(ERROR):
+            self._log(ERROR, msg, args)
 
     def critical(self, msg, *args):
-        self.log(CRITICAL, msg, *args)
+        if self.isEnabledFor(CRITICAL):
+            self._log(CRITICAL, msg, args)
 
     def exc(self, e, msg, *args):
-        self.log(ERROR, msg, *args)
+        if self.isEnabledFor(ERROR):
+            self._log(ERROR, msg, args)
         #sys.print_exception(e, _stream)
 
     def exception(self, msg, *args):
@@ -96,16 +112,19 @@ class Logger:
 
 _level = INFO
 _loggers = {}
+MAX_LOGGERS = 32
 
 def getLogger(name="root"):
     """Return a logger with the specified name, creating it if necessary.
 
-    If no name is specified, return the root logger.
+    If no name is specified, return the root logger. When MAX_LOGGERS loggers are kept, a new logger is not kept: the
+    caller should keep it (e.g. a module that gets its logger at import).
     """
     if name in _loggers:
         return _loggers[name]
     logger = Logger(name)
-    _loggers[name] = logger
+    if len(_loggers) < MAX_LOGGERS:
+        _loggers[name] = logger
     return logger
 
 def error(msg, *args):
@@ -120,11 +139,18 @@ def info(msg, *args):
 def debug(msg, *args):
     getLogger().debug(msg, *args)
 
-def basicConfig(level=INFO, filename=None, stream=None, format=None):
-    global _level, _stream
+def basicConfig(level=INFO, filename=None, stream=None, format=None, buffer=None):
+    """Configure the logging.
+
+    buffer: a LogBuffer that stores the records of all loggers (only the records of level WARNING and above are
+            printed as well).
+    """
+    global _level, _stream, _buffer
     _level = level
     if stream:
         _stream = stream
+    if buffer is not None:
+        _buffer = buffer
     if filename is not None:
         print("logging.basicConfig: filename arg is not supported")
     if format is not None:
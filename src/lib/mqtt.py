@@ -10,8 +10,10 @@ usage:
         asyncio.new_event_loop()
 """
 import json
+import math
+import time
 try:
-    from typing import Callable, Dict, Optional  # to please lint...
+    from typing import Callable, Dict, Optional, Tuple  # to please lint...
 except ImportError:
     ...
 import machine
@@ -19,88 +21,196 @@ import ubinascii
 import uasyncio as asyncio
 
 import mqtt_as.mqtt_as as mqtt_as
+from config import Config
+from publish_queue import LAZY, PublishQueue
+from ring_log import RingLog
+from router import Router, scalar
 
 
 class MQTTClient:
-    """MQTT client to publish sensor measurements to a MQTT server."""
+    """MQTT client to publish sensor measurements to a MQTT server.
 
-    def __init__(self, server_ip: str, base_topic: str, ssid: str, wifi_pw: str) -> None:
+    The Home Assistant discovery messages are only published for new or changed devices: the discovery message of a
+    device is serialized once (add_device), and the hash of its topic and payload is stored in the discovery cache.
+    The announcements are published in between the measurements, the cache is written once after a burst of them.
+    All devices are announced again when Home Assistant comes online (homeassistant/status).
+
+    A device with a callback gets a command topic: <base_topic>/<sensor_id>/set. The payload is a scalar
+    (e.g. "ON", "65.5" or empty), which is passed to the callback. The (legacy) <base_topic>/config topic accepts
+    {"<sensor_id>": <argument>, ...} or "<sensor_id>". Every command is handled in a new task.
+    """
+    MIN_BULK_CYCLE = 5.0  # A shorter cycle sends more bytes than a topic per sensor: the time and the keys [s]
+
+    def __init__(self, server_ip: str, base_topic: str, ssid: str, wifi_pw: str, rate: float = 5.0, burst: int = 20,
+                 offline_log: Optional[RingLog] = None, bulk_cycle: float = 0,
+                 discovery_cache: str = 'discovery.json') -> None:
+        """Constructor.
+        params:
+            rate         Maximum sustained number of published messages. [1/s]
+            burst        Maximum number of messages published at once.
+            offline_log  Log to store the measurements while the connection is down. The logged measurements are
+                         published to <base_topic>/history after reconnecting.
+            bulk_cycle   0: publish every sensor to its own topic.
+                         Otherwise, publish all new values of a cycle in a single json document to <base_topic>/state,
+                         e.g. {"time":1234,"kettle_temperature":65.3,"kettle_switch":"ON"}. Only the values which
+                         changed (beyond their deadband) are in the document. A value which is not finite is null.
+                         The minimum is MIN_BULK_CYCLE. [s]
+            discovery_cache  File with the hashes of the announced devices.
+        """
         mqtt_as.config['server'] = server_ip
         mqtt_as.config['ssid'] = ssid
         mqtt_as.config['wifi_pw'] = wifi_pw
         mqtt_as.config['subs_cb'] = self.callback
         mqtt_as.config['connect_coro'] = self.conn_han
         self.base_topic = base_topic
+        self.state_topic = f'{base_topic}/state'
+        if 0 < bulk_cycle < self.MIN_BULK_CYCLE:
+            print(f'WARNING: MQTT: bulk cycle {bulk_cycle}s is increased to {self.MIN_BULK_CYCLE}s')
+            bulk_cycle = self.MIN_BULK_CYCLE
+        self.bulk_cycle = bulk_cycle
         self.unique_id = ubinascii.hexlify(machine.unique_id()).decode('utf-8')
 
         mqtt_as.MQTTClient.DEBUG = True  # Optional: print diagnostic messages
         self.client: mqtt_as.MQTTClient = mqtt_as.MQTTClient(mqtt_as.config)
-        self._data_available = asyncio.Event()  # Triggered by put, tested by get
-        self.topics: Dict[str, Optional[Dict]] = dict()  # sensor name -> state_topic to publish
-        self.callbacks: Dict[str, Callable[..., None]] = dict()
+        self.queue = PublishQueue(rate, burst)
+        # sensor name -> (device_class, unit, has a command topic)
+        self.devices: Dict[str, Optional[Tuple[str, Optional[str], bool]]] = dict()
+        self.announced = Config(discovery_cache, delay=2)  # sensor name -> hash of the announced device
+        self._discovery: Dict[str, Tuple[str, bytes, int]] = dict()  # sensor name -> (topic, payload, hash)
+        self._announcing: Dict[str, Tuple[str, int]] = dict()  # discovery topic -> (sensor name, hash)
+        self._keys: Dict[str, str] = dict()  # sensor name -> state topic (or the key in the bulk state)
+        self.callbacks: Dict[str, Callable[..., None]] = dict()  # sensor id -> callback
+        self.router = Router()
+        self.router.add(f'{base_topic}/config', self._config_command)
+        self.router.add('homeassistant/status', self._home_assistant_status)
+        self.offline_log = offline_log
+        self._connected = asyncio.Event()  # Set by conn_han, to drain the offline log
 
     def callback(self, topic, msg, retained):
-        """Handle messages received from subscribed topics."""
-        def call(function, *args):
-            callback = self.callbacks.get(function)
-            if callback:
-                try:
-                    callback(*args)
-                except Exception as ex:
-                    print(f'ERROR: MQTT({topic}, {msg}, {retained}): {ex}')
-            else:
-                print(f'WARNING: MQTT: {function} not in {self.callbacks.keys()}')
+        """Handle messages received from subscribed topics: the handler of the topic runs in a new task,
+        so a slow handler does not block receiving messages.
+        """
+        topic = topic.decode()
+        handler = self.router.get(topic)
+        if handler is None:
+            print(f'WARNING: MQTT: no handler for "{topic}"')
+            return
+        asyncio.create_task(self._handle(handler, topic, msg))
+
+    @staticmethod
+    async def _call(function: Callable, *args):
+        """Call the function, and await the result of a coroutine function."""
+        result = function(*args)
+        if hasattr(result, 'send'):
+            await result
+
+    async def _handle(self, handler: Callable, topic: str, msg: bytes):
+        try:
+            await self._call(handler, msg)
+        except Exception as ex:
+            print(f'ERROR: MQTT({topic}, {msg}): {ex}')
+
+    async def _config_command(self, msg: bytes):
+        """Handle the commands on the config topic: {"<sensor_id>": <argument>, ...} or "<sensor_id>"."""
         try:
-            msg = json.loads(msg)
+            commands = json.loads(msg)
         except ValueError:
-            call(msg.decode())
-        else:
-            for function, args in msg.items():
-                call(function, args)
+            commands = {msg.decode(): None}
+        for function, args in commands.items():
+            callback = self.callbacks.get(function)
+            if callback is None:
+                print(f'WARNING: MQTT: unknown command "{function}"')
+            elif args is None:
+                await self._call(callback)
+            else:
+                await self._call(callback, args)
+
+    def _home_assistant_status(self, msg: bytes):
+        if msg == b'online':  # Home Assistant restarted, it might have lost the discovery messages
+            for sensor_name in self._discovery:
+                self._announce(sensor_name)
 
     async def conn_han(self, client: mqtt_as.MQTTClient):
-        """Subscribe to config change requests."""
-        await client.subscribe(f'{self.base_topic}/config', 1)
+        """Subscribe to the command topics, and the status of Home Assistant."""
+        for topic in self.router.topics:
+            await client.subscribe(topic, 1)
+        self._connected.set()
+
+    async def _drain(self):
+        """Publish the measurements of the offline log after every (re)connect."""
+        async def publish(payload: str):
+            await self.client.publish(f'{self.base_topic}/history', payload, qos=1)
+        while True:
+            await self._connected.wait()
+            self._connected.clear()
+            await self.offline_log.drain(publish)
 
     async def run(self):
         """Run the client.
         Publish measurements and sensor configuration.
         """
-        await self.client.connect()
+        drain = asyncio.create_task(self._drain()) if self.offline_log is not None else None
+        try:
+            await self.client.connect()
 
-        # At start, publish all configurations before publishing the values
-        for sensor in self.topics:
-            message = self.topics[sensor]
-            if sensor.endswith('_home') and message is not None:
-                self.topics[sensor] = None
+            bulk_ticks = time.ticks_ms()  # Time to publish the next state document (bulk cycle)
+            while True:
+                wait_ms = time.ticks_diff(bulk_ticks, time.ticks_ms()) if self.bulk_cycle else 0
+                if wait_ms > 0:  # Collect the new values of the cycle, publish the other messages meanwhile
+                    try:
+                        message = await asyncio.wait_for_ms(self.queue.get(skip=self.state_topic), wait_ms)
+                    except asyncio.TimeoutError:
+                        continue
+                else:
+                    message = await self.queue.get()
+                bulk = self.bulk_cycle and message['topic'] == self.state_topic
+                if bulk:
+                    fields = [message['msg']] + [other['msg'] for other in self.queue.take(self.state_topic)]
+                    message = dict(topic=self.state_topic, msg='{"time":%d,%s}' % (time.time(), ','.join(fields)))
                 print(f'MQTT.publish({message})')
+                # If WiFi is down the following will pause for the duration.
                 await self.client.publish(**message)
-        while True:
-            # If WiFi is down the following will pause for the duration.
-            await self._data_available.wait()
-            for sensor in self.topics:
-                message = self.topics[sensor]
-                if message is not None:
-                    self.topics[sensor] = None
-                    print(f'MQTT.publish({message})')
-                    await self.client.publish(**message)
+                if message['topic'] in self._announcing:
+                    sensor_name, device_hash = self._announcing.pop(message['topic'])
+                    self.announced.set(sensor_name, device_hash)
+                if bulk:
+                    bulk_ticks = time.ticks_add(time.ticks_ms(), int(self.bulk_cycle * 1000))
+        finally:
+            if drain is not None:
+                drain.cancel()
 
     def add_device(self, sensor_name: str, device_class: str,
                    unit: Optional[str] = None, callback: Optional[Callable[..., None]] = None):
-        """Add a new sensor."""
-        assert self.topics.get(
-            sensor_name + '_home') is None, f'{sensor_name} is already present. Sensor names in Home Assistant should be unique!'
+        """Add a new sensor.
+        It is announced to Home Assistant when it was not announced before, or when it changed.
+        """
+        assert self.devices.get(
+            sensor_name) is None, f'{sensor_name} is already present. Sensor names in Home Assistant should be unique!'
         sensor_id = sensor_name.replace(' ', '_')
         if callback is not None:
             self.callbacks[sensor_id] = callback
+            self.router.add(f'{self.base_topic}/{sensor_id}/set', lambda msg: callback(*scalar(msg)))
+        self.devices[sensor_name] = (device_class, unit, callback is not None)
+        topic, payload = self._discovery_message(sensor_name)
+        self._discovery[sensor_name] = (topic, payload, ubinascii.crc32(payload, ubinascii.crc32(topic.encode())))
+        if self.announced.get(sensor_name) != self._discovery[sensor_name][2]:
+            self._announce(sensor_name)
+
+    def _discovery_message(self, sensor_name: str) -> Tuple[str, bytes]:
+        """Get the topic and the payload of the discovery message of the device."""
+        device_class, unit, command = self.devices[sensor_name]
+        sensor_id = sensor_name.replace(' ', '_')
         state_topic = f'{self.base_topic}/{sensor_id}'
         msg_info = dict(name=f'{sensor_name}',
                         unique_id=f'{self.unique_id}_{sensor_id}',
                         state_topic=state_topic,
-                        #value_template=f'{{ value_json }}',
                         device=dict(name=f'{self.base_topic}',
                                     identifiers=[f'{self.unique_id}'])
                         )
+        if self.bulk_cycle:
+            # Not every state document contains all sensors: keep the state when the sensor is not present
+            msg_info['state_topic'] = self.state_topic
+            msg_info['value_template'] = f'{{{{ value_json.{sensor_id} | default(this.state) }}}}'
         if unit is not None:
             msg_info['unit_of_measurement'] = unit
 
@@ -110,29 +220,44 @@ class MQTTClient:
         elif device_class in ['outlet']:
             msg_info['payload_off'] = 'OFF'
             msg_info['payload_on'] = 'ON'
+            if command:
+                msg_info['command_topic'] = f'{state_topic}/set'
             topic = f'homeassistant/switch/{self.unique_id}/{sensor_id}/config'
         else:
             msg_info['device_class'] = device_class
             topic = f'homeassistant/device_automation/{self.unique_id}/{sensor_id}/config'
+        return topic, (json.dumps(msg_info) + ' ').encode()
 
-        self.topics[sensor_name + '_home'] = dict(topic=topic,
-                                                  msg=json.dumps(msg_info) + ' ',
-                                                  retain=True)
-        self._data_available.set()  # Schedule waiting tasks
-        self._data_available.clear()
+    def _announce(self, sensor_name: str):
+        """Queue the (serialized) discovery message of the device."""
+        topic, payload, device_hash = self._discovery[sensor_name]
+        self._announcing[topic] = (sensor_name, device_hash)
+        self.queue.put(sensor_name + '_home', topic, payload, retain=True, priority=LAZY, force=True)
+
+    def set_deadband(self, sensor_name: str, change: float, interval: float):
+        """Publish a new value of the sensor only when it changed at least `change`, or after `interval` s."""
+        self.queue.set_deadband(sensor_name, change, interval)
 
     def publish(self, **measurements) -> None:
         """Publish data of previously configured devices.
         Note: devices should have been registered using add_device() to be visible in Home Assistant.
         """
         for sensor_name, value in measurements.items():
-            if (sensor_name + '_home') not in self.topics:
-                print(f'sensor "{sensor_name}" is not known in HomeAssistant')
-                self.topics[sensor_name + '_home'] = None  # Only log once
-            sensor_id = sensor_name.replace(' ', '_')
-            state_topic = f'{self.base_topic}/{sensor_id}'
-
-            self.topics[sensor_name] = dict(topic=state_topic,
-                                            msg=str(value))
-            self._data_available.set()  # Schedule waiting tasks
-            self._data_available.clear()
+            key = self._keys.get(sensor_name)
+            if key is None:
+                if sensor_name not in self.devices:
+                    print(f'sensor "{sensor_name}" is not known in HomeAssistant')
+                    self.devices[sensor_name] = None  # Only log once
+                sensor_id = sensor_name.replace(' ', '_')
+                key = f'"{sensor_id}":' if self.bulk_cycle else f'{self.base_topic}/{sensor_id}'
+                self._keys[sensor_name] = key
+            if self.bulk_cycle:
+                if isinstance(value, float) and not math.isfinite(value):  # NaN and Infinity are not valid json
+                    self.queue.put(sensor_name, self.state_topic, key + 'null')
+                else:
+                    self.queue.put(sensor_name, self.state_topic, key + json.dumps(value), value=value)
+            else:
+                self.queue.put(sensor_name, key, str(value), value=value)
+            if (self.offline_log is not None and isinstance(value, (int, float)) and
+                    not self.client.isconnected()):
+                self.offline_log.append(sensor_name, value)
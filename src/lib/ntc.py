@@ -0,0 +1,93 @@
+"""Convert the measurement of a voltage divider with a NTC to a temperature.
+
+The voltage divider is measured as a raw ADC value and a raw reference value (the supply voltage of the divider).
+The temperature only depends on the ratio raw / ref_raw, so a lookup table indexed by that ratio is independent
+of the ADC resolution and the actual reference voltage.
+"""
+import math
+import struct
+from array import array
+try:
+    from typing import Callable, Optional
+except ImportError:
+    ...
+
+ZERO_CELSIUS = 273.15  # [K]
+T25 = 25 + ZERO_CELSIUS  # [K]
+INVALID = -ZERO_CELSIUS  # Returned when the measurement can not be converted
+
+_HEADER = '<fffH'  # r_ref, r25, b_value, nr_of_knots
+
+
+def beta_temperature(raw, ref_raw, r_ref: float, r25: float, b_value: float) -> float:
+    """Calculate the temperature [°C] using the Beta equation of the NTC."""
+    # (v_ref - ADC) / R_ref = ADC / NTC => NTC = ADC * Rf / (v_ref - ADC)
+    try:
+        r_ntc = raw * r_ref / (ref_raw - raw)
+        return 1.0 / ((math.log(r_ntc / r25)) / b_value + (1.0 / T25)) - ZERO_CELSIUS
+    except (ValueError, ZeroDivisionError):
+        return INVALID
+
+
+class Table():
+    """Piecewise linear lookup table to convert a NTC measurement to a temperature.
+
+    The knots are equally spaced over the ratio raw / ref_raw, so a conversion is one index step and one interpolation.
+    The table can be persisted to flash. It is rebuilt when the stored parameters do not match the given parameters.
+    The correction is not stored: call rebuild() when it is changed.
+    """
+
+    def __init__(self, r_ref: float, r25: float, b_value: float, nr_of_knots: int = 512,
+                 correction: Optional[Callable[[float], float]] = None, filename: Optional[str] = None) -> None:
+        """Constructor.
+        @param nr_of_knots  Number of knots in the table (256..1024 is a sensible range).
+        @param correction   Optional function to correct the calculated temperature (e.g. a calibration).
+        @param filename     Optional file to persist the table.
+        """
+        self.parameters = struct.pack(_HEADER, r_ref, r25, b_value, nr_of_knots)
+        self.scale = nr_of_knots - 1
+        self.knots = array('f', bytes(4 * nr_of_knots))
+        self._coefficients = (r_ref, r25, b_value)
+        self.correction = correction
+        self.filename = filename
+        if filename is None or not self._load(filename):
+            self.rebuild()
+
+    def rebuild(self):
+        """Calculate the knots (e.g. after a change of the correction) and persist the table."""
+        self._build(*self._coefficients, self.correction)
+        if self.filename is not None:
+            self._save(self.filename)
+
+    def _build(self, r_ref, r25, b_value, correction):
+        """Calculate the temperature for every knot."""
+        for index in range(self.scale + 1):
+            # Avoid the singularities at the edges of the table (short-circuit and open NTC)
+            ratio = min(max(index, 0.01), self.scale - 0.01)
+            value = beta_temperature(ratio, self.scale, r_ref, r25, b_value)
+            self.knots[index] = value if correction is None else correction(value)
+
+    def _load(self, filename: str) -> bool:
+        """Load the table from flash. Return False if the file is missing or does not match the parameters."""
+        try:
+            with open(filename, 'rb') as file:
+                if file.read(len(self.parameters)) != self.parameters:
+                    return False
+                return file.readinto(self.knots) == len(self.knots) * 4
+        except OSError:
+            return False
+
+    def _save(self, filename: str):
+        """Persist the table to flash."""
+        with open(filename, 'wb') as file:
+            file.write(self.parameters)
+            file.write(self.knots)
+
+    def get(self, raw, ref_raw) -> float:
+        """Convert the raw measurement to a temperature [°C]."""
+        if raw <= 0 or raw >= ref_raw:
+            return INVALID
+        position = raw * self.scale / ref_raw
+        index = int(position)
+        lower = self.knots[index]
+        return lower + (position - index) * (self.knots[index + 1] - lower)
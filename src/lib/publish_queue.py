@@ -0,0 +1,188 @@
+"""Outbound queue of MQTT messages, keeping only the latest value per key.
+
+Only the keys which got a new value are visited (dirty lists), instead of scanning all sensors. A dict of the dirty
+keys (and their priority) keeps the check of a new value O(1).
+A new value is dropped when its payload equals the last published payload.
+A numeric value within the deadband of a key is held back until the deadband interval has passed.
+All messages share a token bucket, which limits the rate of published messages.
+
+usage:
+    queue = PublishQueue(rate=5, burst=20)
+    queue.set_deadband('kettle temperature', change=0.1, interval=30)
+    queue.put('kettle temperature', 'brewery/kettle_temperature', '65.3', value=65.3)
+    message = await queue.get()  # dict(topic=..., msg=..., retain=...)
+
+The keys are published in order of priority (URGENT, NORMAL, LAZY), and in order of arrival within a priority.
+"""
+try:
+    from typing import Dict, List, Optional, Tuple
+except ImportError:
+    ...
+import time
+
+import uasyncio as asyncio
+
+URGENT = 0  # E.g. configuration
+NORMAL = 1
+LAZY = 2  # Published when no other message is ready (but the messages stay in the latest value per key).
+
+
+class TokenBucket():
+    """Rate limiter: a token is added every 1/rate s, up to burst tokens."""
+
+    def __init__(self, rate: float, burst: int) -> None:
+        """Constructor.
+        params:
+            rate   Sustained number of tokens. [1/s]
+            burst  Maximum number of tokens to take at once.
+        """
+        self.period_ms = 1000 / rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self._ticks = time.ticks_ms()
+
+    def _fill(self):
+        now = time.ticks_ms()
+        self.tokens = min(self.burst, self.tokens + time.ticks_diff(now, self._ticks) / self.period_ms)
+        self._ticks = now
+
+    def delay_ms(self) -> int:
+        """Get the time until a token is available (0: available). [ms]"""
+        self._fill()
+        if self.tokens >= 1:
+            return 0
+        return int((1 - self.tokens) * self.period_ms) + 1
+
+    def take(self):
+        """Take a token (check delay_ms() first)."""
+        self.tokens -= 1
+
+
+class PublishQueue():
+    """Coalescing queue of the messages to publish."""
+
+    def __init__(self, rate: float = 5.0, burst: int = 20) -> None:
+        """Constructor.
+        params:
+            rate   Maximum sustained number of published messages. [1/s]
+            burst  Maximum number of messages published at once (e.g. the discovery messages at start).
+        """
+        self.bucket = TokenBucket(rate, burst)
+        self.messages: Dict[str, dict] = dict()  # key -> latest message
+        self._values: Dict[str, float] = dict()  # key -> latest numeric value
+        self._dirty: Tuple[List[str], ...] = (list(), list(), list())  # priority -> dirty keys (in order of arrival)
+        self._priorities: Dict[str, int] = dict()  # dirty key -> priority
+        self._published: Dict[str, Tuple[str, Optional[float], int]] = dict()  # key -> (msg, value, ticks_ms)
+        self._deadbands: Dict[str, Tuple[float, int]] = dict()  # key -> (change, interval [ms])
+        self._event = asyncio.Event()
+        self.published = 0
+        self.suppressed = 0
+
+    def set_deadband(self, key: str, change: float, interval: float):
+        """Publish a numeric value of the key only when it changed at least `change`, or after `interval` s."""
+        self._deadbands[key] = (change, int(interval * 1e3))
+
+    def put(self, key: str, topic: str, msg: str, retain: bool = False, value: Optional[float] = None,
+            priority: int = NORMAL, force: bool = False):
+        """Set the message to publish for the key, replacing the pending message of the key.
+        params:
+            value   The numeric value of the message (to apply the deadband).
+            priority  URGENT, NORMAL or LAZY.
+            force   Publish, even when the message is identical to the last published message.
+        """
+        self.messages[key] = dict(topic=topic, msg=msg, retain=retain)
+        if force and key in self._published:
+            del self._published[key]
+        if isinstance(value, (int, float)):
+            self._values[key] = value
+        elif key in self._values:
+            del self._values[key]
+        if key not in self._priorities:
+            self._priorities[key] = priority
+            self._dirty[priority].append(key)
+        self._event.set()
+
+    def pending(self) -> int:
+        """Get the number of keys with a pending message."""
+        return len(self._priorities)
+
+    def _held_ms(self, key: str, now: int) -> int:
+        """Get the time the pending message of the key is held back by its deadband (0: publish now). [ms]"""
+        deadband = self._deadbands.get(key)
+        value = self._values.get(key)
+        published = self._published.get(key)
+        if deadband is None or value is None or published is None or published[1] is None:
+            return 0
+        change, interval = deadband
+        if abs(value - published[1]) >= change:
+            return 0
+        return max(0, interval - time.ticks_diff(now, published[2]))
+
+    def _next(self, skip: Optional[str] = None) -> Tuple[Optional[str], Optional[int]]:
+        """Get the next key to publish, or the time until a held back message should be published. [ms]
+        The messages of the topic `skip` are not published (yet).
+        """
+        now = time.ticks_ms()
+        wait_ms = None
+        for dirty in self._dirty:
+            index = 0
+            while index < len(dirty):
+                key = dirty[index]
+                if skip is not None and self.messages[key]['topic'] == skip:
+                    index += 1
+                    continue
+                published = self._published.get(key)
+                if published is not None and published[0] == self.messages[key]['msg']:
+                    dirty.pop(index)  # Identical payload
+                    del self._priorities[key]
+                    self.suppressed += 1
+                    continue
+                held_ms = self._held_ms(key, now)
+                if held_ms == 0:
+                    return key, None
+                wait_ms = held_ms if wait_ms is None else min(wait_ms, held_ms)
+                index += 1
+        return None, wait_ms
+
+    def _pop(self, key: str) -> dict:
+        """Remove the key from the dirty keys, and register its message as published."""
+        self._dirty[self._priorities.pop(key)].remove(key)
+        message = self.messages[key]
+        self._published[key] = (message['msg'], self._values.get(key), time.ticks_ms())
+        self.published += 1
+        return message
+
+    def take(self, topic: str) -> List[dict]:
+        """Take all messages for the topic which may be published now, to publish them in a single message.
+        No tokens are taken.
+        """
+        now = time.ticks_ms()
+        messages = list()
+        for dirty in self._dirty:
+            for key in [key for key in dirty if self.messages[key]['topic'] == topic]:
+                published = self._published.get(key)
+                if published is not None and published[0] == self.messages[key]['msg']:
+                    dirty.remove(key)  # Identical payload
+                    del self._priorities[key]
+                    self.suppressed += 1
+                elif self._held_ms(key, now) == 0:
+                    messages.append(self._pop(key))
+        return messages
+
+    async def get(self, skip: Optional[str] = None) -> dict:
+        """Wait for the next message to publish, except the messages of the topic `skip`."""
+        while True:
+            key, wait_ms = self._next(skip)
+            if key is not None:
+                wait_ms = self.bucket.delay_ms()
+                if wait_ms == 0:
+                    self.bucket.take()
+                    return self._pop(key)
+            self._event.clear()
+            if wait_ms is None:
+                await self._event.wait()
+            else:
+                try:
+                    await asyncio.wait_for_ms(self._event.wait(), wait_ms)
+                except asyncio.TimeoutError:
+                    pass
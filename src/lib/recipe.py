@@ -1,98 +1,346 @@
-"""A recipe contains several stages."""
+"""A recipe contains several stages.
+
+A recipe is loaded from a JSON file (see load()), e.g.:
+    {"name": "Brönald #5",
+     "stages": [{"name": "Preheat", "temperature": 65, "action": "Add malt"},
+                {"name": "Mash", "temperature": 63, "duration": "30m"},
+                {"name": "Mash out", "type": "ramp", "temperature": 77, "rate": 60, "duration": "5m"},
+                {"name": "Ferment", "type": "hold", "temperature": 19, "duration": "7d"}]}
+The type of a stage:
+    step  (default) heat or cool to the temperature, the duration starts when the temperature is reached.
+    hold  keep the temperature for the duration, it starts immediately.
+    ramp  change the target from the temperature of the previous stage at the rate [°C/h], then hold the temperature
+          for the duration. It starts immediately.
+A duration is a number of seconds, or a string with the unit: "90s", "30m", "2h" or "7d".
+An action is a message for the brewer at the end of the stage, the recipe waits for its acknowledge (unless "wait"
+is false).
+
+The stages are compiled into a Schedule: one array per property. The progress (the start and end of the stages) is
+written to the progress file at every stage transition, so the recipe resumes after a reset. A finished recipe is not
+resumed, nor is progress of which the stage is overdue for more than STALE (a previous brew); a stage that waits for
+the acknowledge of its action is never overdue. restart() starts the recipe all over.
+The durations are measured with the monotonic time of the clock, so a synchronization of the time (SNTP) does not
+shorten or extend a stage. The wall time is only used to show the start and end of the stages, and in the progress
+file (the monotonic time restarts at a reset).
+With a model of the kettle (see thermal_model), a heating stage starts when the kettle coasts onto the target (instead
+of waiting for the measured temperature to cross it), and the ETA of the stage is published while it waits.
+"""
+from array import array
+import json
 try:
     from typing import Callable, List, Optional  # to please lint...
 except ImportError:
     ...
-import logging
 import time
 
+from clock import Clock, SYSTEM_CLOCK
+from config import get_config
 from status import state
+from thermal_model import ThermalModel
+
+STEP = 0
+HOLD = 1
+RAMP = 2
+KINDS = {'step': STEP, 'hold': HOLD, 'ramp': RAMP}
+NOT_STARTED = -0x7fffffff  # (The monotonic start of a resumed stage can be negative)
+NEVER = float('inf')
+UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+TOLERANCE = 0.25  # A heating stage starts this close to the target, when the kettle coasts onto it [°C]
+STALE = 86400  # Progress of which the stage is overdue for longer than this is of a previous brew [s]
 
 
 class Stage():
     """A stage in the brewing process."""
 
-    def __init__(self, name: str, duration: float, temperature: float, action=None, wait_for_action=True):
+    def __init__(self, name: str, duration: float, temperature: float, action=None, wait_for_action=True,
+                 kind: int = STEP, rate: float = 0.0):
         self.name = name
         self.duration = duration
         self.temperature = temperature
-        self.start: Optional[float] = None
         self.wait_for_action = wait_for_action if action else False
         self.end_message = action
-        self.end: Optional[float] = None
+        self.kind = kind
+        self.rate = rate
+
+
+class Schedule():
+    """The stages of a recipe, compiled into arrays (the index is the stage)."""
+
+    def __init__(self, stages: List[Stage]) -> None:
+        count = len(stages)
+        self.count = count
+        self.names = [stage.name for stage in stages]
+        self.actions = [stage.end_message for stage in stages]
+        self.kinds = bytearray(stage.kind for stage in stages)
+        self.wait = bytearray(1 if stage.wait_for_action else 0 for stage in stages)
+        self.temperatures = array('f', (stage.temperature for stage in stages))  # [°C]
+        self.rates = array('f', (stage.rate for stage in stages))  # [°C/h]
+        self.durations = array('l', (int(stage.duration) for stage in stages))  # [s]
+        self.starts = array('l', (NOT_STARTED for _ in range(count)))  # Monotonic time the stage started [s]
+        self.ends = array('l', (NOT_STARTED for _ in range(count)))  # Monotonic time the stage ended [s]
+        self.origin = 0.0  # The temperature at the start of the ramp of the current stage [°C]
+
+    def ramp_duration(self, index: int) -> int:
+        """Get the duration of the ramp of the stage. [s]"""
+        if self.kinds[index] != RAMP or not self.rates[index]:
+            return 0
+        return int(abs(self.temperatures[index] - self.origin) * 3600 / self.rates[index])
+
+    def target(self, index: int, now: float) -> float:
+        """Get the target temperature of the stage at the (monotonic) time. [°C]"""
+        temperature = self.temperatures[index]
+        if self.kinds[index] != RAMP:
+            return temperature
+        if self.starts[index] == NOT_STARTED:  # The ramp starts from the previous stage
+            return self.temperatures[index - 1] if index else temperature
+        change = self.rates[index] * (now - self.starts[index]) / 3600
+        if temperature > self.origin:
+            return min(temperature, self.origin + change)
+        return max(temperature, self.origin - change)
+
+
+def _seconds(duration) -> int:
+    """Convert a duration (seconds or a string with the unit: "30m") to seconds."""
+    if isinstance(duration, str) and duration[-1:] in UNITS:
+        return int(float(duration[:-1]) * UNITS[duration[-1]])
+    return int(float(duration))
+
+
+def load(filename: str, callback: Callable[..., None], clock: Clock = SYSTEM_CLOCK,
+         progress: Optional[str] = 'recipe_progress.json', cadence: int = 60,
+         model: Optional[ThermalModel] = None) -> 'Recipe':
+    """Load the recipe of the JSON file.
+    params:
+        filename  The JSON file of the recipe.
+        callback  Function to publish the progress of the recipe.
+        clock     The clock of the recipe.
+        progress  The file to write the progress to (None: the progress is not kept).
+        cadence   Interval to publish the remaining time of the stage. [s]
+        model     The model of the kettle (None: the stages start when the temperature crosses the target).
+    """
+    with open(filename) as file:
+        recipe = json.load(file)
+    stages = [Stage(stage['name'], _seconds(stage.get('duration', 0)), float(stage['temperature']),
+                    stage.get('action'), stage.get('wait', True), KINDS[stage.get('type', 'step')],
+                    float(stage.get('rate', 0)))
+              for stage in recipe['stages']]
+    return Recipe(recipe['name'], stages, callback, clock, progress, cadence, model)
 
 
 class Recipe():
     """The recipe for a nice beer.
-    The client of this class should call `set_current_temperature` on a regular interval, so the recipe can check the progress.
+    The client of this class should call `get_target_temperature` on a regular interval, so the recipe can check the
+    progress. The recipe is a state machine: it only works at `next_event_at` (the end of the stage or the next status
+    message), or when the temperature is checked to start the stage. The remaining time is published every cadence.
     #TODO: the recipe should get the temperature when needed (using asyncio)...
     """
 
-    def __init__(self, name: str, stages: List[Stage], callback: Callable[..., None]):
+    def __init__(self, name: str, stages: List[Stage], callback: Callable[..., None], clock: Clock = SYSTEM_CLOCK,
+                 progress: Optional[str] = None, cadence: int = 60, model: Optional[ThermalModel] = None):
+        """Constructor.
+        params:
+            name      Name of the recipe.
+            stages    The stages (these are compiled into the schedule).
+            callback  Function to publish the progress of the recipe.
+            clock     The clock of the recipe.
+            progress  The file to write the progress to (None: the progress is not kept).
+            cadence   Interval to publish the remaining time of the stage. [s]
+            model     The model of the kettle (None: the stages start when the temperature crosses the target).
+        """
         self.name = name
-        self.stages = stages
+        self.clock = clock
+        self.schedule = Schedule(stages)
         self.callback = callback
+        self.cadence = max(1, int(cadence))
+        self.model = model
+        self.temperature: Optional[float] = None  # The last measured temperature [°C]
         self.index = 0
         self.edge = None  # -1 for raising edge; 1 for falling edge
-        self.callback(**{'target temperature': self.stages[self.index].temperature})
+        self.next_event_at = 0.0  # Monotonic time of the next transition or status message [s]
+        self.finished = False
+        self._progress = get_config(progress) if progress else None
+        self._resume()
+        self._target = self.schedule.temperatures[self.index]  # The target of the current stage [°C]
+        self.callback(**{'target temperature': self._target})
+
+    def _resume(self):
+        """Restore the progress of this recipe (unless it was finished, or its stage is overdue for more than STALE)."""
+        if self._progress is None:
+            return
+        progress = self._progress.get()
+        schedule = self.schedule
+        starts = progress.get('starts', ())
+        ends = progress.get('ends', ())
+        if (progress.get('recipe') != self.name or len(starts) != schedule.count or len(ends) != schedule.count or
+                progress.get('finished', False)):
+            return
+        schedule.origin = float(progress.get('origin', 0))
+        overdue = self._overdue(int(progress.get('index', 0)), starts, ends, progress.get('time', 0))
+        if overdue > STALE:
+            schedule.origin = 0.0
+            print(f'INFO: recipe {self.name}: the progress is {overdue / 3600:.1f}h overdue, it is not resumed')
+            return
+        offset = self._wall_offset()
+        for index in range(schedule.count):  # The progress file has the wall times
+            schedule.starts[index] = starts[index] - offset if starts[index] != NOT_STARTED else NOT_STARTED
+            schedule.ends[index] = ends[index] - offset if ends[index] != NOT_STARTED else NOT_STARTED
+        self.index = int(progress.get('index', 0))
+        self.callback(recipe=f'{self.schedule.names[self.index]}: resumed')
+        print(f'INFO: recipe {self.name} resumed at stage {self.index}')
+
+    def _overdue(self, index: int, starts: List[int], ends: List[int], transition: int) -> float:
+        """Get the time the stage of the progress is overdue: the time since the end of the stage (or since the last
+        transition, when it waits for the temperature). A stage that waits for its acknowledge is never overdue.
+        params:
+            index       The stage of the progress.
+            starts      The (wall) start times of the stages. [s]
+            ends        The (wall) end times of the stages. [s]
+            transition  The (wall) time of the last transition. [s]
+        """
+        schedule = self.schedule
+        if starts[index] == NOT_STARTED:  # Waiting for the temperature
+            since = transition
+        elif ends[index] != NOT_STARTED:  # Acknowledged
+            since = ends[index]
+        elif schedule.wait[index]:  # Waiting for the end of the stage, then for the acknowledge of the action
+            return 0.0
+        else:
+            since = starts[index] + schedule.durations[index] + schedule.ramp_duration(index)
+        return max(0.0, self.clock.time() - since)
+
+    def _wall_offset(self) -> int:
+        """Get the wall time (clock.time()) minus the monotonic time of the clock. [s]"""
+        return int(self.clock.time() - self.clock.monotonic() + 0.5)
+
+    def _checkpoint(self):
+        """Write the progress (at a stage transition)."""
+        if self._progress is None:
+            return
+        schedule = self.schedule
+        offset = self._wall_offset()
+        with self._progress.batch():
+            self._progress.set('recipe', self.name)
+            self._progress.set('index', self.index)
+            self._progress.set('starts', [start + offset if start != NOT_STARTED else NOT_STARTED
+                                          for start in schedule.starts])
+            self._progress.set('ends', [end + offset if end != NOT_STARTED else NOT_STARTED for end in schedule.ends])
+            self._progress.set('origin', schedule.origin)
+            self._progress.set('finished', self.finished)
+            self._progress.set('time', int(self.clock.time()))  # Of the last transition
+
+    def _start(self, cur_temperature: float, target_temperature: float, edge: int):
+        """Start the current stage."""
+        schedule = self.schedule
+        self.callback(recipe_info='start stage %d: target=%.1f, current=%.1f, edge=%d' %
+                      (self.index, target_temperature, cur_temperature, edge))
+        schedule.starts[self.index] = int(self.clock.monotonic())
+        schedule.origin = schedule.temperatures[self.index - 1] if self.index else cur_temperature
+        self.edge = None
+        self.next_event_at = 0.0
+        self._checkpoint()
 
     def _set_current_temperature(self, cur_temperature):
-        target_temperature = self._get_target_temperature()
-        stage = self.stages[self.index]
-        if stage.start is None:
-            if self.edge is None:
-                self.edge = -1 if cur_temperature < target_temperature else 1
-            delta = target_temperature - cur_temperature
-            if delta * self.edge >= 0:
-                self.callback(recipe_info='start stage %d: target=%.1f, current=%.1f, edge=%d' %
-                              (self.index, target_temperature, cur_temperature, self.edge))
-                stage.start = time.time()
-                self.edge = None
+        schedule = self.schedule
+        if schedule.kinds[self.index] != STEP:
+            self._start(cur_temperature, self._target, 0)
+            return
+        if self.edge is None:
+            self.edge = -1 if cur_temperature < self._target else 1
+        delta = self._target - cur_temperature
+        if delta * self.edge >= 0 or (self.edge < 0 and self._coasts_onto(cur_temperature)):
+            self._start(cur_temperature, self._target, self.edge)
+
+    def _coasts_onto(self, cur_temperature: float) -> bool:
+        """The temperature is close to the target, and the model predicts that the kettle coasts onto it."""
+        model = self.model
+        return (model is not None and model.ready and self._target - cur_temperature <= TOLERANCE and
+                model.predict(cur_temperature) >= self._target - TOLERANCE)
 
     def get_target_temperature(self, cur_temperature=None, default: float=-273):
         """Get the required temperature."""
+        schedule = self.schedule
         if cur_temperature is not None:
-            self._set_current_temperature(cur_temperature)
-        return self._get_target_temperature(default)
+            self.temperature = cur_temperature
+            if schedule.starts[self.index] == NOT_STARTED and not self.finished:
+                self._set_current_temperature(cur_temperature)
+        now = self.clock.monotonic()
+        if now >= self.next_event_at:
+            self._event(now)
+        if self.finished:
+            return default
+        if schedule.kinds[self.index] == RAMP:
+            return schedule.target(self.index, now)
+        return self._target
 
-    def _get_target_temperature(self, default=-273):
-        stage = self.stages[self.index]
-        if stage.start is None:
-            self.callback(recipe=f'{self.stages[self.index].name}: Waiting to start')
-        else:
-            pending_duration = int(stage.duration - (time.time() - stage.start))
-            if pending_duration > 0:
-                self.callback(
-                    recipe=f'{self.stages[self.index].name}: {pending_duration // 60}:{pending_duration % 60:02} remaining')
+    def _event(self, now: float):
+        """Publish the state of the current stage, and move to the next stage at its end."""
+        schedule = self.schedule
+        index = self.index
+        if schedule.starts[index] == NOT_STARTED:
+            eta = None
+            if self.model is not None and self.temperature is not None:
+                eta = self.model.eta(self.temperature, self._target)
+            if eta is None:
+                self.callback(recipe=f'{schedule.names[index]}: Waiting to start')
             else:
-                if stage.wait_for_action and stage.end is None:
-                    self.callback(recipe=f'Action: {stage.end_message}')
-                    state.alert('Recipe', stage.end_message)
-                else:
-                    if stage.end is None:
-                        stage.end = time.time()
-                    if self.index == (len(self.stages) - 1):
-                        return default
-                    self.index += 1
-                    self.callback(**{'target temperature': self.stages[self.index].temperature})
-
-        return self.stages[self.index].temperature
+                self.callback(recipe=f'{schedule.names[index]}: Waiting to start, ETA {eta // 60}:{eta % 60:02}')
+            # The stage is started by the temperature, the ETA is updated every cadence
+            self.next_event_at = NEVER if self.model is None else now + self.cadence
+            return
+        end = schedule.starts[index] + schedule.durations[index] + schedule.ramp_duration(index)
+        pending_duration = int(end - now + 0.5)
+        if pending_duration > 0:
+            self.callback(
+                recipe=f'{schedule.names[index]}: {pending_duration // 60}:{pending_duration % 60:02} remaining')
+            self.next_event_at = end - ((pending_duration - 1) // self.cadence) * self.cadence
+        elif schedule.wait[index] and schedule.ends[index] == NOT_STARTED:
+            self.callback(recipe=f'Action: {schedule.actions[index]}')
+            state.alert('Recipe', schedule.actions[index])
+            self.next_event_at = NEVER  # Until the action is acknowledged
+        else:
+            if schedule.ends[index] == NOT_STARTED:
+                schedule.ends[index] = int(now)
+            if index == (schedule.count - 1):
+                self.finished = True
+                self.next_event_at = NEVER
+                self._checkpoint()
+                return
+            self.index += 1
+            self._checkpoint()
+            self._target = schedule.temperatures[self.index]
+            self.callback(**{'target temperature': self._target})
 
     def set_target_temperature(self, temperature):
-        self.stages[self.index].temperature = float(temperature)
-        self.callback(**{'target temperature': self.stages[self.index].temperature})
+        self.schedule.temperatures[self.index] = float(temperature)
+        self._target = self.schedule.temperatures[self.index]
+        self.callback(**{'target temperature': self._target})
 
     def set_stage(self, index):
+        """Continue the recipe at the stage: it and the stages after it start all over."""
         index = int(index)
-        assert index < len(self.stages), 'index out of range'
+        schedule = self.schedule
+        assert index < schedule.count, 'index out of range'
+        for stage in range(index, schedule.count):
+            schedule.starts[stage] = NOT_STARTED
+            schedule.ends[stage] = NOT_STARTED
         self.index = index
-        self.callback(recipe=self.stages[self.index].name)
+        self.finished = False
+        self.edge = None
+        self.next_event_at = 0.0
+        self._target = self.schedule.temperatures[self.index]
+        self._checkpoint()
+        self.callback(recipe=self.schedule.names[self.index])
+
+    def restart(self):
+        """Start the recipe all over (e.g. a new brew of the same recipe)."""
+        self.set_stage(0)
 
     def ack_action(self):
         """Acknowledge the pending action."""
-        stage = self.stages[self.index]
-        stage.end = time.time()
-        self.callback(recipe=stage.name)
+        self.schedule.ends[self.index] = int(self.clock.monotonic())
+        self.next_event_at = 0.0
+        self._checkpoint()
+        self.callback(recipe=self.schedule.names[self.index])
         state.alert('Recipe', None)
 
     def web_page(self, recipe_variable_name):
@@ -104,35 +352,38 @@ class Recipe():
 <th style="text-align:left">action</th></tr>
 '''
         message = None
-        for stage in self.stages:
-            action = stage.end_message if stage.end_message else ''
-            if stage.start is None:
+        schedule = self.schedule
+        offset = self._wall_offset()  # The start and end are shown in wall time
+        for index in range(schedule.count):
+            action = schedule.actions[index] if schedule.actions[index] else ''
+            start = schedule.starts[index]
+            duration = schedule.durations[index] + schedule.ramp_duration(index)
+            if start == NOT_STARTED:
                 row_style = ''
                 t_start = '-'
                 t_end = '-'
                 percentage = 0
-            elif stage.end is None:
+            elif schedule.ends[index] == NOT_STARTED:
                 row_style = ' style="background-color:yellow"'
-                t_start = '%02d:%02d' % time.localtime(stage.start)[3:5]
-                t_end = '%02d:%02d' % time.localtime(stage.start + stage.duration)[3:5]
-                progress = time.time() - stage.start
-                if progress >= stage.duration:
+                t_start = '%02d:%02d' % time.localtime(start + offset)[3:5]
+                t_end = '%02d:%02d' % time.localtime(start + offset + duration)[3:5]
+                progress = self.clock.monotonic() - start
+                if progress >= duration:
                     percentage = 100
                 else:
-                    print(time.time(), stage.start, progress, stage.duration)
-                    percentage = 100 * progress / stage.duration
+                    percentage = 100 * progress / duration
                 if percentage == 100:
-                    message = stage.end_message
+                    message = schedule.actions[index]
                     t_end = '<b>%s</b>' % t_end
                     if action:
                         action = '<a href="/?%s.ack_action">%s</a>' % (recipe_variable_name, action)
             else:
                 row_style = ' style="background-color:gray"'
-                t_start = '%02d:%02d' % time.localtime(stage.start)[3:5]
-                t_end = '%02d:%02d' % time.localtime(stage.end)[3:5]
+                t_start = '%02d:%02d' % time.localtime(start + offset)[3:5]
+                t_end = '%02d:%02d' % time.localtime(schedule.ends[index] + offset)[3:5]
                 percentage = 100
             html += '''<tr%s><td>%d</td><td>%d</td><td>%s</td><td>%s</td><td>%.1f</td><td style="text-align:left">%s</td></tr>
-    ''' % (row_style, stage.duration // 60, stage.temperature, t_start, t_end, percentage, action)
+    ''' % (row_style, duration // 60, schedule.temperatures[index], t_start, t_end, percentage, action)
         html += '</table></p>\n'
         if message is not None:
             html += '<p style="color:red"><b>%s</b></p>\n' % message
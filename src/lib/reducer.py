@@ -0,0 +1,228 @@
+"""Reduce a stream of measurements to a single value, using constant memory.
+
+All reducers keep the last `size` measurements in a ring buffer, preallocated for `capacity` measurements.
+Changing the size with resize() does not reallocate the buffers.
+
+usage:
+    reducer = Hampel(capacity=64)
+    reducer.resize(10)
+    for value in measurements:
+        reducer.add(value)
+    print(reducer.get())
+"""
+from array import array
+
+
+class Reducer():
+    """Base class of the reducers: a ring buffer with the last measurements."""
+
+    def __init__(self, capacity: int = 64) -> None:
+        self.capacity = capacity
+        self.buffer = array('f', bytes(4 * capacity))
+        self.size = capacity
+        self.reset()
+
+    def resize(self, size: int):
+        """Change the number of measurements to reduce (limited by the capacity).
+        Note: all collected measurements will be flushed.
+        """
+        size = max(1, int(size))
+        if size > self.capacity:
+            print(f'WARNING: window of {size} measurements is limited to the capacity of {self.capacity}')
+            size = self.capacity
+        self.size = size
+        self.reset()
+
+    def reset(self):
+        """Flush all collected measurements."""
+        self.count = 0
+        self.index = 0
+
+    def add(self, value: float):
+        """Add a measurement.
+        Return the measurement which dropped out of the window (None if the window was not full).
+        """
+        evicted = self.buffer[self.index] if self.count == self.size else None
+        self.buffer[self.index] = value
+        self.index += 1
+        if self.index == self.size:
+            self.index = 0
+        if self.count < self.size:
+            self.count += 1
+        return evicted
+
+    def get(self) -> float:
+        """Get the reduced value of the collected measurements."""
+        raise NotImplementedError
+
+
+class Mean(Reducer):
+    """Running mean of the measurements in the window."""
+
+    def reset(self):
+        super().reset()
+        self.total = 0.0
+
+    def add(self, value: float):
+        position = self.index
+        evicted = super().add(value)
+        if self.index == 0:
+            # Recalculate the total once per window, to avoid the accumulation of rounding errors
+            total = 0.0
+            for index in range(self.count):
+                total += self.buffer[index]
+            self.total = total
+        else:
+            self.total += self.buffer[position] - (evicted or 0.0)
+        return evicted
+
+    def get(self) -> float:
+        return self.total / self.count
+
+
+class Ewma(Reducer):
+    """Exponentially weighted moving average, with the span of the window (alpha = 2 / (size + 1)).
+    Note: no measurements are stored, the capacity is not used.
+    """
+
+    def __init__(self, size: int = 1) -> None:
+        super().__init__(capacity=0)
+        self.value = 0.0
+        self.resize(size)
+
+    def resize(self, size: int):
+        self.size = max(1, int(size))
+        self.alpha = 2 / (self.size + 1)
+        self.reset()
+
+    def add(self, value: float):
+        if self.count == 0:
+            self.value = value
+            self.count = 1
+        else:
+            self.value += self.alpha * (value - self.value)
+
+    def get(self) -> float:
+        return self.value
+
+
+class _Sorted(Reducer):
+    """Base class for reducers using the sorted measurements of the window.
+    A binary search locates a measurement, the insertion (and removal) shifts the sorted array in place.
+    """
+
+    def __init__(self, capacity: int = 64) -> None:
+        self.sorted = array('f', bytes(4 * capacity))
+        super().__init__(capacity)
+
+    def _bisect(self, value: float) -> int:
+        """Get the index in the sorted measurements to insert the value (after equal values)."""
+        lower = 0
+        higher = self.count
+        while lower < higher:
+            middle = (lower + higher) >> 1
+            if value < self.sorted[middle]:
+                higher = middle
+            else:
+                lower = middle + 1
+        return lower
+
+    def add(self, value: float):
+        values = self.sorted
+        count = self.count
+        position = self.index
+        evicted = super().add(value)
+        value = self.buffer[position]  # The stored (rounded) value
+        if evicted is not None:
+            count -= 1
+            index = self._bisect(evicted) - 1  # Index of the (last) stored equal value
+            while index < count:
+                values[index] = values[index + 1]
+                index += 1
+        self.count = count
+        index = self._bisect(value)
+        while count > index:
+            values[count] = values[count - 1]
+            count -= 1
+        values[index] = value
+        self.count += 1
+        return evicted
+
+    def median(self) -> float:
+        """Get the median of the measurements in the window."""
+        count = self.count
+        middle = count >> 1
+        if count & 1:
+            return self.sorted[middle]
+        return (self.sorted[middle - 1] + self.sorted[middle]) / 2
+
+    def mad(self, median: float) -> float:
+        """Get the median absolute deviation of the measurements in the window.
+        The deviations are sorted by walking outwards from the median (no sorting required).
+        """
+        values = self.sorted
+        count = self.count
+        lower = self._bisect(median) - 1
+        upper = lower + 1
+        previous = deviation = 0.0
+        for _ in range((count >> 1) + 1):
+            previous = deviation
+            if upper >= count or (lower >= 0 and median - values[lower] <= values[upper] - median):
+                deviation = median - values[lower]
+                lower -= 1
+            else:
+                deviation = values[upper] - median
+                upper += 1
+        if count & 1:
+            return deviation
+        return (previous + deviation) / 2
+
+    def _mean(self, first: int, last: int) -> float:
+        """Get the mean of the sorted measurements [first, last)."""
+        total = 0.0
+        for index in range(first, last):
+            total += self.sorted[index]
+        return total / (last - first)
+
+
+class Median(_Sorted):
+    """Rolling median of the measurements in the window."""
+
+    def get(self) -> float:
+        return self.median()
+
+
+class TrimmedMean(_Sorted):
+    """Mean of the measurements in the window, without the lowest and highest proportion of the measurements."""
+
+    def __init__(self, capacity: int = 64, proportion: float = 0.1) -> None:
+        super().__init__(capacity)
+        self.proportion = proportion
+
+    def get(self) -> float:
+        trim = int(self.count * self.proportion)
+        return self._mean(trim, self.count - trim)
+
+
+class Hampel(_Sorted):
+    """Mean of the measurements in the window, without the outliers.
+
+    A measurement is an outlier if it deviates more than `threshold` (scaled) median absolute deviations
+    from the median. E.g. a failed measurement or a spike.
+    """
+    MAD_SCALE = 1.4826  # Scale the MAD to the standard deviation of a normal distribution
+
+    def __init__(self, capacity: int = 64, threshold: float = 3.0) -> None:
+        super().__init__(capacity)
+        self.threshold = threshold
+
+    def get(self) -> float:
+        median = self.median()
+        limit = self.threshold * self.MAD_SCALE * self.mad(median)
+        first = 0
+        while median - self.sorted[first] > limit:
+            first += 1
+        last = self.count
+        while self.sorted[last - 1] - median > limit:
+            last -= 1
+        return self._mean(first, last)
@@ -0,0 +1,152 @@
+"""Bounded on-flash log of timestamped measurements, to store measurements while the connection is down.
+
+The log is a preallocated file of `blocks` blocks of `block_size` bytes (by default 8 KB: 896 records).
+New records are collected in a block in RAM. A full block is written at once to the next block of the file,
+so all blocks of the file are written equally often. When the log is full, the oldest block is overwritten.
+The RAM use is limited to two blocks: the block being filled and the block being drained.
+
+Every block starts with a header: sequence number, number of records and a drained flag.
+A record contains the time [s], the index of the key (see the json file next to the log) and the value.
+
+usage:
+    log = RingLog('offline.log')
+    log.append('kettle temperature', 65.3)
+    await log.drain(publish)  # async publish(payload: str), payload: {key: [[time, value], ...]}
+"""
+try:
+    from typing import Awaitable, Callable, Dict, List
+except ImportError:
+    ...
+import json
+import os
+import struct
+import time
+
+from config import Config
+
+HEADER = '<IHH'  # sequence number, number of records, drained
+HEADER_SIZE = struct.calcsize(HEADER)
+RECORD = '<IBf'  # time [s], key index, value
+RECORD_SIZE = struct.calcsize(RECORD)
+MAX_KEYS = 256
+
+
+class RingLog():
+    """Append-only ring log of measurements in a preallocated file."""
+
+    def __init__(self, filename: str = 'offline.log', block_size: int = 512, blocks: int = 16) -> None:
+        """Constructor.
+        params:
+            filename    The file of the log. The keys are stored in a json file with the same base name.
+            block_size  Size of a block (the unit to write to flash). [bytes]
+            blocks      Number of blocks of the log.
+        """
+        self.filename = filename
+        self.block_size = block_size
+        self.blocks = blocks
+        self.capacity = (block_size - HEADER_SIZE) // RECORD_SIZE  # records per block
+        self._block = bytearray(block_size)  # Block being filled
+        self._read = bytearray(block_size)  # Block being drained
+        self.count = 0  # Number of records in the block being filled
+        self.dropped = 0  # Number of records overwritten before they were drained
+        self.writes = 0  # Number of blocks written
+        self._keys = Config(filename.rsplit('.', 1)[0] + '.json')  # key -> index
+        self._names: Dict[int, str] = {index: key for key, index in self._keys.get().items()}
+        self._pending: List[int] = [0] * blocks  # slot -> sequence number of a block to drain (0: none)
+        self._counts: List[int] = [0] * blocks  # slot -> number of records
+        self._sequence = 0
+        self._open()
+
+    def _open(self):
+        """Find the blocks to drain, or preallocate the file."""
+        try:
+            if os.stat(self.filename)[6] != self.blocks * self.block_size:
+                raise OSError('size mismatch')
+            with open(self.filename, 'rb') as file:
+                for slot in range(self.blocks):
+                    file.seek(slot * self.block_size)
+                    sequence, count, drained = struct.unpack(HEADER, file.read(HEADER_SIZE))
+                    self._sequence = max(self._sequence, sequence)
+                    if count and not drained:
+                        self._pending[slot] = sequence
+                        self._counts[slot] = count
+        except OSError:
+            with open(self.filename, 'wb') as file:
+                for _ in range(self.blocks):
+                    file.write(self._read)
+            self._sequence = 0
+
+    def _index(self, key: str) -> int:
+        """Get the index of the key (a new key is stored)."""
+        index = self._keys.get(key)
+        if index is None:
+            index = len(self._names)
+            if index >= MAX_KEYS:
+                raise ValueError(f'too many keys ({key})')
+            self._names[index] = key
+            self._keys.set(key, index)
+        return index
+
+    def append(self, key: str, value: float, timestamp=None):
+        """Append a measurement (default timestamp: now)."""
+        try:
+            index = self._index(key)
+        except ValueError as ex:
+            print(f'WARNING: {ex}, "{key}" is not logged')
+            return
+        struct.pack_into(RECORD, self._block, HEADER_SIZE + self.count * RECORD_SIZE,
+                         int(time.time() if timestamp is None else timestamp), index, value)
+        self.count += 1
+        if self.count == self.capacity:
+            self.flush()
+
+    def flush(self):
+        """Write the collected records to the next block of the file."""
+        if self.count == 0:
+            return
+        self._sequence += 1
+        slot = self._sequence % self.blocks
+        if self._pending[slot]:
+            self.dropped += self._counts[slot]
+        struct.pack_into(HEADER, self._block, 0, self._sequence, self.count, 0)
+        with open(self.filename, 'r+b') as file:
+            file.seek(slot * self.block_size)
+            file.write(self._block)
+        self.writes += 1
+        self._pending[slot] = self._sequence
+        self._counts[slot] = self.count
+        self.count = 0
+
+    def pending(self) -> int:
+        """Get the number of records to drain."""
+        return sum(count for slot, count in enumerate(self._counts) if self._pending[slot]) + self.count
+
+    async def drain(self, publish: Callable[[str], Awaitable], batch: int = 32):
+        """Publish all logged records, oldest first, in batches of (at most) `batch` records.
+        The next batch is published when the previous publish completed.
+        """
+        self.flush()
+        while True:
+            slot = None
+            for candidate, sequence in enumerate(self._pending):
+                if sequence and (slot is None or sequence < self._pending[slot]):
+                    slot = candidate
+            if slot is None:
+                return
+            sequence = self._pending[slot]
+            with open(self.filename, 'rb') as file:
+                file.seek(slot * self.block_size)
+                file.readinto(self._read)
+            count = struct.unpack_from(HEADER, self._read)[1]
+            history: Dict[str, list] = dict()
+            for record in range(count):
+                timestamp, index, value = struct.unpack_from(RECORD, self._read, HEADER_SIZE + record * RECORD_SIZE)
+                history.setdefault(self._names.get(index, str(index)), list()).append([timestamp, round(value, 3)])
+                if (record + 1) % batch == 0 or record == count - 1:
+                    await publish(json.dumps(history))
+                    history = dict()
+            if self._pending[slot] == sequence:  # The block was not overwritten while it was drained
+                with open(self.filename, 'r+b') as file:
+                    file.seek(slot * self.block_size)
+                    file.write(struct.pack(HEADER, sequence, count, 1))
+                self._pending[slot] = 0
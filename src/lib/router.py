@@ -0,0 +1,67 @@
+"""Route MQTT topics to handlers, using a prefix trie of the topic levels.
+
+usage:
+    router = Router()
+    router.add('brewery/kettle_switch/set', handler)
+    router.add('brewery/+/get', other_handler)  # + matches a single level, # matches all remaining levels
+    handler = router.get('brewery/kettle_switch/set')
+"""
+import math
+try:
+    from typing import Any, Callable, Dict, List, Optional, Tuple
+except ImportError:
+    ...
+
+
+def scalar(payload: bytes) -> Tuple[Any, ...]:
+    """Get the arguments of a command from a scalar payload (without decoding json).
+    An empty payload gives no arguments, a number gives an int or float, anything else gives a str.
+    A number which is not finite (nan, inf) raises a ValueError, e.g. a target temperature must be a finite number.
+    """
+    text = payload.decode()
+    if not text:
+        return ()
+    for convert in (int, float):
+        try:
+            value = convert(text)
+        except ValueError:
+            continue
+        if convert is float and not math.isfinite(value):
+            raise ValueError(f'not a finite number: {text}')
+        return (value,)
+    return (text,)
+
+
+class Router():
+    """Prefix trie of topic levels.
+    Every node is a dict: topic level -> child node. The handler of a node is stored with key None.
+    """
+
+    def __init__(self) -> None:
+        self._root: Dict[Optional[str], Any] = dict()
+        self.topics: List[str] = list()
+
+    def add(self, topic: str, handler: Callable):
+        """Add (or replace) the handler of a topic (filter)."""
+        node = self._root
+        for level in topic.split('/'):
+            node = node.setdefault(level, dict())
+        if None not in node:
+            self.topics.append(topic)
+        node[None] = handler
+
+    def get(self, topic: str) -> Optional[Callable]:
+        """Get the handler of the topic (an exact level takes precedence over + and #)."""
+        return self._get(self._root, topic.split('/'), 0)
+
+    def _get(self, node: dict, levels: List[str], index: int) -> Optional[Callable]:
+        if index == len(levels):
+            return node.get(None)
+        for level in (levels[index], '+'):
+            child = node.get(level)
+            if child is not None:
+                handler = self._get(child, levels, index + 1)
+                if handler is not None:
+                    return handler
+        child = node.get('#')
+        return None if child is None else child.get(None)
@@ -96,3 +96,83 @@ def stdev(data, xbar=None):
 
 def pstdev(data, mu=None):
     return math.sqrt(pvariance(data, mu))
+
+
+class RunningStats:
+    """Single pass (Welford) statistics of a stream of data, using O(1) memory.
+
+    If alpha is given, also the exponentially weighted mean and variance are maintained.
+    Partial aggregates (e.g. per measurement window) can be combined with merge().
+    """
+
+    def __init__(self, alpha=None):
+        self.alpha = alpha
+        self.clear()
+
+    def clear(self):
+        self.count = 0
+        self._mean = 0.0
+        self._m2 = 0.0
+        self.min = float('inf')
+        self.max = float('-inf')
+        self.ew_mean = 0.0
+        self.ew_variance = 0.0
+
+    def push(self, x):
+        self.count += 1
+        delta = x - self._mean
+        self._mean += delta / self.count
+        self._m2 += delta * (x - self._mean)
+        if x < self.min:
+            self.min = x
+        if x > self.max:
+            self.max = x
+        if self.alpha is not None:
+            if self.count == 1:
+                self.ew_mean = x
+            else:
+                delta = x - self.ew_mean
+                increment = self.alpha * delta
+                self.ew_mean += increment
+                self.ew_variance = (1 - self.alpha) * (self.ew_variance + delta * increment)
+
+    def extend(self, data):
+        # Accepts any iterable, e.g. an array or memoryview, without copying it
+        for x in data:
+            self.push(x)
+
+    def merge(self, other):
+        # Chan et al. parallel algorithm. Note: the exponentially weighted statistics are not merged.
+        count = self.count + other.count
+        if other.count == 0:
+            return self
+        delta = other._mean - self._mean
+        self._mean += delta * other.count / count
+        self._m2 += other._m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def mean(self):
+        # Like the statistics module of CPython: at least one data point is required
+        if self.count < 1:
+            raise ValueError('mean requires at least one data point')
+        return self._mean
+
+    def variance(self):
+        # Like the statistics module of CPython: at least two data points are required
+        if self.count < 2:
+            raise ValueError('variance requires at least two data points')
+        return self._m2/(self.count - 1)
+
+    def pvariance(self):
+        if self.count < 1:
+            raise ValueError('pvariance requires at least one data point')
+        return self._m2/self.count
+
+    def stdev(self):
+        return math.sqrt(self.variance())
+
+    def pstdev(self):
+        return math.sqrt(self.pvariance())
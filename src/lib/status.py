@@ -1,52 +1,47 @@
 """File keeping track of the status of the brewery.
 
-The method state.update() should be called at a regular base, to make sure LEDs will blink.
+The LEDs are only updated when the state changes (set_state() or alert()): blinking is done by the PWM hardware.
 """
-import time
 try:
     from typing import Optional
 except ImportError:
     ...
-from machine import Pin, RTC
-from config import Config
-import uasyncio as asyncio
+from machine import Pin, PWM
+from config import get_config
+from localtime import Now, TIMESTAMP_SIZE, format_datetime
+from log_buffer import LogBuffer
 import uio
 
 # TODO: also send the info (and alert) messages (with color info) to the webpage info bar.
-# Note: update() is likely still needed in the boot process...
 
-BLINK_INTERVAL = 0.3  # Toggle blinking LEDs every 0.3 seconds
+BLINK_FREQUENCY = 2  # Blinking LEDs toggle every 0.25 seconds [Hz]
+DUTY_ON = 1023
+DUTY_BLINK = 512
 
 
 class Log(uio.StringIO):
-    """Log in memory.
-    The first (run-in) buffer is always kept.
-    And the last nr of buffers are also kept.
+    """Log in memory, with a fixed size.
+    The first (run-in) buffer is always kept: it stores the messages until it is full.
+    The rolling buffer keeps the last messages (the oldest messages are overwritten).
     """
-    BUFFER_SIZE = 30
-    NR_OF_ROLLING_BUFFERS = 2
+    RUN_IN_SIZE = 1024  # [bytes]
+    ROLLING_SIZE = 2048  # [bytes]
 
     def __init__(self):
-        self.run_in = list()
-        self.buffers = [list() for _ in range(self.NR_OF_ROLLING_BUFFERS)]
-        self.log = self.run_in
-        self.index = 0
+        self.run_in = LogBuffer(self.RUN_IN_SIZE, overwrite=False)
+        self.rolling = LogBuffer(self.ROLLING_SIZE)
 
     def write(self, s):
         """Add message to the log buffer."""
         if s.strip():
-            self.log.append(s)
-        if len(self.log) > self.BUFFER_SIZE:
-            self.index = (self.index + 1) % self.NR_OF_ROLLING_BUFFERS
-            self.log = self.buffers[self.index]
-            self.log.clear()
+            self.run_in.append(0, 'print', '%s', (s,))
+            if self.run_in.dropped:
+                self.rolling.append(0, 'print', '%s', (s,))
 
     def get(self):
-        """Get the logged messages."""
-        lines = self.run_in.copy()
-        for i in range(self.NR_OF_ROLLING_BUFFERS):
-            lines += self.buffers[(self.index + i + 1) % self.NR_OF_ROLLING_BUFFERS]
-        return lines #+ self.getvalue().split('\n')
+        """Get the logged messages: 'ticks LEVEL:logger:message' (see LogBuffer.lines())."""
+        return list(self.run_in.lines()) + list(self.rolling.lines())
+
 
 class _Status:
     RED = 1
@@ -54,8 +49,9 @@ class _Status:
     BLINK = 16
 
     def __init__(self):
-        self._alert = dict()
-        self.info = dict()
+        self._alert = dict()  # key -> [timestamp, message]
+        self.info = dict()  # key -> [timestamp, message]
+        self._now = Now()
         self.set_state('_Starting', self.RED | self.BLINK, 'Booting')
 
     def set_state(self, phase: str, color: int, info: str):
@@ -67,20 +63,12 @@ class _Status:
     def update(self, phase: str = None, color: int = None):
         """Update the status LEDs.
         params:
-            phase  if specified, force an update of the LEDs.
+            phase  the phase to set (or to remove, if no color is given).
         """
 
     def start_auto_update(self):
-        """Update (blink) the status LEDS automatically"""
+        """Signal that the brewery is ready (the LEDs blink by themselves: no task is needed)."""
         self.set_state('_Starting', self.GREEN, 'Ready')
-        loop = asyncio.get_event_loop()
-        loop.create_task(self._auto_update())
-
-    async def _auto_update(self) -> None:
-        """Update the status LEDs."""
-        while True:
-            self.update()
-            await asyncio.sleep(BLINK_INTERVAL)
 
     def set_info(self, key: str, message: str):
         """Store and log informational message.
@@ -88,9 +76,15 @@ class _Status:
         @param key      Message source.
         @param message  The message to store.
         """
-        now = list(RTC().datetime())
-        self.info[key] = ('%04d-%02d-%02d %02d:%02d:%02d' % (now[0], now[1], now[2], now[4], now[5], now[6]),
-                          message)
+        self._store(self.info, key, message)
+
+    def _store(self, messages: dict, key: str, message: str):
+        """Store the message with the current time (the timestamp of the key is reused)."""
+        entry = messages.get(key)
+        if entry is None:
+            entry = messages[key] = [bytearray(TIMESTAMP_SIZE), message]
+        entry[1] = message
+        format_datetime(self._now.update(), entry[0])
 
     def get_info(self):
         """Get all informational messages.
@@ -99,9 +93,9 @@ class _Status:
         """
         info = list()
         for key, value in self.info.items():
-            info.append((0, value[0], key, value[1]))
+            info.append((0, str(value[0], 'ascii'), key, value[1]))
         for key, value in self._alert.items():
-            info.append((1, value[0], key, value[1]))
+            info.append((1, str(value[0], 'ascii'), key, value[1]))
         return sorted(info)
 
     def alert(self, key: str, message: Optional[str]):
@@ -111,74 +105,65 @@ class _Status:
         @param message  The message to store. If None, the alert is served.
         """
         if message is None:
-            del self._alert[key]
+            self._alert.pop(key, None)
+            if not self._alert:
+                self.update('_Alert')
             return
-        if self._alert.get(key, (None, None))[1] == message:
+        entry = self._alert.get(key)
+        if entry is not None and entry[1] == message:
             return
-        now = list(RTC().datetime())
-        self._alert[key] = ('%04d-%02d-%02d %02d:%02d:%02d' % (now[0], now[1], now[2], now[4], now[5], now[6]),
-                            message)
+        self._store(self._alert, key, message)
+        self.update('_Alert', self.RED | self.BLINK)
         print('ALERT! %s: %s' % (key, message))
 
 
+class _Led():
+    """LED on a PWM output: off, on or blinking (the hardware blinks the LED)."""
+
+    def __init__(self, pin: int):
+        self._pwm = PWM(Pin(pin, Pin.OUT), freq=BLINK_FREQUENCY, duty=0)
+        self.duty = 0
+
+    def set(self, color: int):
+        """Set the LED off (0), on (a color) or blinking (a color with BLINK)."""
+        duty = 0 if not color else DUTY_BLINK if color & _Status.BLINK else DUTY_ON
+        if duty != self.duty:
+            self.duty = duty
+            self._pwm.duty(duty)
+
+
 class Status2Leds(_Status):
     """Test status, using single color LEDS, connected to the EPS digital output."""
 
     def __init__(self, red: str, green: str):
-        io_connections = Config('config.json').get('hardware')
-        self.red = Pin(int(io_connections.get(red)), Pin.OUT)
-        self.green = Pin(int(io_connections.get(green)), Pin.OUT)
-        self.red.value(0)
-        self.green.value(0)
-        self._last_update = 0
+        io_connections = get_config('config.json').get('hardware')
+        self.red = _Led(int(io_connections.get(red)))
+        self.green = _Led(int(io_connections.get(green)))
         self.phases = dict()
-        self._blink_on = True
-        self.prev_red_state = 0
-        self.prev_green_state = 0
         super().__init__()
 
     def update(self, phase: str = None, color: int = None):
-        """Update the status LEDs.
+        """Update the status LEDs: the last phase with a red (green) color sets the red (green) LED.
         params:
-            phase  if specified, force an update of the LEDs.
+            phase  the phase to set (or to remove, if no color is given).
         """
+        if phase is None:
+            return  # Nothing changed
         # Add the given phase at the end of the list (or remove it, if no color is given)
         if phase in self.phases:
             del self.phases[phase]
         if color:
             self.phases[phase] = color
 
-        now = time.time()
-        # take the abs difference, to be robust for jumps in time due to time synchronization
-        if phase is not None or abs(now - self._last_update) > BLINK_INTERVAL:
-            self._last_update = now
-            if phase is not None:
-                self._blink_on = True  # Force an update of the LEDs
-            else:
-                self._blink_on = not self._blink_on  # Toggle blink status
-
-            # Determine red and green LED state
-            red_state = 0
-            green_state = 0
-            for cur_color in self.phases.values():
-                if cur_color & self.RED:
-                    red_state = cur_color
-                if cur_color & self.GREEN:
-                    green_state = cur_color
-
-            if not self._blink_on:
-                # Set blinking LEDs off
-                if red_state & self.BLINK:
-                    red_state = 0
-                if green_state & self.BLINK:
-                    green_state = 0
-
-            if red_state != self.prev_red_state:
-                self.prev_red_state = red_state
-                self.red.value(red_state)
-            if green_state != self.prev_green_state:
-                self.prev_green_state = green_state
-                self.green.value(green_state)
+        red_state = 0
+        green_state = 0
+        for cur_color in self.phases.values():
+            if cur_color & self.RED:
+                red_state = cur_color
+            if cur_color & self.GREEN:
+                green_state = cur_color
+        self.red.set(red_state)
+        self.green.set(green_state)
 
 
 state = Status2Leds(red='led.red', green='led.green')
@@ -11,10 +11,21 @@ class PowerSwitch():
 
     def __init__(self, device_name: str, pin: int, callback: Callable[..., None]):
         self.device_name = device_name
+        self.pin_id = pin
         self.pin = Pin(pin, Pin.OUT)
         self.callback = callback
         self.state = None
 
+    def set_pin(self, pin: int):
+        """Move the switch to another output pin (the old pin is turned off)."""
+        if pin == self.pin_id:
+            return
+        self.pin.value(0)
+        self.pin_id = pin
+        self.pin = Pin(pin, Pin.OUT)
+        if self.state is not None:
+            self.pin.value(self.state)
+
     def turn_on(self):
         """Turn the heater on."""
         if self.state is not 1:
@@ -28,3 +39,61 @@ class PowerSwitch():
             self.state = 0
             self.pin.value(self.state)
             self.callback(**{self.device_name: 'OFF'})
+
+
+class MinimumTimeSwitch():
+    """Switch with a minimum on and off time (e.g. to protect the compressor of a fridge).
+    Every turn_on() or turn_off() is an update: the switch only toggles when it did not toggle for the minimum
+    number of updates.
+    """
+
+    def __init__(self, switch: PowerSwitch, min_on: int = 0, min_off: int = 0):
+        """Constructor.
+        params:
+            switch   The switch to control.
+            min_on   Minimum number of updates the switch stays on.
+            min_off  Minimum number of updates the switch stays off.
+        """
+        self.switch = switch
+        self.min_on = min_on
+        self.min_off = min_off
+        self.updates = max(min_on, min_off)  # Number of updates since the last toggle
+
+    def turn_on(self):
+        self.updates += 1
+        if self.switch.state != 1 and (self.switch.state is None or self.updates >= self.min_off):
+            self.switch.turn_on()
+            self.updates = 0
+
+    def turn_off(self):
+        self.updates += 1
+        if self.switch.state != 0 and (self.switch.state is None or self.updates >= self.min_on):
+            self.switch.turn_off()
+            self.updates = 0
+
+
+class TimeProportioning():
+    """Apply an output (0..1) to a switch, by switching it on during that part of a fixed window.
+    The output is taken at the start of every window, so the switch toggles at most twice per window.
+    """
+
+    def __init__(self, switch: PowerSwitch, window: int = 1):
+        """Constructor.
+        params:
+            switch  The switch to control.
+            window  Number of updates in a window.
+        """
+        self.switch = switch
+        self.window = max(1, window)
+        self.tick = 0
+        self.on_ticks = 0
+
+    def update(self, output: float):
+        """Update the switch, this should be called at a regular interval."""
+        if self.tick == 0:
+            self.on_ticks = round(output * self.window)
+        if self.tick < self.on_ticks:
+            self.switch.turn_on()
+        else:
+            self.switch.turn_off()
+        self.tick = (self.tick + 1) % self.window
@@ -1,20 +1,25 @@
 """File providing support to read and calibrate temperature measurements."""
 #import logging
-import math
 import time
 try:
     from typing import Callable, Dict, Optional
 except ImportError:
     ...
 from machine import Pin
-import uasyncio as asyncio
 import dht
 
 from analog_in import Adc, Ads1115, AnalogInESP32
+from calibration import Calibration
+from clock import Clock, SYSTEM_CLOCK
+import ntc
 
 #LOG = logging.getLogger('temperature')
 # LOG.setLevel(logging.INFO)
 
+CALIBRATION_MIN = -50.0  # The calculated temperature of raw value 0 of the calibration [°C]
+CALIBRATION_MAX = 150.0  # The calculated temperature of the highest raw value of the calibration [°C]
+CALIBRATION_RESOLUTION = 0.1  # Calculated temperature step of a raw value of the calibration [°C]
+
 
 class UnsupportedException(Exception):
     """Specified temperature sensor type is not (yet) supported."""
@@ -39,27 +44,33 @@ class TemperatureBase():
     The derived class must implement a '_read()' method that returns the measured temperature.
     """
 
-    def __init__(self, device_name: str, interval: float, callback: Callable[..., None]) -> None:
+    def __init__(self, device_name: str, interval: float, callback: Callable[..., None],
+                 clock: Clock = SYSTEM_CLOCK) -> None:
         """Constructor.
 
         params:
             interval: The interval to measure. [s]
             callback: Callable[[float], None]  Function which will be called every measurement.
+            clock:    The clock to wait for the next measurement.
         """
         self.device_name = device_name
         self.unit = '&deg;C'
         self.interval = interval
         self.callback = callback
+        self.clock = clock
         self.measurement: float = -273.15
 
     async def _read(self) -> float:
         """Read the raw value."""
         raise NotImplementedError
 
+    def configure(self, hardware_config: Dict[str, Dict[str, str]]):
+        """Apply a change of the hardware config (by default, a change is applied after a reset)."""
+
     async def run(self):
         """Collect and publish the temperature measurements."""
         while True:
-            await asyncio.sleep(self.interval)
+            await self.clock.sleep(self.interval)
 
             self.measurement = await self._read()
             if self.callback is not None:
@@ -76,7 +87,8 @@ class Dht22(TemperatureBase):
         The minimum interval for DHT22 is 2s.
     """
 
-    def __init__(self, device_name: str, hardware_config: Dict[str, Dict[str, str]], callback: Callable[..., None]):
+    def __init__(self, device_name: str, hardware_config: Dict[str, Dict[str, str]], callback: Callable[..., None],
+                 clock: Clock = SYSTEM_CLOCK):
         """
         params:
             callback: Callable[[float], None]  Function which will be called every measurement.
@@ -88,8 +100,8 @@ class Dht22(TemperatureBase):
         assert io_device == 'ESP', 'Only pins on the ESP are supported to read the DHT22'
         self.dht = dht.DHT22(Pin(int(pin)))
         # The minimal interval for the DHT22 is 2s (according to the spec).
-        self._start = time.ticks_ms()
-        super().__init__(device_name=device_name, interval=2, callback=callback)
+        self._start = clock.ticks_ms()
+        super().__init__(device_name=device_name, interval=2, callback=callback, clock=clock)
 
     async def _read(self):
         # DHT22 currently does not support asyncio...
@@ -97,12 +109,12 @@ class Dht22(TemperatureBase):
         # does support asyncio.
         for index in range(3, 0, -1):
             try:
-                delay_ms = time.ticks_diff(time.ticks_ms(), self._start)
+                delay_ms = time.ticks_diff(self.clock.ticks_ms(), self._start)
                 if delay_ms < (self.interval * 1e3):
                     print(f'Additional sleep_ms({(self.interval * 1e3) - delay_ms})')
-                    await asyncio.sleep_ms((self.interval * 1e3) - delay_ms)
+                    await self.clock.sleep_ms((self.interval * 1e3) - delay_ms)
                 self.dht.measure()
-                self._start = time.ticks_ms()
+                self._start = self.clock.ticks_ms()
                 break
             except OSError as ex:
                 # Even with a timeout of 3s, the OSError(E TIMEDOUT) exception is sometimes raised.
@@ -116,16 +128,30 @@ class Ntc(TemperatureBase):
     """Class to calculate the temperature based on an analog input measurement.
 
     The analog input measurement is the result of a voltage devision with a NCT and a known resistance.
+
+    Optionally (sensor config item "calibration": <filename>), the calculated temperature is corrected by a Calibration
+    of which the raw values are the calculated temperatures in steps of CALIBRATION_RESOLUTION from CALIBRATION_MIN.
+
+    Optionally (sensor config item "lut": <number of knots>), the temperature (including the calibration) is retrieved
+    from a lookup table instead of being calculated for every measurement. The table is stored in "<device_name>.lut"
+    and is rebuilt when the probe configuration changes (see configure()), or at the first measurement after the
+    calibration changes (once for a batch of changes).
     """
 
-    def __init__(self, device_name: str, hardware_config: Dict[str, Dict[str, str]], callback: Callable[..., None]) -> None:
+    def __init__(self, device_name: str, hardware_config: Dict[str, Dict[str, str]], callback: Callable[..., None],
+                 clock: Clock = SYSTEM_CLOCK) -> None:
         sensor_config = hardware_config[device_name]
         if sensor_config.get('device') != 'NTC':
             raise TypeError('invalid config')
-        probe = hardware_config[sensor_config['probe']]
-        self.r25 = float(probe['r25'])
-        self.b_value = float(probe['b_value'])
-        self.r_ref = float(sensor_config['r_ref'])
+        self.calibration: Optional[Calibration] = None
+        if 'calibration' in sensor_config:
+            self.calibration = Calibration(sensor_config['calibration'],
+                                           int((CALIBRATION_MAX - CALIBRATION_MIN) / CALIBRATION_RESOLUTION) + 1,
+                                           CALIBRATION_MIN, CALIBRATION_MAX)
+            self.calibration.add_callback(self._calibration_changed)
+        self.table: Optional[ntc.Table] = None
+        self._stale_table = False  # The calibration is changed, rebuild the table at the next measurement
+        self._configure(device_name, hardware_config)
 
         io_device, pin = sensor_config['pin'].split('.')
         device_config = hardware_config.get(io_device)
@@ -137,35 +163,61 @@ class Ntc(TemperatureBase):
             except TypeError as ex:
                 print(f'INFO: incompatible "{sensor.__name__}": {ex}')
         assert self.adc is not None, 'Failed to configure %s' % device_name
-        super().__init__(device_name=device_name, interval=0.3, callback=callback)
+        super().__init__(device_name=device_name, interval=0.3, callback=callback, clock=clock)
+
+    def _configure(self, device_name: str, hardware_config: Dict[str, Dict[str, str]]):
+        """Set the parameters of the probe, (re)build the lookup table when they are changed."""
+        sensor_config = hardware_config[device_name]
+        probe = hardware_config[sensor_config['probe']]
+        self.r25 = float(probe['r25'])
+        self.b_value = float(probe['b_value'])
+        self.r_ref = float(sensor_config['r_ref'])
+        if 'lut' in sensor_config:
+            # Loads the persisted table when the parameters match, else builds and stores it
+            self.table = ntc.Table(self.r_ref, self.r25, self.b_value, int(sensor_config['lut']),
+                                   correction=self._correct if self.calibration is not None else None,
+                                   filename='%s.lut' % device_name.replace(' ', '_'))
+        else:
+            self.table = None
+
+    def configure(self, hardware_config: Dict[str, Dict[str, str]]):
+        """Apply a change of the probe (e.g. a change of the hardware in config.json)."""
+        self._configure(self.device_name, hardware_config)
+
+    def _calibration_changed(self, *_):
+        self._stale_table = True
+
+    def _correct(self, temperature: float) -> float:
+        """Correct the calculated temperature with the calibration."""
+        if temperature == ntc.INVALID:
+            return temperature
+        return self.calibration.get((temperature - CALIBRATION_MIN) / CALIBRATION_RESOLUTION)
 
     async def _read(self):
         """Read the temperature."""
         # Read the ADC value and the reference
         raw_measurement = self.adc.read()
-        # calculate the NTC resistance:
-        # (v_ref - ADC) / R_ref = ADC / NTC => NTC = ADC * Rf / (v_ref - ADC)
-        # LOG.debug('raw_measurement: %s', raw_measurement)
-        # LOG.debug('r_ref: %s', self.r_ref)
-        # LOG.debug('r25: %s', self.r25)
-        # LOG.debug('b_value: %s', self.b_value)
-        try:
-            r_ntc = raw_measurement['raw'] * self.r_ref / (raw_measurement['ref_raw'] - raw_measurement['raw'])
-            # LOG.debug('r_ntc: %s', r_ntc)
-            return k2c(1.0 / ((math.log(r_ntc / self.r25)) / self.b_value + (1.0 / c2k(25))))
-        except (ValueError, ZeroDivisionError):
-            return k2c(0)
-
-
-def temperature(device_name: str, hardware_config: dict, callback: Callable[..., None]) -> TemperatureBase:
+        if self.table is not None:
+            if self._stale_table:
+                self._stale_table = False
+                self.table.rebuild()
+            return self.table.get(raw_measurement['raw'], raw_measurement['ref_raw'])
+        temperature = ntc.beta_temperature(raw_measurement['raw'], raw_measurement['ref_raw'],
+                                           self.r_ref, self.r25, self.b_value)
+        return temperature if self.calibration is None else self._correct(temperature)
+
+
+def temperature(device_name: str, hardware_config: dict, callback: Callable[..., None],
+                clock: Clock = SYSTEM_CLOCK) -> TemperatureBase:
     """Get an instance to measure the temperature for the given device.
 
     params:
         callback: Callable[[float], None]  Function which will be called every measurement.
+        clock:    The clock to wait for the next measurement.
     """
     for sensor in (Ntc, Dht22):
         try:
-            return sensor(device_name, hardware_config, callback)
+            return sensor(device_name, hardware_config, callback, clock)
         except TypeError:
             pass
     raise UnsupportedException(f'Wrong sensor configuration for {device_name}')
@@ -0,0 +1,144 @@
+"""Module controlling the temperature of the zones of the brewery: the kettle, the fridge, ...
+
+A zone has a temperature sensor, a target and one or more actuators: a heater and/or a cooler, each with its own
+control strategy. The control of all zones is evaluated by one task (every interval), the state of every zone is
+kept in its objects, so a tick does not create containers.
+
+usage:
+    control = TemperatureControl(interval=0.5)
+    control.add(Zone('kettle', kettle_sensor, recipe.get_target_temperature, [Actuator(kettle_switch, Pid(...))]))
+    control.add(Zone('fridge', fridge_sensor, None, [Actuator(compressor, direction=COOL, min_on=180, min_off=300),
+                                                     Actuator(fridge_heater)], deadband=1.0))
+    asyncio.create_task(control.run())
+"""
+try:
+    from typing import Callable, List, Optional
+except ImportError:
+    ...
+from clock import Clock, SYSTEM_CLOCK
+from controller import BangBang, Controller
+from switch import MinimumTimeSwitch, PowerSwitch, TimeProportioning
+from temperature import TemperatureBase
+
+HEAT = 1
+COOL = -1
+
+
+class Actuator():
+    """Heater or cooler of a zone, with its control strategy."""
+
+    def __init__(self, switch: PowerSwitch, controller: Optional[Controller] = None, direction: int = HEAT,
+                 min_on: float = 0, min_off: float = 0):
+        """Constructor.
+        params:
+            switch      The switch of the heater or cooler.
+            controller  Control strategy (default: bang-bang without hysteresis).
+            direction   HEAT or COOL: a cooler gets the output of the strategy for the mirrored temperatures.
+            min_on      Minimum time the switch stays on (e.g. of a compressor). [s]
+            min_off     Minimum time the switch stays off. [s]
+        """
+        self.switch = switch
+        self.controller = controller if controller is not None else BangBang()
+        self.direction = direction
+        self.min_on = min_on
+        self.min_off = min_off
+        self.output = 0.0
+        self._interval = 1.0
+        self._switch = switch
+        self._window = TimeProportioning(switch)
+
+    def setup(self, interval: float):
+        """Prepare the actuator to be updated every interval. [s]"""
+        self._interval = interval
+        if self.min_on or self.min_off:
+            self._switch = MinimumTimeSwitch(self.switch, round(self.min_on / interval), round(self.min_off / interval))
+        self._window = TimeProportioning(self._switch, round(self.controller.window / interval))
+
+    def update(self, temperature: float, target: float):
+        """Update the switch for the measured temperature."""
+        if self.direction == HEAT:
+            self.output = self.controller.update(temperature, target)
+        else:
+            self.output = self.controller.update(-temperature, -target)
+        window = max(1, round(self.controller.window / self._interval))
+        if window != self._window.window:  # E.g. autotuning completed
+            self._window = TimeProportioning(self._switch, window)
+        self._window.update(self.output)
+
+
+class Zone():
+    """Zone of which the temperature is controlled."""
+
+    def __init__(self, name: str, sensor: TemperatureBase, target: Optional[Callable[[float], Optional[float]]],
+                 actuators: List[Actuator], deadband: float = 0.0):
+        """Constructor.
+        params:
+            name       Name of the zone.
+            sensor     Temperature measurement device.
+            target     Function returning the target temperature for the measured temperature (e.g. of the recipe),
+                       None: the target is set with set_target().
+            actuators  The heaters and coolers.
+            deadband   Band around the target in which neither heating nor cooling starts. [°C]
+        """
+        self.name = name
+        self.sensor = sensor
+        self.target_source = target
+        self.actuators = actuators
+        self.deadband = deadband
+        self.manual_target: Optional[float] = None  # Overrides the target source
+        self.temperature: Optional[float] = None
+        self.target: Optional[float] = None
+
+    def set_target(self, temperature):
+        """Set the target temperature (None: use the target source)."""
+        self.manual_target = None if temperature is None else float(temperature)
+
+    def setup(self, interval: float):
+        """Prepare the zone to be updated every interval. [s]"""
+        for actuator in self.actuators:
+            actuator.setup(interval)
+
+    def update(self):
+        """Update the actuators for the measured temperature."""
+        temperature = self.sensor.get()
+        if self.manual_target is not None or self.target_source is None:
+            target = self.manual_target
+        else:
+            target = self.target_source(temperature)
+        self.temperature = temperature
+        self.target = target
+        if target is None:
+            return
+        for actuator in self.actuators:
+            actuator.update(temperature, target - actuator.direction * self.deadband / 2)
+
+
+class TemperatureControl():
+    """Control the temperature of all zones from one task."""
+
+    def __init__(self, interval: float = 0.5, clock: Clock = SYSTEM_CLOCK):
+        """Constructor.
+        params:
+            interval  Interval to update the zones. [s]
+            clock     The clock to wait for the next update.
+        """
+        self.interval = interval
+        self.clock = clock
+        self.zones: List[Zone] = list()
+
+    def add(self, zone: Zone) -> Zone:
+        """Add a zone to control."""
+        zone.setup(self.interval)
+        self.zones.append(zone)
+        return zone
+
+    def update(self):
+        """Update all zones."""
+        for zone in self.zones:
+            zone.update()
+
+    async def run(self):
+        """Control the temperature of the zones."""
+        while True:
+            self.update()
+            await self.clock.sleep(self.interval)
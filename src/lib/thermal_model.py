@@ -0,0 +1,208 @@
+"""First order plus dead time (FOPDT) model of a heated kettle, fitted online.
+
+The model of the temperature T with the heater output u (0..1):
+    tau * dT/dt = ambient - T + gain * u(t - dead_time)
+It is fitted on samples (every interval) by recursive least squares (RLS) of the discrete model
+    s[k+1] - s[k] = a * s[k] + b * u[k-d] + c        (s = T / SCALE: scaled for the precision of the floats)
+with a filter per candidate dead time d (0, interval, ... max_dead_time). The model uses the dead time of the filter
+with the smallest prediction error. The state is preallocated in arrays, so an update does not create containers.
+
+The model predicts the temperature the kettle coasts to when the heater is switched off (the heat that is stored in
+the heater element and the lag of the probe), and the time to reach a target temperature (ETA).
+A FOPDT model approximates the heater element by the dead time, so the predicted rise is corrected by the ratio of
+the measured and the predicted rise of the previous times the heater was switched off.
+
+usage:
+    model = ThermalModel(tick=0.5)
+    model.update(temperature, output)  # Every tick of the controller
+    model.predict(temperature)         # The highest temperature when the heater is switched off now [°C]
+    model.eta(temperature, target)     # The time to reach the target [s]
+"""
+from array import array
+import math
+try:
+    from typing import Optional
+except ImportError:
+    ...
+
+SCALE = 100.0  # [°C]
+P_START = 1000.0  # Initial covariance of the parameters
+P_MAX = 1e5  # The covariance is not increased (forgetting) above this trace: no windup without excitation
+MIN_RISE = 0.5  # The smallest predicted rise to measure the correction (after heating, not a short pulse) [°C]
+
+
+class ThermalModel():
+    """FOPDT model of a kettle, fitted by recursive least squares."""
+
+    def __init__(self, tick: float, interval: float = 10.0, max_dead_time: float = 300.0, forgetting: float = 0.998,
+                 maximum: float = 99.0, warmup: int = 30, horizon: float = 4 * 3600):
+        """Constructor.
+        params:
+            tick           Interval of update(). [s]
+            interval       Interval of the samples of the fit. [s]
+            max_dead_time  The longest candidate dead time. [s]
+            forgetting     Forgetting factor of the fit (per sample): the model follows changes of the kettle.
+            maximum        Samples above this temperature are not fitted (boiling: the heater does not raise it). [°C]
+            warmup         Number of samples before the model is used.
+            horizon        The longest ETA. [s]
+        """
+        self.interval = interval
+        self.forgetting = forgetting
+        self.maximum = maximum
+        self.warmup = warmup
+        self.horizon = int(horizon / interval)
+        self.count = int(max_dead_time / interval) + 1
+        self.samples = 0  # Number of samples fitted
+        self.best = 0  # Dead time of the best filter [samples]
+        self.rise = 0.0  # Temperature rise after the heater is switched off, by the FOPDT model [°C]
+        self.correction = 1.0  # Measured / predicted rise
+        self._output = 0.0  # Output of the previous tick
+        self._coasting = False  # The rise is measured: the heater was switched off
+        self._coast_start = 0.0  # Temperature when the heater was switched off [°C]
+        self._coast_peak = 0.0  # Highest temperature since the heater was switched off [°C]
+        self._coast_rise = 0.0  # The predicted rise when the heater was switched off [°C]
+        self._ticks_per_sample = max(1, round(interval / tick))
+        self._ticks = 0
+        self._sum = 0.0  # Sum of the output during the current sample
+        self._last = -1.0  # Scaled temperature of the previous sample (-1: none)
+        self._theta = array('f', (0.0 for _ in range(3 * self.count)))  # a, b and c per filter
+        self._p = array('f', (0.0 for _ in range(9 * self.count)))  # Covariance (3x3) per filter
+        for index in range(self.count):
+            for diagonal in (0, 4, 8):
+                self._p[9 * index + diagonal] = P_START
+        self._errors = array('f', (0.0 for _ in range(self.count)))  # Mean squared prediction error per filter
+        self._inputs = array('f', (0.0 for _ in range(self.count)))  # Ring buffer of the output per sample
+        self._head = 0  # Index of the output of the last sample
+        self._phi = array('f', (0.0, 0.0, 1.0))
+        self._gain = array('f', (0.0, 0.0, 0.0))
+
+    @property
+    def ready(self) -> bool:
+        """The model is fitted and the heater raises the temperature."""
+        return self.samples >= self.warmup and self._theta[3 * self.best + 1] > 0
+
+    @property
+    def dead_time(self) -> float:
+        """Dead time of the kettle. [s]"""
+        return self.best * self.interval
+
+    @property
+    def tau(self) -> float:
+        """Time constant of the kettle (inf: no losses were measured). [s]"""
+        a = self._theta[3 * self.best]
+        return -self.interval / math.log(1 + a) if -1 < a < 0 else float('inf')
+
+    @property
+    def gain(self) -> float:
+        """Temperature rise at full power, in equilibrium (inf: no losses were measured). [°C]"""
+        a = self._theta[3 * self.best]
+        return -self._theta[3 * self.best + 1] / a * SCALE if a < 0 else float('inf')
+
+    def _input(self, age: int) -> float:
+        """Get the output of a previous sample (0: the last sample)."""
+        return self._inputs[(self._head - age) % self.count]
+
+    def update(self, temperature: float, output: float):
+        """Add the measured temperature and the output of the heater (0..1) of a tick."""
+        self._measure_rise(temperature, output)
+        self._sum += output
+        self._ticks += 1
+        if self._ticks < self._ticks_per_sample:
+            return
+        self._head = (self._head + 1) % self.count
+        self._inputs[self._head] = self._sum / self._ticks
+        self._sum = 0.0
+        self._ticks = 0
+        scaled = temperature / SCALE
+        if 0 <= self._last and temperature <= self.maximum:
+            self._fit(self._last, scaled - self._last)
+        self._last = scaled
+        self._update_rise(scaled)
+
+    def _fit(self, scaled: float, change: float):
+        """Update the filters with a sample: the change of the scaled temperature after the scaled temperature."""
+        phi = self._phi
+        gain = self._gain
+        theta = self._theta
+        p = self._p
+        phi[0] = scaled
+        best = 0
+        for index in range(self.count):
+            phi[1] = self._input(index)
+            t = 3 * index
+            m = 9 * index
+            for row in range(3):  # gain = P.phi
+                gain[row] = p[m + 3 * row] * phi[0] + p[m + 3 * row + 1] * phi[1] + p[m + 3 * row + 2] * phi[2]
+            forgetting = self.forgetting if p[m] + p[m + 4] + p[m + 8] < P_MAX else 1.0
+            denominator = forgetting + phi[0] * gain[0] + phi[1] * gain[1] + phi[2] * gain[2]
+            error = change - (theta[t] * phi[0] + theta[t + 1] * phi[1] + theta[t + 2])
+            for row in range(3):
+                theta[t + row] += gain[row] * error / denominator
+            for row in range(3):  # P = (P - P.phi.phi'.P / denominator) / forgetting
+                for column in range(3):
+                    p[m + 3 * row + column] = (p[m + 3 * row + column] - gain[row] * gain[column] / denominator) / \
+                        forgetting
+            self._errors[index] += 0.005 * (error * error - self._errors[index])
+            if self._errors[index] < self._errors[best]:
+                best = index
+        self.samples += 1
+        if self.samples == self.warmup:
+            print(f'INFO: thermal model: dead time={best * self.interval:.0f}s')
+        self.best = best
+
+    def _update_rise(self, scaled: float):
+        """Calculate the temperature rise when the heater is switched off now: the outputs during the dead time."""
+        t = 3 * self.best
+        a = self._theta[t]
+        b = self._theta[t + 1]
+        c = self._theta[t + 2]
+        start = scaled
+        peak = scaled
+        for age in range(self.best - 1, -1, -1):
+            scaled += a * scaled + b * self._input(age) + c
+            if scaled > peak:
+                peak = scaled
+        self.rise = (peak - start) * SCALE
+
+    def _measure_rise(self, temperature: float, output: float):
+        """Measure the rise of the temperature after the heater is switched off, to correct the predicted rise."""
+        previous = self._output
+        self._output = output
+        if not output and previous and self.ready and self.rise >= MIN_RISE and temperature < self.maximum:
+            self._coasting = True
+            self._coast_start = self._coast_peak = temperature
+            self._coast_rise = self.rise
+            return
+        if self._coasting:
+            self._coast_peak = max(self._coast_peak, temperature)
+            if output:  # Switched on before the peak
+                self._coasting = False
+            elif temperature < self._coast_peak - 0.1:  # The peak is passed
+                ratio = (self._coast_peak - self._coast_start) / self._coast_rise
+                self.correction += 0.8 * (min(max(ratio, 0.5), 4.0) - self.correction)
+                self._coasting = False
+
+    def predict(self, temperature: float) -> float:
+        """Get the highest temperature, when the heater is switched off now. [°C]"""
+        return temperature + self.rise * self.correction if self.ready else temperature
+
+    def eta(self, temperature: float, target: float) -> Optional[int]:
+        """Get the time to reach the target: heating at full power, or cooling with the heater off.
+        Returns None when the model predicts that the target is not reached within the horizon. [s]
+        """
+        if not self.ready:
+            return None
+        t = 3 * self.best
+        a = self._theta[t]
+        b = self._theta[t + 1]
+        c = self._theta[t + 2]
+        heating = target > temperature
+        scaled = temperature / SCALE
+        goal = target / SCALE
+        output = 1.0 if heating else 0.0
+        for step in range(self.horizon):
+            if (scaled >= goal) if heating else (scaled <= goal):
+                return int(step * self.interval)
+            age = self.best - 1 - step
+            scaled += a * scaled + b * (self._input(age) if age >= 0 else output) + c
+        return None
@@ -0,0 +1,243 @@
+"""On-flash time series of the measurements of the brew session, with rollups per minute and per 10 minutes.
+
+Every sensor has a file per tier in the folder of the store:
+    <sensor_id>.0    the measurements of the current stage: time delta [0.1s], value
+    <sensor_id>.60   rollup per minute: time delta [s], minimum, mean, maximum
+    <sensor_id>.600  rollup per 10 minutes: time delta [s], minimum, mean, maximum
+A record contains the time since the previous record in the file, so all records of a file have the same small size.
+A marker record (delta 0xffff) contains the absolute time [s]. It is written before the first record after a reset,
+and when the time since the previous record does not fit in the delta.
+
+The records are collected in a block in RAM, a full block is appended to the file (see flush()).
+When a file exceeds its limit, the oldest half of the records is dropped.
+When a new stage starts, the measurements of the previous stages are dropped: these are kept in the rollups.
+
+usage:
+    store = TimeSeries('history')
+    store.record(**{'kettle temperature': 65.3})  # Like MQTTClient.publish(), values that are not numbers are ignored
+    store.new_stage()
+    for moment, minimum, mean, maximum in store.query('kettle temperature', start, end):
+        ...
+"""
+try:
+    from typing import Dict, Iterator, List, Optional, Tuple
+except ImportError:
+    ...
+import os
+import struct
+
+from clock import Clock, SYSTEM_CLOCK
+
+TIERS = (0, 60, 600)  # Period of the rollup of every tier (0: measurements) [s]
+RAW = '<Hf'  # time delta [0.1s], value
+ROLLUP = '<Hfff'  # time delta [s], minimum, mean, maximum
+MARKER = 0xffff
+MARKER_TIME = '<I'  # Absolute time of a marker record [s] (after the delta)
+
+
+class _Tier():
+    """The file of a tier of a sensor."""
+
+    def __init__(self, filename: str, period: int, limit: int, block_size: int) -> None:
+        """Constructor.
+        params:
+            filename    The file of the tier.
+            period      Period of the rollup (0: measurements). [s]
+            limit       Maximum number of records in the file.
+            block_size  Size of the block of records in RAM. [bytes]
+        """
+        self.filename = filename
+        self.period = period
+        self.limit = limit
+        self.record = ROLLUP if period else RAW
+        self.size = struct.calcsize(self.record)
+        self.scale = 1 if period else 10  # time units per second
+        self._block = bytearray(max(1, block_size // self.size) * self.size)
+        self.count = 0  # Number of records in the block
+        self.last: Optional[int] = None  # Time of the last record [time units] (None: a marker is needed)
+        # Values of the current rollup period
+        self._start: Optional[int] = None
+        self._minimum = self._maximum = self._total = 0.0
+        self._values = 0
+
+    def add(self, moment: float, value: float):
+        """Add a measurement (a rollup is added when its period has passed)."""
+        if not self.period:
+            self._append(moment, (value,))
+            return
+        start = int(moment) - int(moment) % self.period
+        if start != self._start:
+            if self._values:
+                self._append(self._start, (self._minimum, self._total / self._values, self._maximum))
+            self._start = start
+            self._minimum = self._maximum = value
+            self._total = 0.0
+            self._values = 0
+        self._minimum = min(self._minimum, value)
+        self._maximum = max(self._maximum, value)
+        self._total += value
+        self._values += 1
+
+    def _append(self, moment: float, values: tuple):
+        """Add a record to the block."""
+        ticks = int(round(moment * self.scale))
+        if self.last is None or not 0 <= ticks - self.last < MARKER:
+            seconds = ticks // self.scale
+            struct.pack_into('<H', self._block, self.count * self.size, MARKER)
+            struct.pack_into(MARKER_TIME, self._block, self.count * self.size + 2, seconds)
+            self.last = seconds * self.scale
+            self._next()
+        struct.pack_into(self.record, self._block, self.count * self.size, ticks - self.last, *values)
+        self.last = ticks
+        self._next()
+
+    def _next(self):
+        self.count += 1
+        if self.count * self.size == len(self._block):
+            self.flush()
+
+    def flush(self):
+        """Append the records of the block to the file."""
+        if self.count == 0:
+            return
+        with open(self.filename, 'ab') as file:
+            file.write(memoryview(self._block)[:self.count * self.size])
+        self.count = 0
+        if os.stat(self.filename)[6] > self.limit * self.size:
+            self._compact()
+
+    def _compact(self):
+        """Drop the oldest half of the records of the file."""
+        old = self.filename + '.old'
+        os.rename(self.filename, old)
+        drop = os.stat(old)[6] // self.size - self.limit // 2
+        self.last = None
+        for index, (moment, values) in enumerate(self._read(old)):
+            if index >= drop:
+                self._append(moment, values)
+        self.flush()
+        os.remove(old)
+
+    def clear(self):
+        """Remove all records."""
+        self.count = 0
+        self.last = None
+        try:
+            os.remove(self.filename)
+        except OSError:
+            pass
+
+    def _read(self, filename: str) -> Iterator[Tuple[float, tuple]]:
+        """Get the time and the values of all records in the file (markers are skipped)."""
+        chunk = bytearray(32 * self.size)
+        ticks = 0
+        try:
+            file = open(filename, 'rb')
+        except OSError:
+            return
+        with file:
+            while True:
+                size = file.readinto(chunk)
+                if not size:
+                    return
+                for offset in range(0, size - self.size + 1, self.size):
+                    record = struct.unpack_from(self.record, chunk, offset)
+                    if record[0] == MARKER:
+                        ticks = struct.unpack_from(MARKER_TIME, chunk, offset + 2)[0] * self.scale
+                        continue
+                    ticks += record[0]
+                    yield ticks / self.scale, record[1:]
+
+    def read(self) -> Iterator[Tuple[float, float, float, float]]:
+        """Get the (time, minimum, mean, maximum) of all records, oldest first."""
+        self.flush()
+        for moment, values in self._read(self.filename):
+            if self.period:
+                yield moment, values[0], values[1], values[2]
+            else:
+                yield moment, values[0], values[0], values[0]
+
+    def first(self) -> Optional[float]:
+        """Get the time of the first record."""
+        for moment, _ in self._read(self.filename):
+            return moment
+        return None
+
+
+class TimeSeries():
+    """Store of the measurements of the sensors."""
+
+    def __init__(self, folder: str = 'history', limits: Tuple[int, int, int] = (8192, 1440, 4320),
+                 block_size: int = 256, clock: Clock = SYSTEM_CLOCK) -> None:
+        """Constructor.
+        params:
+            folder      The folder of the files.
+            limits      Maximum number of records per file of every tier (default: 8192 measurements,
+                        24 hours per minute and 30 days per 10 minutes).
+            block_size  Size of the block of records in RAM, per file. [bytes]
+            clock       The clock of the timestamps.
+        """
+        self.folder = folder
+        self.limits = limits
+        self.block_size = block_size
+        self.clock = clock
+        self._sensors: Dict[str, List[_Tier]] = dict()
+        try:
+            os.mkdir(folder)
+        except OSError:
+            pass
+
+    def _tiers(self, sensor_name: str) -> List[_Tier]:
+        tiers = self._sensors.get(sensor_name)
+        if tiers is None:
+            sensor_id = sensor_name.replace(' ', '_')
+            tiers = self._sensors[sensor_name] = [
+                _Tier(f'{self.folder}/{sensor_id}.{period}', period, limit, self.block_size)
+                for period, limit in zip(TIERS, self.limits)]
+        return tiers
+
+    def record(self, **measurements):
+        """Store the measurements (values that are not numbers are ignored)."""
+        moment = self.clock.time()
+        for sensor_name, value in measurements.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                for tier in self._tiers(sensor_name):
+                    tier.add(moment, float(value))
+
+    def new_stage(self):
+        """Drop the measurements of the previous stages (of all sensors), the rollups are kept."""
+        self.flush()
+        for filename in os.listdir(self.folder):
+            if filename.endswith('.0'):
+                os.remove(f'{self.folder}/{filename}')
+        for tiers in self._sensors.values():
+            tiers[0].clear()
+
+    def flush(self):
+        """Write the records in RAM to the files."""
+        for tiers in self._sensors.values():
+            for tier in tiers:
+                tier.flush()
+
+    def query(self, sensor_name: str, start: float = 0, end: Optional[float] = None
+              ) -> Iterator[Tuple[float, float, float, float]]:
+        """Get the (time, minimum, mean, maximum) of the sensor from start until end, oldest first.
+        Every period is taken from the finest tier that has data of that period: a measurement gives
+        (time, value, value, value), a rollup gives the start of its period (if the period ends before the data
+        of the finer tiers starts).
+        """
+        tiers = self._tiers(sensor_name)
+        until = end
+        ranges = list()
+        for tier in tiers:
+            tier.flush()
+            first = tier.first()
+            if first is not None and (end is None or first < end):
+                ranges.append((tier, until))
+                until = first if until is None else min(first, until)
+        for tier, until in reversed(ranges):  # Coarse (oldest) first
+            for record in tier.read():
+                if until is not None and (record[0] + tier.period > until if tier.period else record[0] >= until):
+                    break
+                if record[0] >= start:
+                    yield record
@@ -9,24 +9,43 @@ Functionality:
 * TODO: Add recipe handling for the beer to brew.
 * TODO: Support control switch to acknowledge manual actions in the brew process.
 * TODO: Control the kettle temperature.
-* TODO: Add fridge control.
-
+* Control the fridge temperature (when configured: "fridge control").
+
+Optional sections of config.json (the feature is disabled when its section is missing):
+    "fridge control": {"target": "18", "deadband": "1",
+                       "cooling": {"strategy": "bang-bang", "hysteresis": "0.5", "min_on": "180", "min_off": "300"},
+                       "heating": {"strategy": "bang-bang", "hysteresis": "0.5"}}
+        Keep the fridge at the target with the "fridge switch" (and the "fridge heater switch").
+    "history": {"folder": "history", "limits": ["8192", "1440", "4320"]}
+        Keep the measurements in a time series on flash (see time_series).
+    "kettle control": {..., "model": {"interval": "10", "max dead time": "300", "hysteresis": "0.5"}}
+        Coast the kettle onto the target with a model of the kettle (see thermal_model), a heating stage of the recipe
+        starts when the kettle coasts onto its target.
+    "mqtt": {..., "offline log": {"filename": "offline.log", "block_size": "512", "blocks": "16"}}
+        Keep the measurements while the connection is down in a log on flash (see ring_log), and publish them after
+        the reconnect. The log preallocates blocks * block_size bytes.
 """
 try:
-    from typing import Callable, List, Union  # to please lint...
+    from typing import Callable, List, Optional, Union  # to please lint...
 except ImportError:
     ...
 import uasyncio as asyncio
 import micropython
 
 micropython.alloc_emergency_exception_buf(100)
-from kettle import KettleControl
+from clock import Clock, SYSTEM_CLOCK
+from localtime import Localtime
+import controller
 from switch import PowerSwitch
+from temperature_control import COOL, HEAT, Actuator, TemperatureControl, Zone
 from mqtt import MQTTClient
+from ring_log import RingLog
 from temperature import temperature as TemperatureSensor
-from recipe5 import get_recipe
+from time_series import TimeSeries
+from recipe import load as load_recipe
+from reducer import Hampel, Reducer
 
-from config import Config
+from config import get_config
 
 
 class DeployCallbacks:
@@ -41,13 +60,17 @@ class DeployCallbacks:
 
 
 class ReduceCallbacks:
-    """Collect measurements and forward the average of the measurements once per `nr_of_measurements`."""
+    """Collect measurements and forward the reduced value of the measurements once per `nr_of_measurements`.
+    By default, the reduced value is the mean without outliers (measurement errors).
+    """
 
-    def __init__(self, sensor_name: str, callback: Callable[..., None], nr_of_measurements: int = 1) -> None:
+    def __init__(self, sensor_name: str, callback: Callable[..., None], nr_of_measurements: int = 1,
+                 reducer: Optional[Reducer] = None) -> None:
         self.sensor_name = sensor_name
         self.callback = callback
         self.index = 0
-        self.measurements = [0.0 for _ in range(max(1, nr_of_measurements))]
+        self.reducer = reducer if reducer is not None else Hampel()
+        self.reducer.resize(nr_of_measurements)
 
     def __call__(self, **measurements):
         """Collect the measurement."""
@@ -55,11 +78,10 @@ class ReduceCallbacks:
             if sensor_name != self.sensor_name:
                 print(f'ERROR: sensor "{sensor_name}" was not expected!')
                 continue
-            self.measurements[self.index] = value
+            self.reducer.add(value)
             self.index += 1
-            if self.index >= len(self.measurements):
-                # TODO: use mode to remove outliers (measurement errors)
-                self.callback(**{self.sensor_name: sum(self.measurements) / len(self.measurements)})
+            if self.index >= self.reducer.size:
+                self.callback(**{self.sensor_name: self.reducer.get()})
                 self.index = 0
 
     def set_nr_of_measurements(self, value: Union[int, float]):
@@ -67,60 +89,133 @@ class ReduceCallbacks:
         Note: all collected measurements will be flushed.
         """
         self.index = 0
-        self.measurements = [0.0 for _ in range(max(1, int(value)))]
+        self.reducer.resize(value)
 
-async def main():
+
+async def main(clock: Clock = SYSTEM_CLOCK):
     """Main brewery task.
 
     This task manely creates the different tasks for the brewery to operate and monitors the state of those tasks.
+    params:
+        clock  The clock of the recipe, the sensors and the controllers (e.g. a virtual clock for simulations).
     """
-    network_config = Config('network_config.json')
-    config = Config('config.json')
-
-    mqtt_server = MQTTClient(config['mqtt']['server_ip'], config['project_name'],
-                             ssid=network_config['ssid'], wifi_pw=network_config['__password'])
+    network_config = get_config('network_config.json')
+    config = get_config('config.json')
+
+    mqtt_config = config['mqtt']
+    offline_log = None
+    if 'offline log' in mqtt_config:
+        log_config = mqtt_config['offline log']
+        offline_log = RingLog(log_config.get('filename', 'offline.log'), block_size=int(log_config.get('block_size', 512)),
+                              blocks=int(log_config.get('blocks', 16)))
+    mqtt_server = MQTTClient(mqtt_config['server_ip'], config['project_name'],
+                             ssid=network_config['ssid'], wifi_pw=network_config['__password'],
+                             rate=float(mqtt_config.get('rate', 5)), burst=int(mqtt_config.get('burst', 20)),
+                             offline_log=offline_log, bulk_cycle=float(mqtt_config.get('bulk cycle', 0)))
+    for sensor_name, deadband in mqtt_config.get('deadband', dict()).items():
+        mqtt_server.set_deadband(sensor_name, float(deadband['change']), float(deadband['interval']))
+    publish = mqtt_server.publish
+    history = None
+    history_config = config.get('history')
+    if history_config:
+        history = TimeSeries(history_config.get('folder', 'history'),
+                             limits=tuple(int(limit) for limit in history_config.get('limits', (8192, 1440, 4320))),
+                             clock=clock)
+        publish = DeployCallbacks([mqtt_server.publish, history.record])
+
+    def publish_recipe(**measurements):
+        publish(**measurements)
+        if history is not None and 'recipe_info' in measurements:  # A stage is started
+            history.new_stage()
 
     sensor_name = 'environment temperature'
     mqtt_server.add_device(sensor_name, 'temperature', '°C')
-    reduce_environment_temperature = ReduceCallbacks(sensor_name, callback=mqtt_server.publish)
+    reduce_environment_temperature = ReduceCallbacks(sensor_name, callback=publish)
     environment_temperature_sensor = TemperatureSensor(sensor_name, hardware_config=config['hardware'],
-                                                       callback=reduce_environment_temperature)
+                                                       callback=reduce_environment_temperature, clock=clock)
     reduce_environment_temperature.set_nr_of_measurements(10 / environment_temperature_sensor.interval)
 
     sensor_name = 'kettle temperature'
     mqtt_server.add_device(sensor_name, 'temperature', '°C')
-    reduce_kettle_temperature = ReduceCallbacks(sensor_name, callback=mqtt_server.publish)
+    reduce_kettle_temperature = ReduceCallbacks(sensor_name, callback=publish)
     kettle_temperature_sensor = TemperatureSensor(sensor_name, hardware_config=config['hardware'],
-                                                  callback=reduce_kettle_temperature)
+                                                  callback=reduce_kettle_temperature, clock=clock)
     reduce_kettle_temperature.set_nr_of_measurements(10 / kettle_temperature_sensor.interval)
 
     actuator_name = 'kettle switch'
     mqtt_server.add_device(actuator_name, 'outlet')
-    recipe = get_recipe(callback=mqtt_server.publish)
-    mqtt_server.add_device('target temperature', 'temperature', '°C', recipe.set_target_temperature) # TODO: this is related to get_recipe...
+    temperature_control = TemperatureControl(interval=0.5, clock=clock)
+    kettle_controller = controller.create(config.get('kettle control', dict()), interval=temperature_control.interval)
+    recipe = load_recipe(config.get('recipe', 'recipe5.json'), callback=publish_recipe, clock=clock,
+                         cadence=int(config.get('recipe cadence', 60)),
+                         model=getattr(kettle_controller, 'model', None))  # The kettle model of the coasting control
+    mqtt_server.add_device('target temperature', 'temperature', '°C', recipe.set_target_temperature) # TODO: this is related to the recipe...
     mqtt_server.add_device('recipe', 'actions', None)
     mqtt_server.add_device('recipe_ack_action', 'action', None, recipe.ack_action)
     mqtt_server.add_device('recipe_stage', 'action', None, recipe.set_stage)
-    kettle_control = KettleControl(kettle_temperature_sensor,
-                                   PowerSwitch(actuator_name, int(config['hardware']['kettle switch']),
-                                               callback=mqtt_server.publish),
-                                   recipe)
+    mqtt_server.add_device('recipe_restart', 'action', None, recipe.restart)
+    kettle_switch = PowerSwitch(actuator_name, int(config['hardware']['kettle switch']), callback=mqtt_server.publish)
+    switches = [kettle_switch]
+    sensors = [environment_temperature_sensor, kettle_temperature_sensor]
+
+    def hardware_changed(_, hardware):
+        if hardware:
+            for switch in switches:
+                switch.set_pin(int(hardware[switch.device_name]))
+            for sensor in sensors:
+                sensor.configure(hardware)
+    config.add_callback(hardware_changed, 'hardware')
+    temperature_control.add(Zone('kettle', kettle_temperature_sensor, recipe.get_target_temperature,
+                                 [Actuator(kettle_switch, kettle_controller)]))
+
+    fridge_config = config.get('fridge control')
+    if fridge_config:  # The fridge is controlled by the same task as the kettle
+        sensor_name = 'fridge temperature'
+        mqtt_server.add_device(sensor_name, 'temperature', '°C')
+        reduce_fridge_temperature = ReduceCallbacks(sensor_name, callback=publish)
+        fridge_temperature_sensor = TemperatureSensor(sensor_name, hardware_config=config['hardware'],
+                                                      callback=reduce_fridge_temperature, clock=clock)
+        reduce_fridge_temperature.set_nr_of_measurements(10 / fridge_temperature_sensor.interval)
+        sensors.append(fridge_temperature_sensor)
+        asyncio.create_task(fridge_temperature_sensor.run())
+        actuators = list()
+        for actuator_name, direction, settings in (('fridge switch', COOL, fridge_config.get('cooling')),
+                                                   ('fridge heater switch', HEAT, fridge_config.get('heating'))):
+            if settings is None:
+                continue
+            mqtt_server.add_device(actuator_name, 'outlet')
+            switch = PowerSwitch(actuator_name, int(config['hardware'][actuator_name]), callback=mqtt_server.publish)
+            switches.append(switch)
+            actuators.append(Actuator(switch, controller.create(settings, interval=temperature_control.interval),
+                                      direction, min_on=float(settings.get('min_on', 0)),
+                                      min_off=float(settings.get('min_off', 0))))
+        fridge = temperature_control.add(Zone('fridge', fridge_temperature_sensor, None, actuators,
+                                              deadband=float(fridge_config.get('deadband', 0))))
+        fridge.set_target(fridge_config.get('target', 18))
+        mqtt_server.add_device('fridge target temperature', 'temperature', '°C', fridge.set_target)
 
     asyncio.create_task(mqtt_server.run())
     asyncio.create_task(environment_temperature_sensor.run())
     asyncio.create_task(kettle_temperature_sensor.run())
-    asyncio.create_task(kettle_control.run())
+    asyncio.create_task(temperature_control.run())
 
     uptime = 0
     while True:
-        await asyncio.sleep(10)
+        await clock.sleep(10)
         uptime += 10
         uptime_str = f'{uptime//3600}:{(uptime//60)%60:02}:{uptime%60:02}'
         mqtt_server.publish(uptime=uptime_str)
 
 
+async def run():
+    """Run the brewery on the local time, which is synchronized with SNTP in the background."""
+    localtime = Localtime()
+    asyncio.create_task(localtime.run())
+    await main(localtime)
+
+
 if __name__ == '__main__':
     try:
-        asyncio.run(main())
+        asyncio.run(run())
     finally:
         asyncio.new_event_loop()
@@ -0,0 +1,138 @@
+"""Stand-ins to run the brewery software on the host (CPython).
+
+Import this package before any brewery module, e.g. from the src folder:
+    import simulation
+    import analog_in
+
+The MicroPython specific modules (machine, uasyncio, ads1x15, ...) are replaced by the fakes in this folder,
+and the MicroPython extensions of the time module (ticks_ms(), sleep_ms(), ...) are added.
+
+The simulated time runs `speedup` times faster than real time: time.time(), the ticks and all (uasyncio) sleeps
+are scaled. Alternatively, use_virtual_time() creates an event loop on virtual time: whenever no task is ready,
+the time jumps to the next timer deadline, so the simulation runs as fast as the host can execute it.
+See run.py to run the complete brewery with simulated hardware.
+"""
+import asyncio  # Import the CPython packages before lib shadows logging and statistics
+import os
+import selectors
+import sys
+import time
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+for _path in (os.path.dirname(_HERE), os.path.join(os.path.dirname(_HERE), 'lib'), _HERE):
+    if _path not in sys.path:
+        sys.path.insert(0, _path)
+
+_TICKS_PERIOD = 1 << 30
+_real_time = time.time
+
+speedup = 1.0
+_real_start = time.monotonic()
+_simulated_start = _real_time()
+_virtual_loop = None
+
+
+def now() -> float:
+    """Get the simulated time. [s]"""
+    if _virtual_loop is not None:
+        return _virtual_loop.start + _virtual_loop.virtual_time
+    return _simulated_start + (time.monotonic() - _real_start) * speedup
+
+
+def real(duration: float) -> float:
+    """Convert a simulated duration to a duration of the event loop. [s]"""
+    return duration if _virtual_loop is not None else duration / speedup
+
+
+def set_speedup(factor: float):
+    """Run the simulated time the given factor faster than real time (this ends the virtual time)."""
+    global speedup, _real_start, _simulated_start, _virtual_loop  # pylint: disable=global-statement
+    _simulated_start = now()
+    _real_start = time.monotonic()
+    _virtual_loop = None
+    speedup = factor
+
+
+class _VirtualSelector(selectors.DefaultSelector):
+    """Selector that never blocks: the time of the loop jumps instead of waiting for the timeout."""
+
+    def __init__(self):
+        super().__init__()
+        self.loop = None
+
+    def select(self, timeout=None):
+        events = super().select(0)
+        if not events and timeout != 0:
+            if timeout is None:
+                raise RuntimeError('virtual time: all tasks are waiting, but there is no timer pending')
+            self.loop.virtual_time += timeout
+        return events
+
+
+class VirtualTimeLoop(asyncio.SelectorEventLoop):
+    """Event loop on virtual time: when no task is ready, the time jumps to the next timer deadline.
+
+    The time of the loop starts at 0, a large start time (like time.time()) would lose the precision of the
+    (small) timeouts.
+    """
+
+    def __init__(self, start: float):
+        """Constructor.
+        params:
+            start  The simulated time at virtual time 0. [s]
+        """
+        self.start = start
+        self.virtual_time = 0.0
+        selector = _VirtualSelector()
+        super().__init__(selector)
+        selector.loop = self
+
+    def time(self):
+        return self.virtual_time
+
+    def sleep(self, duration: float):
+        """Blocking sleep: the time passes, without running the other tasks."""
+        self.virtual_time += duration
+
+
+def use_virtual_time() -> VirtualTimeLoop:
+    """Run the simulated time on a new event loop on virtual time, starting at the current simulated time."""
+    global _virtual_loop  # pylint: disable=global-statement
+    _virtual_loop = VirtualTimeLoop(now())
+    asyncio.set_event_loop(_virtual_loop)
+    return _virtual_loop
+
+
+def _sleep(duration: float):
+    """Blocking sleep for a simulated duration. [s]"""
+    if _virtual_loop is not None:
+        _virtual_loop.sleep(duration)
+    else:
+        time.sleep(duration / speedup)
+
+
+def ticks_ms():
+    return int(now() * 1e3) % _TICKS_PERIOD
+
+
+def ticks_us():
+    return int(now() * 1e6) % _TICKS_PERIOD
+
+
+def ticks_add(ticks, delta):
+    return (ticks + delta) % _TICKS_PERIOD
+
+
+def ticks_diff(ticks1, ticks2):
+    diff = (ticks1 - ticks2) % _TICKS_PERIOD
+    return diff - _TICKS_PERIOD if diff >= _TICKS_PERIOD // 2 else diff
+
+
+time.time = now
+time.ticks_ms = ticks_ms
+time.ticks_us = ticks_us
+time.ticks_cpu = ticks_us
+time.ticks_add = ticks_add
+time.ticks_diff = ticks_diff
+time.sleep_ms = lambda ms: _sleep(ms / 1e3)
+time.sleep_us = lambda us: _sleep(us / 1e6)
@@ -0,0 +1,79 @@
+"""Fake ADS1115 driver, providing the API of https://github.com/robert-hh/ads1x15."""
+import asyncio
+import time
+
+from machine import Pin
+import simulation
+
+RATES = (8, 16, 32, 64, 128, 250, 475, 860)  # Data rates of the ADS1115 [samples/s]
+_REGISTER_CONVERT = 0
+_REGISTER_CONFIG = 1
+_OS_NOTBUSY = 0x8000
+
+
+class Chip():
+    """Fake ADS1115 chip connected to the I2C bus.
+
+    Every input is a value or a callable returning the raw value, e.g.:
+        machine.SoftI2C.devices[0x48] = Chip([1000, 2000, 0, 13000])
+    If alert is given, that pin is triggered at the end of a conversion (ALERT/RDY).
+    """
+
+    def __init__(self, inputs=None, alert=None):
+        self.inputs = list(inputs) if inputs is not None else [0, 0, 0, 0]
+        self.alert = alert
+        self.conversions = 0
+        self.result = 0
+        self._ready_at = 0.0
+
+    def convert(self, channel: int) -> int:
+        """Convert the given input to a raw value."""
+        self.conversions += 1
+        value = self.inputs[channel]
+        return int(value() if callable(value) else value)
+
+    def start(self, rate: int, channel: int):
+        """Start a single shot conversion."""
+        duration = 1 / RATES[rate]
+        self.result = self.convert(channel)
+        self._ready_at = time.time() + duration
+        if self.alert is not None:
+            asyncio.get_event_loop().call_later(simulation.real(duration), Pin.trigger, self.alert)
+
+    def busy(self) -> bool:
+        """Check whether a conversion is in progress."""
+        return time.time() < self._ready_at
+
+
+class ADS1115():
+    """Fake driver for the ADS1115."""
+
+    def __init__(self, i2c, address=0x48, gain=1):
+        self.chip = i2c.device(address)
+        self.gain = gain
+        self.mode = (4, 0)
+
+    def read(self, rate=4, channel1=0, channel2=None):
+        """Read the voltage between a channel and GND, blocking for the conversion time."""
+        time.sleep_ms(1000 / RATES[rate])
+        return self.chip.convert(channel1)
+
+    def set_conv(self, rate=4, channel1=0, channel2=None):
+        """Set the mode for read_rev()."""
+        self.mode = (rate, channel1)
+
+    def read_rev(self):
+        """Read the previous conversion and start the next conversion."""
+        result = self.chip.result
+        self.chip.start(*self.mode)
+        return result
+
+    def _read_register(self, register):
+        if register == _REGISTER_CONFIG:
+            return 0 if self.chip.busy() else _OS_NOTBUSY
+        if register == _REGISTER_CONVERT:
+            return self.chip.result & 0xffff
+        return 0
+
+    def _write_register(self, register, value):
+        pass
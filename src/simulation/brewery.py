@@ -0,0 +1,88 @@
+"""Couple the thermal models of the kettle and the fridge to the fake hardware of the brewery."""
+import math
+import random
+import time
+
+import uasyncio as asyncio
+from machine import Pin, SoftI2C
+from ads1x15.ads1x15 import Chip
+import dht
+
+from plant import Fridge, Kettle
+
+ADS1115_ADDRESS = 0x48
+SUPPLY_RAW = 26400  # Raw value of the 3.3V supply of the voltage dividers (ADS1115 gain 1: 4.096V full scale)
+
+
+class Brewery():
+    """The simulated brewery.
+
+    The kettle is heated by the "kettle switch" output, the fridge is controlled by the "fridge switch" and
+    "fridge heater switch" outputs.
+    The temperatures of the models are measured by the NTC's on the (fake) ADS1115, with noise.
+    The ambient temperature is measured by the (fake) DHT22.
+    """
+
+    def __init__(self, hardware_config: dict, ambient: float = 20.0, noise: float = 3.0, seed: int = 8) -> None:
+        """Constructor.
+        params:
+            hardware_config  The "hardware" config of config.json.
+            ambient          Ambient temperature. [°C]
+            noise            Standard deviation of the noise of the ADS1115 measurements. [raw]
+            seed             Seed of the random noise, to get reproducible simulations.
+        """
+        self.kettle = Kettle(ambient=ambient)
+        self.fridge = Fridge(ambient=ambient)
+        self.ambient = ambient
+        self.noise = noise
+        self.random = random.Random(seed)
+        self.kettle_switch = int(hardware_config['kettle switch'])
+        self.fridge_switch = int(hardware_config['fridge switch'])
+        self.fridge_heater_switch = int(hardware_config['fridge heater switch'])
+        self.toggles = dict()  # pin -> number of toggles
+        self._levels = dict()
+        dht.environment['temperature'] = ambient
+
+        probes = dict(kettle=lambda: self.kettle.probe, fridge=lambda: self.fridge.probe)
+        inputs = [0, 0, 0, 0]
+        for name, sensor_config in hardware_config.items():
+            if not isinstance(sensor_config, dict):
+                continue
+            if sensor_config.get('device') == 'ADS1115' and 'u_ref.pin' in sensor_config:
+                inputs[int(sensor_config['u_ref.pin'])] = int(SUPPLY_RAW / float(sensor_config['u_ref.gain']))
+            elif sensor_config.get('device') == 'NTC':
+                probe = hardware_config[sensor_config['probe']]
+                temperature = probes.get(name.split(' ')[0], lambda: self.ambient)
+                inputs[int(sensor_config['pin'].split('.')[-1])] = self._ntc(
+                    temperature, float(sensor_config['r_ref']), float(probe['r25']), float(probe['b_value']))
+        SoftI2C.devices[ADS1115_ADDRESS] = Chip(inputs)
+
+    def _ntc(self, temperature, r_ref: float, r25: float, b_value: float):
+        """Get a function returning the raw ADC value of the voltage divider with the NTC."""
+        def raw():
+            kelvin = temperature() + 273.15
+            r_ntc = r25 * math.exp(b_value * (1 / kelvin - 1 / 298.15))
+            return SUPPLY_RAW * r_ntc / (r_ntc + r_ref) + self.random.gauss(0, self.noise)
+        return raw
+
+    def _level(self, pin: int) -> int:
+        """Get the level of an output, and count the toggles."""
+        level = Pin.levels.get(pin, 0)
+        if level != self._levels.get(pin, 0):
+            self.toggles[pin] = self.toggles.get(pin, 0) + 1
+        self._levels[pin] = level
+        return level
+
+    def step(self, duration: float):
+        """Simulate the given duration. [s]"""
+        self.kettle.step(duration, self._level(self.kettle_switch))
+        self.fridge.step(duration, self._level(self.fridge_switch), self._level(self.fridge_heater_switch))
+
+    async def run(self, interval: float = 1.0):
+        """Simulate the brewery (in simulated time)."""
+        last = time.time()
+        while True:
+            await asyncio.sleep(interval)
+            now = time.time()
+            self.step(now - last)
+            last = now
@@ -0,0 +1,22 @@
+"""Fake dht module. The simulation sets the measured values in `environment`."""
+
+environment = dict(temperature=20.0, humidity=60.0)
+
+
+class DHT22():
+    """Fake DHT22 temperature and humidity sensor."""
+
+    def __init__(self, pin):
+        self.pin = pin
+        self._temperature = None
+        self._humidity = None
+
+    def measure(self):
+        self._temperature = round(environment['temperature'], 1)
+        self._humidity = round(environment['humidity'], 1)
+
+    def temperature(self):
+        return self._temperature
+
+    def humidity(self):
+        return self._humidity
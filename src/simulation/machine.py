@@ -0,0 +1,145 @@
+"""Fake machine module with the hardware used by the brewery."""
+import time
+
+
+class Pin():
+    """Fake GPIO pin.
+    The level of every pin is kept in `Pin.levels`, so the simulation can read the outputs and set the inputs.
+    """
+    IN = 1
+    OUT = 3
+    PULL_UP = 2
+    PULL_DOWN = 1
+    IRQ_FALLING = 2
+    IRQ_RISING = 1
+    levels = dict()  # pin number -> level
+    _irqs = dict()  # pin number -> (pin, handler)
+
+    def __init__(self, pin, mode=IN, pull=None, value=None):
+        self.pin = pin
+        self.mode = mode
+        if value is not None:
+            self.value(value)
+
+    def value(self, value=None):
+        """Get or set the value of the pin."""
+        if value is None:
+            return Pin.levels.get(self.pin, 0)
+        Pin.levels[self.pin] = 1 if value else 0
+        return None
+
+    def on(self):
+        self.value(1)
+
+    def off(self):
+        self.value(0)
+
+    def irq(self, handler=None, trigger=IRQ_FALLING):
+        """Call the handler when the simulation triggers the pin."""
+        Pin._irqs[self.pin] = (self, handler)
+
+    @staticmethod
+    def trigger(pin: int):
+        """Simulate an edge on the given pin."""
+        if pin in Pin._irqs:
+            instance, handler = Pin._irqs[pin]
+            handler(instance)
+
+
+class PWM():
+    """Fake PWM output (ESP32 LEDC): the output is high during duty/1024 of every period.
+    The output of a pin is kept in `PWM.outputs`, its level follows the simulated time (see value()).
+    """
+    outputs = dict()  # pin number -> PWM
+
+    def __init__(self, pin: Pin, freq: int = 5000, duty: int = 512):
+        self.pin = pin.pin
+        self._freq = freq
+        self._duty = duty
+        self.changes = 0  # Number of changes of the frequency or the duty cycle
+        PWM.outputs[self.pin] = self
+
+    def freq(self, value=None):
+        """Get or set the frequency. [Hz]"""
+        if value is None:
+            return self._freq
+        self._freq = value
+        self.changes += 1
+        return None
+
+    def duty(self, value=None):
+        """Get or set the duty cycle (0..1023)."""
+        if value is None:
+            return self._duty
+        self._duty = value
+        self.changes += 1
+        return None
+
+    def deinit(self):
+        PWM.outputs.pop(self.pin, None)
+
+    def value(self) -> int:
+        """Get the level of the output at the (simulated) time."""
+        if self._duty <= 0 or self._duty >= 1023:
+            return 1 if self._duty else 0
+        return 1 if time.time() * self._freq % 1 < self._duty / 1024 else 0
+
+
+class ADC():
+    """Fake ADC of the ESP32. The measured value is set with `ADC.values[pin] = raw`."""
+    ATTN_0DB = 0
+    ATTN_11DB = 3
+    values = dict()
+
+    def __init__(self, pin: Pin):
+        self.pin = pin.pin
+
+    def atten(self, attenuation):
+        pass
+
+    def read(self, *_):
+        return ADC.values.get(self.pin, 0)
+
+
+class SoftI2C():
+    """Fake I2C bus. Connected devices are registered with `SoftI2C.devices[address] = device`."""
+    devices = dict()
+
+    def __init__(self, scl: Pin, sda: Pin, freq=400000):
+        self.scl = scl
+        self.sda = sda
+
+    def scan(self):
+        return sorted(SoftI2C.devices)
+
+    def device(self, address):
+        """Get the (fake) device at the given address."""
+        return SoftI2C.devices[address]
+
+
+I2C = SoftI2C
+
+
+class RTC():
+    """Fake realtime clock, running on the simulated time."""
+    _offset = 0.0
+
+    def datetime(self):
+        """Get (year, month, day, weekday, hours, minutes, seconds, subseconds)."""
+        now = time.time() + RTC._offset
+        local = time.localtime(now)
+        return (local.tm_year, local.tm_mon, local.tm_mday, local.tm_wday,
+                local.tm_hour, local.tm_min, local.tm_sec, int(now % 1 * 1000))
+
+    def init(self, datetime):
+        """Set the clock to (year, month, day, weekday, hours, minutes, seconds, subseconds)."""
+        year, month, day, _, hours, minutes, seconds = datetime[:7]
+        RTC._offset = time.mktime((year, month, day, hours, minutes, seconds, 0, 0, -1)) - time.time()
+
+
+def unique_id():
+    return b'\x24\x0a\xc4\x00\x00\x01'
+
+
+def reset():
+    raise SystemExit('machine.reset()')
@@ -0,0 +1,36 @@
+"""Clock of which the time is set by a test, e.g. to run a recipe or a controller tick by tick."""
+from clock import Clock
+
+
+class ManualClock(Clock):
+    """Clock that only advances when the test sets `now` (or sleeps on it).
+    `now` is the monotonic time, `offset` the offset of the wall time (e.g. a synchronization of the time changes it).
+    """
+
+    def __init__(self, now: float = 1_700_000_000, offset: float = 0.0) -> None:
+        """Constructor.
+        params:
+            now     The monotonic time. [s]
+            offset  The wall time minus the monotonic time. [s]
+        """
+        super().__init__()
+        self.now = now
+        self.offset = offset
+
+    def time(self) -> float:
+        return self.now + self.offset
+
+    def ticks_ms(self) -> int:
+        return int(self.now * 1000) & ((1 << 30) - 1)
+
+    def monotonic_ms(self) -> int:
+        return int(self.now * 1000)
+
+    def monotonic(self) -> float:
+        return self.now
+
+    async def sleep(self, seconds: float):
+        self.now += seconds
+
+    async def sleep_ms(self, ms: int):
+        self.now += ms / 1000
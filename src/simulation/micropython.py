@@ -0,0 +1,13 @@
+"""Fake micropython module."""
+
+
+def const(value):
+    return value
+
+
+def alloc_emergency_exception_buf(size):
+    pass
+
+
+def mem_info(*_):
+    pass
@@ -0,0 +1,107 @@
+"""Fake mqtt_as (https://github.com/peterhinch/micropython-mqtt), connected to an in-memory broker."""
+import time
+
+import uasyncio as asyncio
+
+config = dict(server=None, port=0, ssid=None, wifi_pw=None, keepalive=60, subs_cb=lambda *_: None,
+              wifi_coro=None, connect_coro=None)
+
+
+def _match(pattern: str, topic: str) -> bool:
+    """Check whether the topic matches the subscription pattern (with + and # wildcards)."""
+    pattern_levels = pattern.split('/')
+    topic_levels = topic.split('/')
+    for index, level in enumerate(pattern_levels):
+        if level == '#':
+            return True
+        if index >= len(topic_levels) or (level not in ('+', topic_levels[index])):
+            return False
+    return len(pattern_levels) == len(topic_levels)
+
+
+class Broker():
+    """In-memory stand-in of a MQTT broker.
+
+    All published messages are kept in `messages` as (time, topic, msg, retain).
+    Listeners (callable(topic, msg, retain)) are called for every published message.
+    disconnect() and reconnect() simulate a broken connection of the clients (e.g. WiFi down).
+    Every publish of a client takes `latency` seconds.
+    """
+
+    def __init__(self):
+        self.messages = list()
+        self.retained = dict()
+        self.clients = list()
+        self.listeners = list()
+        self.online = True
+        self.latency = 0.0
+
+    def disconnect(self):
+        """Disconnect all clients: publishing clients wait until reconnect()."""
+        self.online = False
+        for client in self.clients:
+            client._connected = False  # pylint: disable=protected-access
+
+    def reconnect(self):
+        """Reconnect all clients (which calls their connect_coro)."""
+        self.online = True
+        for client in self.clients:
+            client._reconnect()  # pylint: disable=protected-access
+
+    def publish(self, topic: str, msg, retain: bool = False):
+        """Publish a message to all subscribed clients."""
+        if isinstance(msg, (bytes, bytearray)):
+            msg = bytes(msg).decode()
+        self.messages.append((time.time(), topic, msg, retain))
+        if retain:
+            self.retained[topic] = msg
+        for listener in self.listeners:
+            listener(topic, msg, retain)
+        for client in self.clients:
+            client.deliver(topic, msg, False)
+
+
+broker = Broker()
+
+
+class MQTTClient():
+    """Fake MQTT client."""
+    DEBUG = False
+
+    def __init__(self, client_config: dict):
+        self._config = dict(client_config)
+        self.subscriptions = list()
+        self._connected = False
+
+    async def connect(self):
+        while not broker.online:
+            await asyncio.sleep(1)
+        self._connected = True
+        broker.clients.append(self)
+        if self._config.get('connect_coro') is not None:
+            await self._config['connect_coro'](self)
+
+    def _reconnect(self):
+        self._connected = True
+        if self._config.get('connect_coro') is not None:
+            asyncio.create_task(self._config['connect_coro'](self))
+
+    def isconnected(self) -> bool:
+        return self._connected
+
+    async def subscribe(self, topic, qos=0):
+        topic = topic.decode() if isinstance(topic, bytes) else topic
+        if topic not in self.subscriptions:
+            self.subscriptions.append(topic)
+
+    async def publish(self, topic, msg, retain=False, qos=0):
+        """Publish a message, like mqtt_as: wait until the connection is restored."""
+        while not self._connected:
+            await asyncio.sleep(1)
+        await asyncio.sleep(broker.latency)
+        broker.publish(topic.decode() if isinstance(topic, bytes) else topic, msg, retain)
+
+    def deliver(self, topic: str, msg: str, retained: bool):
+        """Deliver a message from the broker to the subscription callback."""
+        if any(_match(pattern, topic) for pattern in self.subscriptions):
+            self._config['subs_cb'](topic.encode(), msg.encode(), retained)
@@ -0,0 +1,17 @@
+"""Fake network module, always connected."""
+STA_IF = 0
+AP_IF = 1
+
+
+class WLAN():
+    def __init__(self, interface=STA_IF):
+        self.interface = interface
+
+    def active(self, *args):
+        return True
+
+    def isconnected(self):
+        return True
+
+    def ifconfig(self):
+        return ('192.168.1.31', '255.255.255.0', '192.168.1.1', '192.168.1.1')
@@ -0,0 +1,5 @@
+"""Fake ntptime module, the (simulated) time is always synchronized."""
+
+
+def settime():
+    pass
@@ -0,0 +1,84 @@
+"""Thermal models of the brewery, to simulate the temperature faster than real time."""
+
+
+class Kettle():
+    """Lumped thermal model of a kettle with an electric heater element and a NTC probe.
+
+    The heater element has its own heat capacity, so the water keeps heating up after the heater is switched off.
+    The probe follows the water temperature with a first order lag.
+    """
+
+    def __init__(self, volume: float = 25.0, power: float = 3000.0, temperature: float = 20.0,
+                 ambient: float = 20.0) -> None:
+        """Constructor.
+        params:
+            volume       Volume of water. [l]
+            power        Power of the heater. [W]
+            temperature  Initial temperature. [°C]
+            ambient      Ambient temperature. [°C]
+        """
+        self.power = power
+        self.ambient = ambient
+        self.water_capacity = volume * 4186.0  # [J/K]
+        self.element_capacity = 8000.0  # Heater element and bottom of the kettle [J/K]
+        self.element_transfer = 100.0  # Heater element to water [W/K]
+        self.loss = 8.0  # Water to ambient [W/K]
+        self.chiller = 0.0  # Wort chiller, water to cooling water [W/K]
+        self.cooling_water = 12.0  # [°C]
+        self.probe_lag = 30.0  # Time constant of the probe [s]
+        self.water = temperature
+        self.element = temperature
+        self.probe = temperature
+
+    def step(self, duration: float, heating: float):
+        """Simulate the given duration [s] with the given heater output (0..1)."""
+        steps = max(1, int(duration / 0.5))
+        dt = duration / steps
+        for _ in range(steps):
+            transfer = self.element_transfer * (self.element - self.water)
+            self.element += dt * (heating * self.power - transfer) / self.element_capacity
+            losses = self.loss * (self.water - self.ambient) + self.chiller * (self.water - self.cooling_water)
+            self.water += dt * (transfer - losses) / self.water_capacity
+            self.water = min(self.water, 100.0)  # Boiling
+            self.probe += dt * (self.water - self.probe) / self.probe_lag
+
+
+class Fridge():
+    """Lumped thermal model of a fermentation fridge with a compressor and a heater.
+
+    The compressor and heater exchange heat with the air in the fridge, the air exchanges heat with the wort.
+    The probe measures the wort temperature (in a thermowell) with a first order lag.
+    """
+
+    def __init__(self, volume: float = 20.0, cooling: float = 80.0, heating: float = 60.0,
+                 temperature: float = 20.0, ambient: float = 20.0) -> None:
+        """Constructor.
+        params:
+            volume       Volume of wort. [l]
+            cooling      Heat extracted by the compressor. [W]
+            heating      Power of the heater. [W]
+            temperature  Initial temperature. [°C]
+            ambient      Ambient temperature. [°C]
+        """
+        self.cooling = cooling
+        self.heating = heating
+        self.ambient = ambient
+        self.wort_capacity = volume * 4186.0  # [J/K]
+        self.air_capacity = 6000.0  # Air and inner walls [J/K]
+        self.air_transfer = 5.0  # Air to wort [W/K]
+        self.loss = 1.5  # Air to ambient [W/K]
+        self.probe_lag = 60.0  # Time constant of the probe [s]
+        self.wort = temperature
+        self.air = temperature
+        self.probe = temperature
+
+    def step(self, duration: float, cooling: float, heating: float):
+        """Simulate the given duration [s] with the given compressor and heater output (0..1)."""
+        steps = max(1, int(duration / 0.5))
+        dt = duration / steps
+        for _ in range(steps):
+            transfer = self.air_transfer * (self.air - self.wort)
+            power = heating * self.heating - cooling * self.cooling - self.loss * (self.air - self.ambient)
+            self.air += dt * (power - transfer) / self.air_capacity
+            self.wort += dt * transfer / self.wort_capacity
+            self.probe += dt * (self.wort - self.probe) / self.probe_lag
@@ -0,0 +1,151 @@
+"""Run the complete brewery (main.main() with the recipe) on the host, with a simulated kettle and fridge.
+
+usage (from the src folder):
+    python -m simulation.run [--speedup 500 | --virtual] [--hours 5] [--opt-in]
+
+The brewery runs in a temporary folder with a copy of config.json (with --opt-in: and the OPT_IN sections). The output of the brewery is written to
+brewery.log in that folder. A simulated operator acknowledges the actions of the recipe
+(and starts the wort chiller when the wort should be cooled).
+With --virtual, the brewery runs on virtual time: the simulation runs as fast as the host can execute it.
+"""
+import argparse
+import contextlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from typing import Optional
+
+import simulation
+import uasyncio as asyncio
+from mqtt_as.mqtt_as import broker
+from brewery import Brewery
+from config import get_config
+
+SRC = os.path.dirname(simulation._HERE)  # pylint: disable=protected-access
+OPT_IN = {  # The features which config.json does not enable
+    'fridge control': {'target': '18', 'deadband': '1',
+                       'cooling': {'strategy': 'bang-bang', 'hysteresis': '0.5', 'min_on': '180', 'min_off': '300'},
+                       'heating': {'strategy': 'bang-bang', 'hysteresis': '0.5'}},
+    'history': {'folder': 'history', 'limits': ['8192', '1440', '4320']},
+    'kettle control': {'model': {'interval': '10', 'max dead time': '300', 'hysteresis': '0.5'}}}
+
+
+class Operator():
+    """Simulated brewer: acknowledges the actions requested by the recipe."""
+
+    def __init__(self, brewery, broker, base_topic: str, delay: float = 60.0) -> None:
+        """Constructor.
+        params:
+            delay  Time to perform the action. [s]
+        """
+        self.brewery = brewery
+        self.broker = broker
+        self.base_topic = base_topic
+        self.delay = delay
+        self.pending = None
+        self.acknowledged = None
+        self.stages = list()  # (time, message, kettle temperature)
+        self.finished = None
+        broker.listeners.append(self.on_message)
+
+    def on_message(self, topic: str, msg: str, retain: bool):
+        """Follow the progress of the recipe."""
+        if topic == f'{self.base_topic}/recipe_info':
+            self.stages.append((time.time(), msg, self.brewery.kettle.water))
+            if msg.startswith('start stage 8'):  # Cooling, the last stage of the recipe
+                self.finished.set()
+        elif (topic == f'{self.base_topic}/recipe' and msg.startswith('Action:') and self.pending is None and
+              msg != self.acknowledged):  # The last state of the recipe might be published after the acknowledge
+            self.pending = msg
+            asyncio.get_event_loop().call_later(simulation.real(self.delay), self.acknowledge)
+
+    def acknowledge(self):
+        """Perform the pending action and acknowledge it."""
+        self.stages.append((time.time(), self.pending, self.brewery.kettle.water))
+        if 'cooling' in self.pending:
+            self.brewery.kettle.chiller = 300.0
+        self.acknowledged = self.pending
+        self.pending = None
+        self.broker.publish(f'{self.base_topic}/config', 'recipe_ack_action')
+
+
+async def simulate(hours: float, log):
+    """Run main.main() with the simulated brewery."""
+    config = get_config('config.json')
+    brewery = Brewery(config['hardware'])
+    operator = Operator(brewery, broker, config['project_name'])
+    operator.finished = asyncio.Event()
+    with contextlib.redirect_stdout(log):
+        import main  # pylint: disable=import-outside-toplevel  # status.py reads config.json at import
+        tasks = [asyncio.create_task(brewery.run()), asyncio.create_task(main.main())]
+        try:
+            await asyncio.wait_for(operator.finished.wait(), hours * 3600)
+        except asyncio.TimeoutError:
+            pass
+        tasks = asyncio.all_tasks() - {asyncio.current_task()}  # Including the tasks created by main.main()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    return brewery, operator, broker
+
+
+def _merge(config: dict, settings: dict):
+    """Merge the settings into the config (recursively)."""
+    for key, value in settings.items():
+        if isinstance(value, dict) and isinstance(config.get(key), dict):
+            _merge(config[key], value)
+        else:
+            config[key] = value
+
+
+def run(speedup: float = 500, hours: float = 5, virtual: bool = False, settings: Optional[dict] = None):
+    """Simulate a brew day and report the progress.
+    params:
+        speedup   Simulated time / real time (ignored for virtual time).
+        hours     Maximum simulated duration.
+        virtual   Run on virtual time (see simulation.use_virtual_time()).
+        settings  Settings to merge into the copy of config.json (e.g. OPT_IN).
+    """
+    folder = tempfile.mkdtemp(prefix='brewery_')
+    with open(os.path.join(SRC, 'config.json')) as file:
+        config = json.load(file)
+    _merge(config, settings or dict())
+    with open(os.path.join(folder, 'config.json'), 'w') as file:
+        json.dump(config, file)
+    shutil.copy(os.path.join(SRC, 'recipe5.json'), folder)
+    with open(os.path.join(folder, 'network_config.json'), 'w') as file:
+        file.write(json.dumps(dict(ssid='simulation', __password='')))
+    os.chdir(folder)
+    if virtual:
+        loop = simulation.use_virtual_time()
+    else:
+        simulation.set_speedup(speedup)
+        loop = asyncio.new_event_loop()
+    start = time.time()
+    real_start = time.monotonic()
+    try:
+        with open('brewery.log', 'w') as log:
+            brewery, operator, broker = loop.run_until_complete(simulate(hours, log))
+    finally:
+        loop.close()
+    print(f'Simulated {(time.time() - start) / 3600:.2f}h in {time.monotonic() - real_start:.1f}s (log: {folder})')
+    for moment, message, temperature in operator.stages:
+        print(f'{(moment - start) / 60:6.1f} min  kettle: {temperature:5.1f} C  {message}')
+    print(f'MQTT messages: {len(broker.messages)}, kettle switch toggles: {brewery.toggles.get(brewery.kettle_switch, 0)}')
+    print(f'fridge: {brewery.fridge.wort:.1f} C, compressor toggles: {brewery.toggles.get(brewery.fridge_switch, 0)},'
+          f' heater toggles: {brewery.toggles.get(brewery.fridge_heater_switch, 0)}')
+    return brewery, operator, broker
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--speedup', type=float, default=500, help='simulated time / real time')
+    parser.add_argument('--virtual', action='store_true', help='run on virtual time, as fast as possible')
+    parser.add_argument('--hours', type=float, default=5, help='maximum simulated duration')
+    parser.add_argument('--opt-in', action='store_true', help='enable the features of OPT_IN')
+    arguments = parser.parse_args()
+    settings = OPT_IN if arguments.opt_in else None
+    sys.exit(0 if run(arguments.speedup, arguments.hours, arguments.virtual, settings)[1].finished.is_set() else 1)
@@ -0,0 +1,45 @@
+"""Fake uasyncio: CPython asyncio extended with the MicroPython specific functions.
+All sleeps and timeouts are in simulated time.
+"""
+import asyncio
+from asyncio import *  # pylint: disable=wildcard-import,unused-wildcard-import
+from asyncio import Event
+
+import simulation
+
+
+def sleep(seconds, *args):
+    """Sleep for the given (simulated) number of seconds."""
+    return asyncio.sleep(simulation.real(seconds), *args)
+
+
+def sleep_ms(ms):
+    """Sleep for the given (simulated) number of milliseconds."""
+    return asyncio.sleep(simulation.real(ms / 1e3))
+
+
+def wait_for(awaitable, timeout):
+    """Wait for the awaitable to complete, with a timeout in (simulated) seconds."""
+    return asyncio.wait_for(awaitable, None if timeout is None else simulation.real(timeout))
+
+
+def wait_for_ms(awaitable, timeout):
+    """Wait for the awaitable to complete, with a timeout in (simulated) milliseconds."""
+    return asyncio.wait_for(awaitable, simulation.real(timeout / 1e3))
+
+
+class ThreadSafeFlag():
+    """Flag that can be set from an interrupt handler."""
+
+    def __init__(self):
+        self._event = Event()
+
+    def set(self):
+        self._event.set()
+
+    def clear(self):
+        self._event.clear()
+
+    async def wait(self):
+        await self._event.wait()
+        self._event.clear()
@@ -0,0 +1,2 @@
+"""Fake ubinascii module."""
+from binascii import *  # pylint: disable=wildcard-import,unused-wildcard-import
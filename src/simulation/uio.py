@@ -0,0 +1,2 @@
+"""Fake uio module."""
+from io import *  # pylint: disable=wildcard-import,unused-wildcard-import
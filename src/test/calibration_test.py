@@ -0,0 +1,112 @@
+"""Test and benchmark the calibration module.
+
+The benchmark compares the (previous) linear walk through the calibration points with the binary search.
+It runs on the target, or on the host from the src folder: `python test/calibration_test.py`
+
+>>> import calibration_test
+>>> calibration_test.test()
+>>> calibration_test.benchmark()  # measured on the host (CPython)
+points:    2  linear:     0.9 us/get  bisect:     0.4 us/get
+points:   50  linear:     2.1 us/get  bisect:     0.8 us/get
+points: 1000  linear:    53.7 us/get  bisect:     2.3 us/get
+"""
+from collections import OrderedDict
+import json
+import os
+import sys
+import time
+
+sys.path.append('lib')  # Support running on the host from the src folder
+
+from calibration import Calibration
+
+STEPS = 2 ** 15
+FILENAME = 'calibration_test_%d.json'  # A file per size: the calibration files are shared (see get_config())
+
+try:
+    ticks_us = time.ticks_us  # pylint: disable=no-member
+    ticks_diff = time.ticks_diff  # pylint: disable=no-member
+except AttributeError:  # CPython
+    def ticks_us():
+        return int(time.perf_counter() * 1e6)
+
+    def ticks_diff(end, start):
+        return end - start
+
+
+def linear_get(steps: OrderedDict, raw_value: int) -> float:
+    """Reference implementation (the previous Calibration.get()): walk all calibration points in order.
+    params:
+        steps  The calibration points, sorted by the raw value: raw value -> temperature.
+    """
+    keys = list(steps)
+    lower = keys[0]
+    higher = keys[-1]
+    for stored in steps:
+        if stored <= raw_value:
+            lower = stored
+        elif stored > raw_value:
+            higher = stored
+            break
+    if higher == lower:
+        return steps[lower]
+    return steps[lower] + ((raw_value - lower) * (steps[higher] - steps[lower]) / (higher - lower))
+
+
+def _create(nr_of_points: int) -> tuple:
+    """Create a calibration with the given number of (monotonic) calibration points.
+    Return the calibration and its points (raw value -> temperature) for the reference implementation.
+    """
+    steps = OrderedDict()
+    for index in range(nr_of_points):
+        raw_value = index * (STEPS - 1) // (nr_of_points - 1)
+        noise = 0.1 * (index % 3) if 0 < index < nr_of_points - 1 else 0
+        steps[raw_value] = -20.0 + 140.0 * index / (nr_of_points - 1) + noise
+    with open(FILENAME % nr_of_points, 'w') as file:
+        file.write(json.dumps({'t%05d' % raw_value: temperature for raw_value, temperature in steps.items()}))
+    return Calibration(FILENAME % nr_of_points, STEPS, -20.0, 120.0), steps
+
+
+def test():
+    """Verify the binary search against the linear reference implementation."""
+    try:
+        for nr_of_points in (2, 3, 50, 1000):
+            calibration, steps = _create(nr_of_points)
+            for raw_value in list(range(-10, STEPS + 10, 97)) + list(steps):
+                expected = linear_get(steps, raw_value)
+                measured = calibration.get(raw_value)
+                assert abs(expected - measured) < 1e-3, '%d points, raw=%d: %f != %f' % (
+                    nr_of_points, raw_value, measured, expected)
+            calibration.close()
+    finally:
+        for nr_of_points in (2, 3, 50, 1000):
+            os.remove(FILENAME % nr_of_points)
+
+
+def benchmark(nr_of_gets=2000):
+    """Measure the duration of a single get() for several calibration sizes."""
+    try:
+        for nr_of_points in (2, 50, 1000):
+            calibration, steps = _create(nr_of_points)
+            raw_values = [(i * 7919) % STEPS for i in range(nr_of_gets)]
+
+            start = ticks_us()
+            for raw_value in raw_values:
+                linear_get(steps, raw_value)
+            linear = ticks_diff(ticks_us(), start) / nr_of_gets
+
+            start = ticks_us()
+            for raw_value in raw_values:
+                calibration.get(raw_value)
+            bisect = ticks_diff(ticks_us(), start) / nr_of_gets
+
+            print('points: %4d  linear: %7.1f us/get  bisect: %7.1f us/get' % (nr_of_points, linear, bisect))
+            calibration.close()
+    finally:
+        for nr_of_points in (2, 50, 1000):
+            os.remove(FILENAME % nr_of_points)
+
+
+if __name__ == '__main__':
+    test()
+    benchmark()
@@ -0,0 +1,184 @@
+"""Test the config module: batches, delayed writes, the recovery of an interrupted write and the shared configs.
+
+This test runs on the host from the src folder: `python test/config_test.py`
+The first benchmark counts the writes of the calibration file during a calibration session on virtual time:
+the calibration is created, 8 points are entered via the web page (1 per second) and 2 points are removed.
+The second benchmark gets the config items like boot.py, status.py and main.py (with src/config.json).
+
+Result (host, CPython 3.11):
+every change written       changes: 12  flash writes: 12
+immediate, batched init    changes: 12  flash writes: 11
+delayed (2s)               changes: 12  flash writes:  1
+Config per module       files loaded: 4  boot:  109 us  heap in use:  7553 bytes
+shared (get_config)     files loaded: 2  boot:   56 us  heap in use:  6407 bytes
+"""
+import contextlib
+import io
+import os
+import sys
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+sys.path.append('.')  # Support running on the host from the src folder
+import simulation
+from calibration import Calibration
+import config
+from config import Config, get_config
+import uasyncio as asyncio
+
+STEPS = 2 ** 15
+
+
+def _read(filename: str) -> str:
+    with open(filename) as file:
+        return file.read()
+
+
+def test_config():
+    """Changes are written immediately, at the end of a batch, or on commit()."""
+    with tempfile.TemporaryDirectory(prefix='config_') as folder:
+        filename = f'{folder}/data/test.json'
+        config = Config(filename)
+        config.set('a', 1)
+        assert config.writes == 1 and _read(filename) == '{"a": 1}'
+        with config.batch():
+            config.set('b', 2)
+            with config.batch():
+                config.remove('a')
+            assert config.writes == 1
+        assert config.writes == 2 and _read(filename) == '{"b": 2}'
+        assert not os.path.exists(filename + '.tmp')
+
+        # A reset after writing the temporary file, but before it replaced the config file (see Config.commit())
+        os.rename(filename, filename + '.tmp')
+        assert Config(filename).get() == {'b': 2}
+        with open(filename, 'w') as file:
+            file.write('{"b": ')  # A corrupt file is ignored (the old implementation wrote in place)
+        with contextlib.redirect_stdout(io.StringIO()) as log:
+            assert Config(filename).get() == {'b': 2}
+            delayed = Config(filename, delay=2)
+        assert f'WARNING: {filename} is corrupt' in log.getvalue()
+        delayed.set('c', 3)  # No event loop: written immediately
+        assert delayed.writes == 1
+
+        async def changes():
+            for value in range(5):
+                delayed.set('c', value)
+                await asyncio.sleep(1)
+            assert delayed.writes == 1  # Each change restarts the delay
+            await asyncio.sleep(1.5)
+            assert delayed.writes == 2 and Config(filename).get('c') == 4
+            delayed.set('c', 5)
+            delayed.commit()
+            assert delayed.writes == 3
+            await asyncio.sleep(3)
+            assert delayed.writes == 3  # Nothing left to write
+        loop = simulation.use_virtual_time()
+        loop.run_until_complete(changes())
+        loop.close()
+
+
+def test_registry():
+    """A shared config is loaded once, and notifies the dependants of the changes."""
+    with tempfile.TemporaryDirectory(prefix='config_') as folder:
+        filename = f'{folder}/shared.json'
+        config = get_config(filename)
+        assert get_config(filename) is config and Config(filename) is not config
+        changes = list()
+
+        def record(key, value):
+            changes.append((key, value))
+        config.add_callback(record)
+        config.add_callback(lambda key, value: changes.append(('hardware changed', value['kettle switch'])), 'hardware')
+        config.set('hardware', {'kettle switch': 13})
+        config.set('project_name', 'test')
+        config.remove('project_name')
+        assert changes == [('hardware', {'kettle switch': 13}), ('hardware changed', 13), ('project_name', 'test'),
+                           ('project_name', None)], changes
+        config.remove_callback(record)
+        config.set('project_name', 'removed')
+        assert changes[-1] == ('project_name', None), 'a removed callback is not called'
+
+        calibration = Calibration(f'{folder}/shared_calibration.json', STEPS, -20.0, 120.0)
+        changed = list()
+        calibration.add_callback(lambda key, value: changed.append(key))
+        get_config(f'{folder}/shared_calibration.json').set('t16384', 30.0)  # e.g. via the web page
+        assert abs(calibration.get(16384) - 30.0) < 1e-3, calibration.get(16384)
+        calibration.close()
+        get_config(f'{folder}/shared_calibration.json').set('t16384', 40.0)
+        assert abs(calibration.get(16384) - 30.0) < 1e-3 and changed == ['t16384'], 'the callbacks are removed'
+        assert not get_config(f'{folder}/shared_calibration.json')._callbacks  # pylint: disable=protected-access
+
+
+async def _session(filename: str, delay):
+    """Calibrate like via the web page, return the number of writes of the calibration file."""
+    calibration = Calibration(filename, STEPS, -20.0, 120.0, delay)
+    for point in range(1, 9):
+        calibration.set(point * 3000, -20.0 + point * 15.0)
+        await asyncio.sleep(1)
+    calibration.remove(3000)
+    calibration.remove(6000)
+    await asyncio.sleep(5)
+    assert Config(filename).get() == calibration._config.get()  # pylint: disable=protected-access
+    return calibration._config.writes  # pylint: disable=protected-access
+
+
+def _boot(open_config) -> list:
+    """Get the config items like boot.py, status.py and main.py, return the items that are kept."""
+    network_config = open_config('network_config.json')  # boot.py
+    open_config('config.json').get('hardware')  # status.py
+    config = open_config('config.json')  # main.py
+    return [network_config, config, open_config('network_config.json'), config['hardware'], config['mqtt']]
+
+
+def _loads(open_config) -> int:
+    """Get the number of files loaded by _boot()."""
+    opened = list()
+    _boot(lambda filename: opened.append(open_config(filename)) or opened[-1])
+    return len(set(id(config) for config in opened))
+
+
+def benchmark_boot(count: int = 100):
+    """Compare the time and the memory to get the config items at boot, with a Config per module and shared."""
+    for name, open_config in (('Config per module', Config), ('shared (get_config)', get_config)):
+        tracemalloc.start()
+        configs = _boot(open_config)
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del configs
+        loads = _loads(open_config)
+        start = time.perf_counter()
+        for _ in range(count):
+            config._configs.clear()  # pylint: disable=protected-access  # Every boot starts without shared configs
+            _boot(open_config)
+        elapsed = (time.perf_counter() - start) / count
+        print(f'{name:22}  files loaded: {loads}  boot: {elapsed * 1e6:4.0f} us  heap in use: {memory:5} bytes')
+
+
+def benchmark():
+    """Count the writes of the calibration file during a calibration session."""
+    changes = 2 + 8 + 2
+    print(f'{"every change written":25}  changes: {changes}  flash writes: {changes:2}')
+    for name, filename, delay in (('immediate, batched init', 'immediate.json', None), ('delayed (2s)', 'delayed.json', 2)):
+        loop = simulation.use_virtual_time()
+        writes = loop.run_until_complete(_session(filename, delay))
+        loop.close()
+        print(f'{name:25}  changes: {changes}  flash writes: {writes:2}')
+
+
+if __name__ == '__main__':
+    test_config()
+    test_registry()
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix='config_') as folder:
+        os.chdir(folder)  # The benchmarks use the files of the working folder, like the modules on the target
+        try:
+            benchmark()
+            shutil.copy(os.path.join(cwd, 'config.json'), '.')
+            with open('network_config.json', 'w') as file:
+                file.write('{"ssid": "brewery", "__password": "secret", "project_name": "BronartsmeiH"}')
+            benchmark_boot()
+        finally:
+            os.chdir(cwd)
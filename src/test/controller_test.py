@@ -0,0 +1,111 @@
+"""Compare the temperature control strategies with a simulated kettle.
+
+This test runs on the host from the src folder: `python test/controller_test.py`
+
+Result (25l kettle, 3kW, heat from 20 to 65 C and hold for 3 hours; settled: within +/- 0.5 C):
+bang-bang              overshoot:  1.89 C  settling time:      -  relay toggles:  13.3 /h
+bang-bang (1 C band)   overshoot:  2.39 C  settling time: 10762s  relay toggles:   5.3 /h
+relay autotune + PID   overshoot:  1.99 C  settling time:  5298s  relay toggles:  23.3 /h
+PID                    overshoot:  0.32 C  settling time:  1908s  relay toggles:  33.3 /h
+The time proportioning window of the PID controller is 180s (the heater toggles at most 40 times per hour).
+A window of 60s: overshoot 0.19 C, settling time 2000s, 101.3 toggles/h; 300s: overshoot 1.06 C, never settled.
+"""
+import os
+import sys
+
+sys.path.append('.')  # Support running on the host from the src folder
+import simulation  # pylint: disable=unused-import
+from simulation.plant import Kettle
+
+import controller
+from config import Config
+from switch import PowerSwitch, TimeProportioning
+
+INTERVAL = 0.5  # Interval of the kettle control [s]
+GAINS = 'controller_test.json'
+
+
+class Measurement():
+    """Collect the performance of a control strategy."""
+
+    def __init__(self, target: float, band: float = 0.5) -> None:
+        self.target = target
+        self.band = band
+        self.maximum = -273.15
+        self.settled = None  # Time the temperature entered the band for the last time [s]
+        self.toggles = 0
+        self.duration = 0.0
+
+    def __call__(self, **measurements):
+        self.toggles += 1
+
+    def add(self, time: float, temperature: float):
+        self.duration = time
+        self.maximum = max(self.maximum, temperature)
+        if abs(temperature - self.target) > self.band:
+            self.settled = None
+        elif self.settled is None:
+            self.settled = time
+
+    def report(self, name: str):
+        print('%-22s overshoot: %5.2f C  settling time: %6s  relay toggles: %5.1f /h' %
+              (name, self.maximum - self.target, '-' if self.settled is None else '%4.0fs' % self.settled,
+               self.toggles * 3600 / self.duration))
+
+
+def simulate(strategy: controller.Controller, target: float = 65.0, duration: float = 3 * 3600) -> Measurement:
+    """Heat the kettle to the target and keep it at the target temperature."""
+    kettle = Kettle()
+    measurement = Measurement(target)
+    heater = PowerSwitch('kettle switch', 13, callback=measurement)
+    output = TimeProportioning(heater, round(strategy.window / INTERVAL))
+    for tick in range(int(duration / INTERVAL)):
+        kettle.step(INTERVAL, heater.state or 0)
+        measurement.add(tick * INTERVAL, kettle.probe)
+        heating = strategy.update(kettle.probe, target)
+        window = max(1, round(strategy.window / INTERVAL))
+        if window != output.window:
+            output = TimeProportioning(heater, window)
+        output.update(heating)
+    return measurement
+
+
+def test():
+    """Compare the strategies. The PID gains are determined by the relay autotune."""
+    try:
+        os.remove(GAINS)
+    except OSError:
+        pass
+    try:
+        simulate(controller.BangBang(0.0)).report('bang-bang')
+        simulate(controller.BangBang(1.0)).report('bang-bang (1 C band)')
+        autotune = simulate(controller.create(dict(strategy='pid', gains=GAINS), INTERVAL))
+        autotune.report('relay autotune + PID')
+        gains = Config(GAINS)
+        assert gains.get('kp') is not None, 'autotune did not complete'
+        pid = simulate(controller.create(dict(strategy='pid', gains=GAINS), INTERVAL))
+        pid.report('PID')
+        assert pid.maximum - pid.target < 1.0, 'PID overshoot too large'
+        assert pid.settled is not None, 'PID did not settle'
+    finally:
+        os.remove(GAINS)
+
+
+def test_timeout():
+    """The autotune continues as bang-bang controller when no oscillation is measured within the timeout."""
+    gains = Config(GAINS)
+    try:
+        autotune = controller.RelayAutotune(gains, INTERVAL, timeout=1800)
+        measurement = simulate(autotune)  # The heating up to the target takes longer
+        assert autotune.controller is autotune.relay and gains.get('kp') is None
+        assert measurement.maximum - measurement.target < 2.5 and measurement.toggles > 10, 'the target is kept'
+    finally:
+        try:
+            os.remove(GAINS)
+        except OSError:
+            pass
+
+
+if __name__ == '__main__':
+    test()
+    test_timeout()
@@ -0,0 +1,203 @@
+"""Test and benchmark the localtime module, and the timestamps of the status messages.
+
+This test runs on the target, or on the host from the src folder: `python test/localtime_test.py`
+The synchronization is tested on the host, against a stand-in SNTP server on virtual time (see test_sync()).
+The benchmark compares the (previous) implementation, which defined a class and formatted a string on every call.
+On the target, the allocated memory is measured with gc.mem_alloc(); on the host with tracemalloc (peak per call).
+
+Result (host, CPython 3.11):
+14 days, clock 50 ppm slow: estimated drift 50.00 ppm, max error (drift known) 1.7 ms, final error -0.7 ms, max rate deviation 583 ppm
+syncs: 13, failed requests: 33 (1 day offline), step of a daily ntptime.settime(): 4.3s
+The rate deviation is at most the drift + the slew (500 ppm), plus the rounding to ms of the samples:
+the time never jumps, the 2s jump of the server time (day 7) is slewed in 67 minutes.
+RTC().datetime()              1.8 us/call  allocated:  260.0 bytes/call
+old now().get_time()         12.9 us/call  allocated: 3236.5 bytes/call
+now(snapshot).get_time()      1.5 us/call  allocated:  260.0 bytes/call
+old set_info timestamp        4.1 us/call  allocated:  413.0 bytes/call
+format_datetime()             2.9 us/call  allocated:    0.0 bytes/call
+state.set_info()              4.8 us/call  allocated:  260.0 bytes/call
+What remains is the tuple of RTC().datetime() (the simulated RTC also allocates a time.struct_time).
+"""
+import asyncio
+import struct
+import sys
+import time
+
+sys.path.append('.')  # Support running on the host from the src folder
+import simulation  # pylint: disable=unused-import
+from machine import RTC
+from localtime import NTP_DELTA, Localtime, Now, TIMESTAMP_SIZE, format_datetime
+from status import state
+
+DAY = 24 * 3600
+
+try:
+    import gc
+    mem_alloc = gc.mem_alloc  # pylint: disable=no-member
+
+    def allocated(function, count: int) -> float:
+        """Get the memory allocated per call. [bytes]"""
+        gc.collect()
+        gc.disable()
+        before = mem_alloc()
+        for _ in range(count):
+            function()
+        after = mem_alloc()
+        gc.enable()
+        return (after - before) / count
+except AttributeError:  # CPython
+    import tracemalloc
+
+    def allocated(function, count: int) -> float:
+        """Get the memory allocated per call (the peak of every call). [bytes]"""
+        total = 0
+        tracemalloc.start()
+        for _ in range(count):
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            function()
+            total += tracemalloc.get_traced_memory()[1] - before
+        tracemalloc.stop()
+        return total / count
+
+
+def old_now():
+    """Reference implementation: Localtime.now()."""
+    class Now():  # pylint: disable=redefined-outer-name
+        """Class representing a snapshot of the current time."""
+        def __init__(self):
+            (self.year, self.mon, self.day, self.dow,
+             self.hour, self.min, self.sec, self.msec) = RTC().datetime()
+            self._time = None
+        def get_time(self) -> float:
+            """Convert this time snapshot to a time float value."""
+            if self._time is None:
+                self._time = time.mktime((self.year, self.mon, self.day, self.hour, self.min, self.sec, 0, 0, -1))
+            return self._time
+    return Now()
+
+
+def old_timestamp():
+    """Reference implementation: the timestamp of _Status.set_info()."""
+    now = list(RTC().datetime())
+    return ('%04d-%02d-%02d %02d:%02d:%02d' % (now[0], now[1], now[2], now[4], now[5], now[6]), 'message')
+
+
+def test():
+    """The snapshot and the timestamp are equal to those of the (previous) implementation."""
+    localtime = Localtime(utc_offset=0)
+    snapshot = Now()
+    for datetime in ((2024, 2, 29, 3, 23, 59, 59, 0), (2024, 3, 1, 4, 0, 0, 1, 0), (2025, 12, 31, 2, 4, 30, 0, 0)):
+        RTC().init(datetime)
+        localtime.now(snapshot)
+        fields = (snapshot.year, snapshot.mon, snapshot.day, snapshot.hour, snapshot.min, snapshot.sec)
+        expected = int(time.mktime(fields + (0, 0, -1)))
+        assert snapshot.get_time() == expected, (snapshot.get_time(), expected)
+        assert snapshot.get_time_ms() == expected * 1000 + snapshot.msec
+        timestamp = bytearray(TIMESTAMP_SIZE + 4)
+        assert format_datetime(snapshot, timestamp) == 23
+        assert str(timestamp, 'ascii') == '%04d-%02d-%02d %02d:%02d:%02d.%03d' % (fields + (snapshot.msec,)), timestamp
+    state.set_info('test', 'message')
+    assert [info[1:] for info in state.get_info() if info[2] == 'test'] == [(old_timestamp()[0], 'test', 'message')]
+
+
+class Responder(asyncio.DatagramProtocol):
+    """Stand-in SNTP server, its clock runs `drift` faster than the simulated time (and starts `offset` ahead)."""
+
+    def __init__(self, offset: float, drift: float, latency: float) -> None:
+        self.start = time.time()
+        self.offset = offset  # [s]
+        self.drift = drift  # [s/s]
+        self.latency = latency  # One way [s]
+        self.online = True
+        self.requests = 0
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def server_time(self) -> float:
+        """Get the (UTC) time of the server. [s]"""
+        return self.start + self.offset + (time.time() - self.start) * (1 + self.drift)
+
+    def datagram_received(self, data, addr):
+        self.requests += 1
+        if self.online:
+            asyncio.get_event_loop().call_later(self.latency, self._answer, bytes(data), addr)
+
+    def _answer(self, request: bytes, addr):
+        answer = bytearray(48)
+        answer[0] = 0x24  # version 4, mode 4 (server)
+        answer[1] = 1  # stratum
+        answer[24:32] = request[40:48]
+        for offset in (32, 40):  # received, transmitted
+            moment = self.server_time() + NTP_DELTA
+            struct.pack_into('!II', answer, offset, int(moment), int(moment % 1 * 2 ** 32))
+        asyncio.get_event_loop().call_later(self.latency, self.transport.sendto, answer, addr)
+
+
+async def _synchronize(responder: Responder, port: int, days: int):
+    """Run a synchronized Localtime, return it and a sample of its time per minute: (monotonic, local, server time)."""
+    localtime = Localtime(utc_offset=0, server='127.0.0.1', port=port, interval=DAY)
+    task = asyncio.create_task(localtime.run())
+    samples = list()
+    for minute in range(days * 1440):
+        if minute == 7 * 1440:
+            responder.offset += 2  # The time of the server jumps 2 seconds
+        responder.online = not 10 * 1440 <= minute < 11 * 1440  # The server is down for a day
+        samples.append((localtime.monotonic_ms(), localtime.time_ms(), responder.server_time()))
+        await asyncio.sleep(60)
+    task.cancel()
+    return localtime, samples
+
+
+def test_sync(days: int = 14, drift: float = 50e-6):
+    """The time is synchronized with the stand-in SNTP server, without steps and with a drift of the clock."""
+    loop = simulation.use_virtual_time()
+    responder = Responder(offset=100, drift=drift, latency=0.02)
+    transport, _ = loop.run_until_complete(
+        loop.create_datagram_endpoint(lambda: responder, local_addr=('127.0.0.1', 0)))
+    localtime, samples = loop.run_until_complete(_synchronize(responder, transport.get_extra_info('sockname')[1], days))
+    loop.run_until_complete(asyncio.sleep(1))
+    transport.close()
+    loop.close()
+
+    errors = [local / 1000 - server for _, local, server in samples]
+    rates = [(samples[index + 1][1] - samples[index][1]) / (samples[index + 1][0] - samples[index][0]) - 1
+             for index in range(1, len(samples) - 1)]  # After the first synchronization
+    assert abs(errors[1]) < 0.005, errors[1]  # The first synchronization sets the time
+    assert max(abs(rate) for rate in rates) <= localtime.slew + drift + 3 / 60000, max(rates)  # int [ms]
+    assert abs(localtime.drift() - drift) < 1e-6, localtime.drift()
+    assert abs(errors[-1]) < 0.01, errors[-1]
+    assert abs(samples[-1][0] - (days * 1440 - 1) * 60000) < 100, 'the monotonic clock wrapped around'
+    assert localtime.failures and responder.requests == localtime.syncs + localtime.failures
+    known = [abs(error) for minute, error in enumerate(errors) if 2 * 1440 < minute < 7 * 1440 or minute > 9 * 1440]
+    print(f'{days} days, clock {drift * 1e6:.0f} ppm slow: estimated drift {localtime.drift() * 1e6:.2f} ppm,'
+          f' max error (drift known) {max(known) * 1e3:.1f} ms, final error {errors[-1] * 1e3:.1f} ms,'
+          f' max rate deviation {max(abs(rate) for rate in rates) * 1e6:.0f} ppm')
+    print(f'syncs: {localtime.syncs}, failed requests: {localtime.failures} (1 day offline), step of a daily'
+          f' ntptime.settime(): {drift * DAY:.1f}s')
+
+
+def benchmark(count: int = 1000):
+    """Measure the duration and the allocated memory per call."""
+    snapshot = Now()
+    timestamp = bytearray(TIMESTAMP_SIZE)
+    rtc = RTC()
+    for name, function in (('RTC().datetime()', rtc.datetime),
+                           ('old now().get_time()', lambda: old_now().get_time()),
+                           ('now(snapshot).get_time()', lambda: snapshot.update().get_time()),
+                           ('old set_info timestamp', old_timestamp),
+                           ('format_datetime()', lambda: format_datetime(snapshot, timestamp)),
+                           ('state.set_info()', lambda: state.set_info('test', 'message'))):
+        start = time.perf_counter()
+        for _ in range(count):
+            function()
+        elapsed = (time.perf_counter() - start) / count
+        print(f'{name:26}  {elapsed * 1e6:5.1f} us/call  allocated: {allocated(function, count):6.1f} bytes/call')
+
+
+if __name__ == '__main__':
+    test()
+    test_sync()
+    benchmark()
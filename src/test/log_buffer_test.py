@@ -0,0 +1,230 @@
+"""Test and benchmark the log_buffer module, and the logging and status.Log that use it.
+
+This test runs on the host from the src folder: `python test/log_buffer_test.py`
+The benchmark compares logging.Logger.info() that formats the message (the previous implementation, and the logging
+without a buffer) with the LogBuffer, that stores the arguments. The allocated memory is measured with tracemalloc.
+
+Result (host, CPython 3.11):
+time.ticks_ms() (simulated)         0.6 us/call  allocated:  128.0 bytes/call
+eager: format and keep the line     1.2 us/call  allocated:  250.8 bytes/call
+LogBuffer.append()                  5.1 us/call  allocated:  155.8 bytes/call
+logger.info() to the buffer         5.5 us/call  allocated:  155.9 bytes/call
+logger.debug() (level INFO)         0.5 us/call  allocated:    0.0 bytes/call
+1000 messages: list of lines 124690 bytes, buffer 2048 bytes (the last 85 messages)
+read: 4.2 us/record
+What LogBuffer.append() allocates on the host is the simulated ticks_ms() and CPython int objects: on MicroPython
+the ticks and the positions are small ints, so a record with numeric arguments does not allocate. A disabled level
+returns before anything is done. The eager formatting is fast in CPython (C), but allocates the message and the line,
+and the memory of a list of lines grows with every message.
+"""
+import importlib.util
+import io
+import sys
+import time
+import tracemalloc
+
+sys.path.append('.')  # Support running on the host from the src folder
+import simulation  # pylint: disable=unused-import
+from log_buffer import MAX_FORMATS, MAX_LOGGERS, LogBuffer
+from status import Log
+
+# The CPython logging is imported by the simulation (asyncio): load the logging of the brewery explicitly
+_spec = importlib.util.spec_from_file_location('brewery_logging', 'lib/logging.py')
+logging = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(logging)
+
+
+def allocated(function, count: int) -> float:
+    """Get the memory allocated per call (the peak of every call). [bytes]"""
+    total = 0
+    tracemalloc.start()
+    for _ in range(count):
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        function()
+        total += tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+    return total / count
+
+
+def test_format():
+    """The arguments are packed, the messages are formatted when they are read."""
+    buffer = LogBuffer(512)
+    buffer.append(logging.INFO, 'kettle', 'temperature: %.1f, power: %d%%', (65.25, 80))
+    buffer.append(logging.WARNING, 'fridge', '%s %s %s %s', (None, True, 'door', ValueError('open')))
+    buffer.append(logging.ERROR, 'kettle', 'no arguments: 100%')
+    buffer.append(logging.ERROR, 'kettle', 'wrong arguments: %d', ('text',))
+    buffer.append(logging.INFO, 'kettle', '%d %s', (1 << 40, 'x' * 300))
+    records = list(buffer.read())
+    assert [record[0] for record in records] == [0, 1, 2, 3, 4]
+    assert records[0][2:] == (logging.INFO, 'kettle', 'temperature: 65.2, power: 80%'), records[0]
+    assert records[1][2:] == (logging.WARNING, 'fridge', 'None True door open'), records[1]
+    assert records[2][4] == 'no arguments: 100%' and records[3][4] == "wrong arguments: %d ['text']", records[3]
+    assert records[4][4] == '%d %s' % (1 << 40, 'x' * 120), 'large ints and long strings are stored as text'
+    assert abs(records[0][1] - time.ticks_ms()) < 100
+    assert list(buffer.lines(after=3)) == [f'{records[4][1]} INFO:kettle:{records[4][4]}']
+    assert buffer.count == 5 and not buffer.dropped
+
+
+def test_ring():
+    """The oldest records are overwritten, every reader keeps its own cursor."""
+    buffer = LogBuffer(200)
+    cursor = -1
+    lines = list()
+    for index in range(100):
+        buffer.append(logging.INFO, 'test', 'message %d' + ' %s' * (index % 4), (index,) + ('ab',) * (index % 4))
+        if index % 7 == 0:
+            for sequence, _, _, _, message in buffer.read(cursor):
+                assert sequence == cursor + 1, 'no record is missed'
+                cursor = sequence
+                lines.append(message)
+        records = list(buffer.read())
+        assert buffer.count == len(records) and records[-1][0] == index == buffer.sequence - 1
+        assert [int(record[4].split()[1]) for record in records] == list(range(index + 1 - len(records), index + 1))
+        assert buffer.dropped == index + 1 - buffer.count
+    assert lines == [f'message {index}' + ' ab' * (index % 4) for index in range(99)]
+    assert 8 <= buffer.count <= 16, buffer.count
+
+    reader = buffer.read()
+    first = next(reader)
+    for index in range(20):  # Overwrite the records while reading
+        buffer.append(logging.INFO, 'test', 'message %d', (100 + index,))
+    assert next(reader)[0] >= buffer.sequence - buffer.count, 'overwritten records are skipped'
+    assert first[0] < buffer.sequence - buffer.count
+
+    run_in = LogBuffer(100, overwrite=False)
+    for index in range(20):
+        run_in.append(logging.INFO, 'test', 'message %d', (index,))
+    assert [record[4] for record in run_in.read()] == [f'message {index}' for index in range(run_in.count)]
+    assert run_in.count == 100 // (9 + 5) and run_in.dropped == 20 - run_in.count
+
+
+def test_tables():
+    """The tables of the format strings and the logger names are limited, other records store them inline."""
+    buffer = LogBuffer(8192)
+    count = MAX_FORMATS + 10
+    for index in range(count):
+        buffer.append(logging.INFO, f'logger {index % (MAX_LOGGERS + 5)}', f'format {index}: %d', (index,))
+    assert len(buffer._formats) == MAX_FORMATS and len(buffer._format_ids) == MAX_FORMATS
+    assert len(buffer._loggers) == MAX_LOGGERS and len(buffer._logger_ids) == MAX_LOGGERS
+    records = list(buffer.read())
+    assert len(records) == count and not buffer.dropped
+    for sequence, _, _, name, message in records:
+        assert name == f'logger {sequence % (MAX_LOGGERS + 5)}' and message == f'format {sequence}: {sequence}', \
+            (sequence, name, message)
+
+
+def test_logging():
+    """The logging stores the records in the buffer, the level is checked per logger."""
+    buffer = LogBuffer(512)
+    logging.basicConfig(level=logging.INFO, buffer=buffer)
+    kettle = logging.getLogger('kettle')
+    fridge = logging.getLogger('fridge')
+    fridge.setLevel(logging.WARNING)
+    kettle.info('temperature: %.1f', 65.25)
+    kettle.debug('not enabled: %s', 'x')
+    fridge.info('not enabled')
+    stream = io.StringIO()
+    logging.basicConfig(level=logging.INFO, stream=stream)
+    fridge.warning('door open after %d s', 30)
+    logging.warning('root')
+    assert stream.getvalue() == 'WARN:fridge:door open after 30 s\nWARN:root:root\n', 'warnings are printed as well'
+    assert list(record[2:] for record in buffer.read()) == [(logging.INFO, 'kettle', 'temperature: 65.2'),
+                                                           (logging.WARNING, 'fridge', 'door open after 30 s'),
+                                                           (logging.WARNING, 'root', 'root')]
+
+    class Handler(logging.Handler):
+        def __init__(self):
+            super().__init__()
+            self.records = list()
+
+        def emit(self, record):
+            self.records.append(record)
+
+    handler = Handler()
+    kettle.addHandler(handler)
+    kettle.info('first %d', 1)
+    kettle.info('second %d', 2)
+    fridge.warning('fridge')
+    assert [record.message for record in handler.records] == ['first 1', 'second 2'], 'the handlers are per logger'
+    assert buffer.count == 6
+
+    kept = dict(logging._loggers)
+    for index in range(logging.MAX_LOGGERS + 10):
+        logging.getLogger(f'logger {index}')
+    assert len(logging._loggers) == logging.MAX_LOGGERS, 'the number of kept loggers is limited'
+    name = f'logger {logging.MAX_LOGGERS + 9}'
+    assert logging.getLogger(name).name == name and name not in logging._loggers, 'a new logger is not kept'
+    assert logging.getLogger('kettle') is kettle
+    logging._loggers.clear()
+    logging._loggers.update(kept)
+
+
+def test_status_log():
+    """The run-in messages are kept, and the last messages."""
+    log = Log()
+    for index in range(500):
+        log.write(f'message {index}\n')
+        log.write('\n')
+    lines = [line.split(' ', 1)[1] for line in log.get()]  # Without the ticks
+    run_in = log.run_in.count
+    assert lines[:run_in] == [f'-:print:message {index}\n' for index in range(run_in)], lines[:3]
+    assert lines[run_in:] == [f'-:print:message {index}\n' for index in range(500 - log.rolling.count, 500)]
+    assert run_in > 30 and log.rolling.count > 60, (run_in, log.rolling.count)
+
+    logging.basicConfig(level=logging.INFO, buffer=log.rolling)
+    logging.getLogger('kettle').warning('temperature: %.1f', 65.25)
+    assert log.get()[-1].endswith(' WARN:kettle:temperature: 65.2'), 'the level and the logger are kept'
+
+
+def benchmark(count: int = 1000):
+    """Measure the duration and the allocated memory per call, and the memory of the log."""
+    buffer = LogBuffer(2048)
+    logging.basicConfig(level=logging.INFO, buffer=buffer)
+    logger = logging.getLogger('benchmark')
+    lines = list()
+
+    def eager():
+        lines.append('%s:%s:%s' % ('INFO', 'benchmark', 'temperature: %.2f target: %.1f power: %d' % (65.25, 66.0, 80)))
+        if len(lines) > 100:
+            lines.clear()
+
+    for name, function in (('time.ticks_ms() (simulated)', time.ticks_ms),
+                           ('eager: format and keep the line', eager),
+                           ('LogBuffer.append()', lambda: buffer.append(
+                               logging.INFO, 'benchmark', 'temperature: %.2f target: %.1f power: %d', (65.25, 66.0, 80))),
+                           ('logger.info() to the buffer', lambda: logger.info(
+                               'temperature: %.2f target: %.1f power: %d', 65.25, 66.0, 80)),
+                           ('logger.debug() (level INFO)', lambda: logger.debug(
+                               'temperature: %.2f target: %.1f power: %d', 65.25, 66.0, 80))):
+        function()  # The first call stores the format string
+        start = time.perf_counter()
+        for _ in range(count):
+            function()
+        elapsed = (time.perf_counter() - start) / count
+        print(f'{name:32}  {elapsed * 1e6:5.1f} us/call  allocated: {allocated(function, count):6.1f} bytes/call')
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    lines = [f'{time.ticks_ms()} INFO:benchmark:temperature: {65.25:.2f} target: {66.0:.1f} power: {index}'
+             for index in range(count)]
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    print(f'{count} messages: list of lines {size} bytes, buffer {len(buffer._buffer)} bytes'
+          f' (the last {buffer.count} messages)')
+    start = time.perf_counter()
+    records = sum(1 for _ in buffer.read())
+    print(f'read: {(time.perf_counter() - start) / records * 1e6:.1f} us/record')
+
+
+def test():
+    test_format()
+    test_ring()
+    test_tables()
+    test_logging()
+    test_status_log()
+
+
+if __name__ == '__main__':
+    test()
+    benchmark()
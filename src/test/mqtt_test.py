@@ -0,0 +1,190 @@
+"""Test the MQTT client with the stand-in broker of the simulation, and compare the topic per sensor with bulk state.
+
+This test runs on the host from the src folder: `python test/mqtt_test.py`
+The benchmark publishes the values of a brewing hour (like main.py) on virtual time.
+
+Result (host, CPython 3.11, 50ms per publish for the time to first measurement):
+cold boot: 8 devices announced, time to first measurement: 50 ms  (all announcements first: 450 ms)
+warm boot: 0 devices announced, time to first measurement: 50 ms
+topic per sensor        publishes:  4801  bytes on air:  200012  event loop time: 0.42s
+bulk state (5s cycle)   publishes:   720  bytes on air:   84927  event loop time: 0.33s
+bulk state (10s cycle)  publishes:   360  bytes on air:   57627  event loop time: 0.27s
+Every second, only the recipe (countdown) changes. So with a 1s cycle, most documents contain a single value:
+the time and the key cost more bytes than the separate topic (303327 bytes). So the minimum cycle is 5s.
+"""
+import contextlib
+import io
+import json
+import sys
+import tempfile
+import time
+
+sys.path.append('.')  # Support running on the host from the src folder
+import simulation
+from mqtt_as.mqtt_as import broker
+from mqtt import MQTTClient
+import uasyncio as asyncio
+
+SENSORS = (('environment temperature', 'temperature', '°C'), ('kettle temperature', 'temperature', '°C'),
+           ('kettle switch', 'outlet', None), ('target temperature', 'temperature', '°C'),
+           ('recipe', 'actions', None), ('uptime', 'uptime', None),
+           ('recipe_ack_action', 'action', None), ('recipe_stage', 'action', None))
+
+
+def _bytes_on_air(topic: str, msg: str) -> int:
+    """Get the size of a MQTT PUBLISH packet (QoS 0)."""
+    length = 2 + len(topic.encode()) + len(msg.encode())
+    return 1 + (1 if length < 128 else 2) + length
+
+
+async def _brew(client: MQTTClient, duration: int):
+    """Publish the values of the brewery (like main.py) for the duration. [s]"""
+    for sensor in SENSORS:
+        client.add_device(*sensor)
+    task = asyncio.create_task(client.run())
+    client.publish(**{'target temperature': 65.0})
+    for tick in range(2 * duration):  # The kettle control runs every 0.5s
+        remaining = 3600 - tick // 2
+        client.publish(**{'kettle switch': 'ON' if tick % 120 < 30 else 'OFF',
+                          'recipe': f'Maichen phase1: {remaining // 60}:{remaining % 60:02} remaining'})
+        if tick % 20 == 0:  # The reduced temperatures and the uptime are published every 10s
+            client.publish(**{'kettle temperature': 64.5 + (tick % 100) / 100,
+                              'environment temperature': 20.0 + (tick % 400) / 200,
+                              'uptime': f'{tick // 7200}:{(tick // 120) % 60:02}:{(tick // 2) % 60:02}'})
+        await asyncio.sleep(0.5)
+    task.cancel()
+    await asyncio.sleep(1)
+
+
+def _run(bulk_cycle: float, duration: int = 3600):
+    """Run the client on virtual time, return the published messages (except the discovery messages)."""
+    with tempfile.TemporaryDirectory(prefix='mqtt_') as folder:
+        del broker.messages[:]
+        client = MQTTClient('', 'test', 'ssid', '', rate=5, burst=20, bulk_cycle=bulk_cycle,
+                            discovery_cache=f'{folder}/discovery.json')
+        loop = simulation.use_virtual_time()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            loop.run_until_complete(_brew(client, duration))
+        elapsed = time.perf_counter() - start
+        loop.close()
+        messages = [(topic, msg) for _, topic, msg, _ in broker.messages if topic.startswith('test/')]
+        return client, messages, elapsed
+
+
+def test():
+    """In bulk state mode, all new values are combined in a json document, referenced by the discovery messages."""
+    client, messages, _ = _run(bulk_cycle=1, duration=60)
+    assert client.bulk_cycle == MQTTClient.MIN_BULK_CYCLE
+    discovery = [json.loads(msg) for _, topic, msg, _ in broker.messages if topic.endswith('kettle_temperature/config')]
+    assert discovery[-1]['state_topic'] == 'test/state', discovery
+    assert discovery[-1]['value_template'] == '{{ value_json.kettle_temperature | default(this.state) }}', discovery
+    assert all(topic == 'test/state' for topic, _ in messages), messages
+    documents = [json.loads(msg) for _, msg in messages]
+    assert documents[0]['target_temperature'] == 65.0 and documents[0]['kettle_switch'] == 'ON', documents[0]
+    assert documents[-1]['recipe'] == 'Maichen phase1: 59:05 remaining', documents[-1]
+    assert all(document['time'] for document in documents)
+    assert 11 <= len(documents) <= 13, len(documents)
+    assert all('target_temperature' not in document for document in documents[1:]), 'only changed values are sent'
+    print(f'{len(documents)} state documents in 60s, e.g. {messages[1][1]}')
+
+
+def test_not_finite():
+    """A value which is not finite is null in the state document (NaN and Infinity are not valid json)."""
+    with tempfile.TemporaryDirectory(prefix='mqtt_') as folder:
+        del broker.messages[:]
+        client = MQTTClient('', 'test', 'ssid', '', bulk_cycle=5, discovery_cache=f'{folder}/discovery.json')
+        client.add_device('kettle temperature', 'temperature', '°C')
+        client.add_device('environment temperature', 'temperature', '°C')
+
+        async def publish():
+            task = asyncio.create_task(client.run())
+            client.publish(**{'kettle temperature': float('nan'), 'environment temperature': float('-inf')})
+            await asyncio.sleep(1)
+            task.cancel()
+            await asyncio.sleep(1)
+        loop = simulation.use_virtual_time()
+        with contextlib.redirect_stdout(io.StringIO()):
+            loop.run_until_complete(publish())
+        loop.close()
+        documents = [json.loads(msg) for _, topic, msg, _ in broker.messages if topic == 'test/state']
+        assert documents and documents[0]['kettle_temperature'] is None, documents
+        assert documents[0]['environment_temperature'] is None, documents
+
+
+async def _boot(client: MQTTClient) -> float:
+    """Get the time from the first measurement until it is received by the broker. [s]"""
+    received = asyncio.Event()
+
+    def listener(topic, msg, retain):
+        if topic == 'test/kettle_temperature':
+            received.set()
+    broker.listeners.append(listener)
+    for sensor in SENSORS:
+        client.add_device(*sensor)
+    task = asyncio.create_task(client.run())
+    start = time.time()
+    client.publish(**{'kettle temperature': 65.0})
+    await received.wait()
+    duration = time.time() - start
+    broker.listeners.remove(listener)
+    await asyncio.sleep(4)  # The devices are announced after the measurement, the cache is written 2s later
+    task.cancel()
+    await asyncio.sleep(1)
+    return duration
+
+
+def test_discovery():
+    """Only new or changed devices are announced, all devices are announced when Home Assistant comes online."""
+    def announced():
+        return [topic for _, topic, _, _ in broker.messages if topic.startswith('homeassistant/') and topic.endswith('/config')]
+    with tempfile.TemporaryDirectory(prefix='mqtt_') as folder:
+        broker.latency = 0.05  # Every publish over WiFi takes 50ms
+        for boot, expected in (('cold boot', len(SENSORS)), ('warm boot', 0)):
+            del broker.messages[:]
+            loop = simulation.use_virtual_time()
+            client = MQTTClient('', 'test', 'ssid', '', discovery_cache=f'{folder}/discovery.json')
+            with contextlib.redirect_stdout(io.StringIO()):
+                duration = loop.run_until_complete(_boot(client))
+            loop.close()
+            assert len(announced()) == expected, announced()
+            assert client.announced.writes == (1 if expected else 0), 'the discovery cache is written once'
+            print(f'{boot}: {len(announced())} devices announced, time to first measurement: {duration * 1e3:.0f} ms')
+        broker.latency = 0.0
+
+        del broker.messages[:]
+        client = MQTTClient('', 'test', 'ssid', '', discovery_cache=f'{folder}/discovery.json')
+        client.add_device('kettle temperature', 'temperature', '°C')
+        client.add_device('kettle switch', 'switch', None)  # Changed device class
+
+        async def online():
+            task = asyncio.create_task(client.run())
+            await asyncio.sleep(0.1)
+            broker.publish('homeassistant/status', 'online')
+            await asyncio.sleep(1)
+            task.cancel()
+            await asyncio.sleep(3)  # The discovery cache is written
+        loop = simulation.use_virtual_time()
+        with contextlib.redirect_stdout(io.StringIO()):
+            loop.run_until_complete(online())
+        loop.close()
+        assert len(set(announced())) == 2, announced()
+        payloads = [msg for _, topic, msg, _ in broker.messages if topic.endswith('kettle_switch/config')]
+        stored = client._discovery['kettle switch'][1]  # pylint: disable=protected-access
+        assert payloads[0] == payloads[-1] == stored.decode(), 'the stored discovery message is published again'
+
+
+
+def benchmark():
+    """Compare the number of publishes, the bytes on air and the time of the event loop (for 1 hour)."""
+    for name, bulk_cycle in (('topic per sensor', 0), ('bulk state (5s cycle)', 5), ('bulk state (10s cycle)', 10)):
+        _, messages, elapsed = _run(bulk_cycle)
+        size = sum(_bytes_on_air(topic, msg) for topic, msg in messages)
+        print(f'{name:22}  publishes: {len(messages):5}  bytes on air: {size:7}  event loop time: {elapsed:4.2f}s')
+
+
+if __name__ == '__main__':
+    test()
+    test_not_finite()
+    test_discovery()
+    benchmark()
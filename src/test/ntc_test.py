@@ -0,0 +1,186 @@
+"""Test and benchmark the NTC lookup table against the exact Beta equation.
+
+It runs on the target, or on the host from the src folder: `python test/ntc_test.py`
+
+>>> import ntc_test
+>>> ntc_test.test()
+>>> ntc_test.test_sensor()
+>>> ntc_test.accuracy()  # measured on the host (CPython)
+r_ref:  27000  knots:  256  max error:  0.0057 C  mean error:  0.0006 C
+r_ref:  27000  knots:  512  max error:  0.0014 C  mean error:  0.0001 C
+r_ref:  27000  knots: 1024  max error:  0.0004 C  mean error:  0.0000 C
+r_ref: 150000  knots:  256  max error:  0.0736 C  mean error:  0.0020 C
+r_ref: 150000  knots:  512  max error:  0.0180 C  mean error:  0.0005 C
+r_ref: 150000  knots: 1024  max error:  0.0046 C  mean error:  0.0001 C
+>>> ntc_test.benchmark()  # measured on the host (CPython), where math.log is native code
+exact:    0.50 us/conversion  table:    0.76 us/conversion
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append('lib')  # Support running on the host from the src folder
+sys.path.append('.')
+try:
+    import simulation  # pylint: disable=unused-import
+except ImportError:  # Running on the target
+    ...
+
+import config as config_module
+from config import get_config
+import ntc
+import temperature
+import uasyncio as asyncio
+
+R25 = 102500.0  # NTC_Hothap
+B_VALUE = 4000.0
+REF_RAW = 2 * 13000  # u_ref.gain * raw reference measurement of the ADS1115
+FILENAME = 'ntc_test.lut'
+
+try:
+    ticks_us = time.ticks_us  # pylint: disable=no-member
+    ticks_diff = time.ticks_diff  # pylint: disable=no-member
+except AttributeError:  # CPython
+    def ticks_us():
+        return int(time.perf_counter() * 1e6)
+
+    def ticks_diff(end, start):
+        return end - start
+
+
+def _raw_values(r_ref):
+    """Get the raw values for the brewing range of 0..110 degrees Celsius."""
+    lowest = None
+    highest = None
+    for raw in range(1, REF_RAW):
+        temperature = ntc.beta_temperature(raw, REF_RAW, r_ref, R25, B_VALUE)
+        if temperature <= 110 and lowest is None:
+            lowest = raw
+        if temperature >= 0:
+            highest = raw
+    return range(lowest, highest + 1)
+
+
+def test():
+    """Verify the table is persisted and rebuilt when the parameters change."""
+    try:
+        os.remove(FILENAME)
+    except OSError:
+        pass
+    try:
+        table = ntc.Table(27000, R25, B_VALUE, 256, filename=FILENAME)
+        loaded = ntc.Table(27000, R25, B_VALUE, 256, filename=FILENAME)
+        assert loaded.knots == table.knots, 'persisted table differs'
+        changed = ntc.Table(27000, R25, 4225, 256, filename=FILENAME)
+        assert changed.knots != table.knots, 'table not rebuilt after a change of the probe'
+        assert ntc.Table(27000, R25, 4225, 256, filename=FILENAME).knots == changed.knots
+        corrected = ntc.Table(27000, R25, B_VALUE, 256, correction=lambda value: value + 1)
+        assert abs(corrected.get(1000, REF_RAW) - table.get(1000, REF_RAW) - 1) < 1e-3
+        for raw in (-1, 0, REF_RAW, REF_RAW + 1):
+            assert table.get(raw, REF_RAW) == ntc.beta_temperature(raw, REF_RAW, 27000, R25, B_VALUE) == ntc.INVALID
+    finally:
+        os.remove(FILENAME)
+
+
+class _Adc():
+    """ADC of which the measurement is set by the test."""
+
+    def __init__(self, raw: int) -> None:
+        self.raw = raw
+
+    def read(self) -> dict:
+        return dict(raw=self.raw, ref_raw=REF_RAW)
+
+
+def test_sensor():
+    """The table of the sensor includes the calibration and is rebuilt when the probe or the calibration changes (once
+    for a batch of changes of the calibration).
+    """
+    hardware = {'ESP': dict(device='ESP32', **{'u_ref.pin': '35', 'u_ref.gain': '1'}),
+                'ntc test': dict(device='NTC', pin='ESP.34', r_ref='27000', probe='probe', lut='512',
+                                 calibration='ntc_test_calibration.json'),
+                'probe': dict(r25=str(R25), b_value=str(B_VALUE))}
+    cwd = os.getcwd()
+    os.chdir(tempfile.mkdtemp(prefix='ntc_'))
+    with open('config.json', 'w') as file:  # The shared config, which notifies the changes of the hardware
+        json.dump(dict(hardware=hardware), file)
+    config_module._configs.clear()  # pylint: disable=protected-access
+    config = get_config('config.json')
+    try:
+        sensor = temperature.Ntc('ntc test', config['hardware'], callback=None)
+        config.add_callback(lambda _, hardware: sensor.configure(hardware), 'hardware')  # As main.py does
+        sensor.adc = _Adc(12500)
+        exact = ntc.beta_temperature(12500, REF_RAW, 27000, R25, B_VALUE)
+        measured = sensor.table.get(12500, REF_RAW)
+        assert abs(measured - exact) < 0.01, (measured, exact)
+
+        rebuilds = list()
+        rebuild = sensor.table.rebuild
+        sensor.table.rebuild = lambda: rebuilds.append(rebuild())
+        sensor.calibration.set(100, -40.0)  # e.g. via the web page
+        sensor.calibration.set(int((exact - temperature.CALIBRATION_MIN) / temperature.CALIBRATION_RESOLUTION),
+                               exact + 2)
+        assert not rebuilds, 'the table is rebuilt at the next measurement'
+        measured = asyncio.run(sensor._read())  # pylint: disable=protected-access
+        assert abs(measured - exact - 2) < 0.05, 'table not rebuilt after a change of the calibration'
+        asyncio.run(sensor._read())  # pylint: disable=protected-access
+        assert len(rebuilds) == 1, rebuilds
+
+        probe = dict(hardware['probe'], b_value='4225')
+        config.set('hardware', dict(hardware, probe=probe))
+        assert sensor.b_value == 4225
+        changed = ntc.beta_temperature(12500, REF_RAW, 27000, R25, 4225)
+        measured = sensor.table.get(12500, REF_RAW)
+        assert abs(measured - sensor.calibration.get((changed - temperature.CALIBRATION_MIN) * 10)) < 0.05, \
+            'table not rebuilt after a change of the probe'
+
+        del hardware['ntc test']['lut']
+        config.set('hardware', hardware)
+        assert sensor.table is None
+    finally:
+        config_module._configs.clear()  # pylint: disable=protected-access
+        os.chdir(cwd)
+
+
+def accuracy():
+    """Report the error of the lookup table in the brewing range."""
+    for r_ref in (27000, 150000):
+        raw_values = _raw_values(r_ref)
+        for nr_of_knots in (256, 512, 1024):
+            table = ntc.Table(r_ref, R25, B_VALUE, nr_of_knots)
+            max_error = 0.0
+            total_error = 0.0
+            for raw in raw_values:
+                error = abs(table.get(raw, REF_RAW) - ntc.beta_temperature(raw, REF_RAW, r_ref, R25, B_VALUE))
+                max_error = max(max_error, error)
+                total_error += error
+            print('r_ref: %6d  knots: %4d  max error: %7.4f C  mean error: %7.4f C' %
+                  (r_ref, nr_of_knots, max_error, total_error / len(raw_values)))
+
+
+def benchmark(nr_of_conversions=5000):
+    """Measure the duration of a single conversion."""
+    r_ref = 27000
+    table = ntc.Table(r_ref, R25, B_VALUE, 512)
+    raw_values = [1 + (i * 7919) % (REF_RAW - 2) for i in range(nr_of_conversions)]
+
+    start = ticks_us()
+    for raw in raw_values:
+        ntc.beta_temperature(raw, REF_RAW, r_ref, R25, B_VALUE)
+    exact = ticks_diff(ticks_us(), start) / nr_of_conversions
+
+    start = ticks_us()
+    for raw in raw_values:
+        table.get(raw, REF_RAW)
+    lookup = ticks_diff(ticks_us(), start) / nr_of_conversions
+
+    print('exact: %7.2f us/conversion  table: %7.2f us/conversion' % (exact, lookup))
+
+
+if __name__ == '__main__':
+    test()
+    test_sensor()
+    accuracy()
+    benchmark()
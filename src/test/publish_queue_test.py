@@ -0,0 +1,100 @@
+"""Test the publish_queue module.
+
+It runs on the target, or on the host from the src folder: `python test/publish_queue_test.py`
+On the host, the test runs on virtual time (see simulation.use_virtual_time()).
+
+>>> import publish_queue_test
+>>> publish_queue_test.test()
+rate limit: 69 messages in 10s (burst 20 + 5/s), 0 suppressed
+"""
+import sys
+import time
+
+sys.path.append('.')  # Support running on the host from the src folder
+try:
+    import simulation
+except ImportError:  # Running on the target
+    simulation = None
+from publish_queue import LAZY, URGENT, PublishQueue
+import uasyncio as asyncio
+
+
+async def _drain(queue: PublishQueue, duration: float):
+    """Get all messages published within the duration. [s]"""
+    messages = list()
+
+    async def collect():
+        while True:
+            message = await queue.get()
+            messages.append((time.ticks_ms(), message['topic'], message['msg']))
+    try:
+        await asyncio.wait_for(collect(), duration)
+    except asyncio.TimeoutError:
+        pass
+    return messages
+
+
+async def _test():
+    # Coalescing: only the latest value is published, in order of priority
+    queue = PublishQueue(rate=100, burst=10)
+    queue.put('fridge_home', 'homeassistant/fridge', '{}', retain=True, priority=LAZY)
+    for value in range(100):
+        queue.put('kettle', 'brewery/kettle', str(value), value=value)
+    queue.put('kettle_home', 'homeassistant/kettle', '{}', retain=True, priority=URGENT)
+    queue.put('kettle_home', 'homeassistant/kettle', '{}', retain=True, priority=LAZY)  # Keeps its first priority
+    assert queue.pending() == 3, 'a key is dirty once'
+    messages = await _drain(queue, 0.1)
+    assert [message[1] for message in messages] == ['homeassistant/kettle', 'brewery/kettle', 'homeassistant/fridge']
+    assert messages[1][2] == '99', messages
+    published = messages[1][0]
+
+    # Identical payloads are suppressed
+    for _ in range(10):
+        queue.put('kettle', 'brewery/kettle', '99', value=99)
+    assert not await _drain(queue, 0.1)
+    assert queue.suppressed == 1 and queue.pending() == 0, (queue.suppressed, queue.pending())
+
+    # Deadband: a small change is held back until the interval passed, a large change is published immediately
+    queue.set_deadband('kettle', change=0.5, interval=10)
+    queue.put('kettle', 'brewery/kettle', '99.2', value=99.2)
+    messages = await _drain(queue, 5)
+    assert not messages, messages
+    queue.put('kettle', 'brewery/kettle', '99.3', value=99.3)
+    messages = await _drain(queue, 6)
+    assert [message[2] for message in messages] == ['99.3'], messages
+    delay = time.ticks_diff(messages[0][0], published)
+    assert 10000 <= delay < 10100, delay
+    queue.put('kettle', 'brewery/kettle', '98', value=98)
+    messages = await _drain(queue, 0.1)
+    assert [message[2] for message in messages] == ['98'], messages
+
+    # Rate limit: a burst, followed by the sustained rate
+    queue = PublishQueue(rate=5, burst=20)
+
+    async def produce():
+        for index in range(1000):
+            queue.put(f'sensor {index % 50}', f'brewery/sensor_{index % 50}', str(index))
+            await asyncio.sleep_ms(10)
+    producer = asyncio.create_task(produce())
+    messages = await _drain(queue, 10)
+    producer.cancel()
+    print(f'rate limit: {len(messages)} messages in 10s (burst 20 + 5/s), {queue.suppressed} suppressed')
+    assert 69 <= len(messages) <= 71, len(messages)
+    sensors = set(message[1] for message in messages)
+    assert len(sensors) == 50, 'every sensor should get its turn'
+
+
+def test():
+    """Test coalescing, suppression of identical payloads, the deadband and the rate limit."""
+    if simulation is not None:
+        loop = simulation.use_virtual_time()
+        try:
+            loop.run_until_complete(_test())
+        finally:
+            loop.close()
+    else:
+        asyncio.run(_test())
+
+
+if __name__ == '__main__':
+    test()
@@ -0,0 +1,329 @@
+"""Test and benchmark the recipe module.
+
+This test runs on the host from the src folder: `python test/recipe_test.py`
+The benchmark compares loading recipe5.json with the previous recipe5.py module (compiled from source, as
+MicroPython does for a .py file): the duration, the peak of the heap while loading (tracemalloc) and the memory kept
+by the recipe. Then it brews recipe5.json with a simulated kettle, evaluating the recipe every 0.5s: the calls of the
+callback, the messages MQTT publishes (a repeated payload is dropped), the alerts and the peak heap per tick.
+
+Result (host, CPython 3.11):
+recipe5.py (compile + import)     278 us  peak heap: 66364 bytes  kept: 4588 bytes
+recipe5.json (load + compile)      69 us  peak heap:  9567 bytes  kept: 3223 bytes
+brew of 4.68h (33672 ticks)  callbacks: 205  published: 203  alerts: 10  peak heap: 73.4 bytes/tick
+The previous recipe, publishing its state every tick:
+brew of 4.68h (33665 ticks)  callbacks: 67346  published: 10231  alerts: 1214  peak heap: 279.2 bytes/tick
+"""
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.append('.')  # Support running on the host from the src folder
+import simulation  # pylint: disable=unused-import
+import config
+import recipe
+from simulation.manual_clock import ManualClock
+from simulation.plant import Kettle
+from recipe import HOLD, NOT_STARTED, RAMP, STALE, Recipe, Stage
+
+RECIPE = os.path.abspath('recipe5.json')
+OLD_RECIPE = '''
+from clock import Clock, SYSTEM_CLOCK
+from recipe import Recipe, Stage
+
+
+def get_recipe(callback, clock=SYSTEM_CLOCK) -> Recipe:
+    return Recipe('Brönald #5 - Abraham',
+                  # stage name, duration [s], target temperature [°C], (manual action to perform at end of stage)
+                  [Stage('Preheat', 0, 65, 'Add malt and cooked oats'),
+                   Stage('Maichen phase1', 30 * 60, 63),  # TODO: start unconditionally
+                   Stage('Maichen phase2', 15 * 60, 67),  # TODO: start unconditionally
+                   Stage('Maichen phase3', 30 * 60, 72),  # TODO: start unconditionally
+                   Stage('Maichen phase4', 5 * 60, 77, 'Filter/remove grains'),  # TODO: start unconditionally
+                   Stage('Boil phase1', 30 * 60, 100, 'Add first hops'),
+                   Stage('Boil phase2', 50 * 60, 100, 'Add rest of hops and sugar'),  # TODO: start unconditionally
+                   Stage('Boil phase3', 10 * 60, 100, 'Whirlpool and start cooling'),  # TODO: start unconditionally
+                   Stage('Cooling', 0, 19, 'Transfer wort to fermentation vessel and add yeast', False)],
+                  callback, clock)
+'''
+
+
+class _Messages():
+    """Callback of the recipe: keeps the messages."""
+
+    def __init__(self) -> None:
+        self.messages = list()
+
+    def __call__(self, **measurements):
+        self.messages.extend(measurements.items())
+
+    def last(self, key: str):
+        return [value for name, value in self.messages if name == key][-1]
+
+
+def test_load():
+    """The JSON recipe is compiled into the schedule, the same as the previous recipe5.py."""
+    namespace = dict()
+    exec(compile(OLD_RECIPE, 'recipe5.py', 'exec'), namespace)
+    old = namespace['get_recipe'](_Messages(), ManualClock()).schedule
+    new = recipe.load(RECIPE, _Messages(), ManualClock(), progress=None).schedule
+    assert new.count == old.count == 9
+    for name in ('names', 'actions', 'kinds', 'wait', 'temperatures', 'durations'):
+        assert getattr(new, name) == getattr(old, name), name
+    assert list(new.durations[:3]) == [0, 1800, 900] and new.wait[-1] == 0 and new.wait[0] == 1
+
+
+def test_kinds():
+    """A ramp changes the target at its rate, a hold starts immediately (e.g. a fermentation profile of days)."""
+    clock = ManualClock()
+    messages = _Messages()
+    profile = Recipe('Fermentation', [Stage('Primary', 5 * 86400, 18, kind=HOLD),
+                                      Stage('Diacetyl rest', 2 * 86400, 22, kind=RAMP, rate=0.5),
+                                      Stage('Crash', 86400, 2, kind=RAMP, rate=2.0)], messages, clock)
+    assert profile.get_target_temperature(20.0) == 18 and messages.last('recipe_info').endswith('edge=0')
+    clock.now += 5 * 86400 - 1
+    assert profile.get_target_temperature(18.0) == 18 and profile.index == 0
+    clock.now += 1
+    assert profile.get_target_temperature(18.0) == 18 and profile.index == 1
+    assert profile.get_target_temperature(18.0) == 18 and profile.schedule.starts[1] == clock.now
+    clock.now += 4 * 3600
+    assert abs(profile.get_target_temperature(20.0) - 20.0) < 1e-6, 'ramp: 0.5 C/h'
+    clock.now += 4 * 3600
+    assert profile.get_target_temperature(22.0) == 22
+    assert messages.last('recipe') == 'Diacetyl rest: 2880:00 remaining', 'the duration starts after the ramp'
+    clock.now += 2 * 86400
+    profile.get_target_temperature(22.0)
+    assert profile.index == 2
+    profile.get_target_temperature(22.0)
+    clock.now += 3600
+    assert abs(profile.get_target_temperature(20.0) - 20.0) < 1e-6, 'ramp down: 2 C/h'
+    clock.now += 86400 + 10 * 3600
+    assert profile.get_target_temperature(2.0) == -273, 'finished'
+
+
+def test_events():
+    """The remaining time is published at whole minutes, an action is published and alerted once."""
+    clock = ManualClock()
+    messages = _Published()
+    mash = Recipe('Mash', [Stage('Rest', 150, 63, 'Remove grains'), Stage('Boil', 60, 100)], messages, clock)
+    mash.get_target_temperature(62.0)
+    assert messages.last('recipe') == 'Rest: Waiting to start' and mash.next_event_at == recipe.NEVER
+    mash.get_target_temperature(63.0)  # The temperature is reached
+    start = clock.now
+    assert messages.last('recipe') == 'Rest: 2:30 remaining' and mash.next_event_at == start + 30
+    calls = messages.calls
+    for _ in range(59):
+        clock.now += 0.5
+        mash.get_target_temperature(63.0)
+    assert messages.calls == calls, 'no messages between the events'
+    clock.now += 0.5
+    mash.get_target_temperature(63.0)
+    assert messages.last('recipe') == 'Rest: 2:00 remaining' and mash.next_event_at == start + 90
+    clock.now = start + 150
+    assert mash.get_target_temperature(63.0) == 63 and messages.last('recipe') == 'Action: Remove grains'
+    calls = messages.calls
+    for _ in range(100):
+        clock.now += 0.5
+        mash.get_target_temperature(63.0)
+    assert messages.calls == calls and mash.next_event_at == recipe.NEVER, 'the action is published once'
+    mash.ack_action()
+    assert mash.get_target_temperature(63.0) == 100 and mash.index == 1
+
+
+def test_time_step():
+    """A step of the wall time (e.g. the first SNTP synchronization) does not change the duration of a stage."""
+    clock = ManualClock()
+    messages = _Messages()
+    mash = Recipe('Mash', [Stage('Rest', 1800, 63), Stage('Boil', 60, 100)], messages, clock)
+    mash.get_target_temperature(63.0)
+    clock.offset = -3600
+    clock.now += 900
+    mash.get_target_temperature(63.0)
+    assert mash.index == 0 and messages.last('recipe') == 'Rest: 15:00 remaining', messages.last('recipe')
+    assert '<td>%02d:%02d</td>' % time.localtime(clock.time() - 900)[3:5] in mash.web_page('recipe'), \
+        'the start is shown in wall time'
+    clock.offset = 7200
+    clock.now += 900
+    assert mash.get_target_temperature(63.0) == 100 and mash.index == 1
+
+
+def test_set_stage():
+    """Moving back to a stage starts it and the stages after it all over, restart() starts the recipe all over."""
+    clock = ManualClock()
+    messages = _Messages()
+    mash = Recipe('Mash', [Stage('Rest', 150, 63, 'Remove grains'), Stage('Boil', 60, 100)], messages, clock)
+    mash.get_target_temperature(63.0)
+    clock.now += 150
+    mash.get_target_temperature(63.0)
+    mash.ack_action()
+    mash.get_target_temperature(100.0)  # Boil is started
+    mash.set_stage(0)
+    assert list(mash.schedule.starts) == [NOT_STARTED] * 2 and list(mash.schedule.ends) == [NOT_STARTED] * 2
+    assert mash.get_target_temperature(100.0) == 63 and messages.last('recipe') == 'Rest: Waiting to start', \
+        'the stage is not finished at once'
+    mash.get_target_temperature(63.0)
+    assert messages.last('recipe') == 'Rest: 2:30 remaining' and mash.index == 0
+    clock.now += 150
+    mash.get_target_temperature(63.0)
+    mash.ack_action()
+    mash.get_target_temperature(100.0)
+    mash.restart()
+    assert mash.index == 0 and mash.get_target_temperature(100.0) == 63 and mash.schedule.starts[0] == NOT_STARTED
+
+
+def test_resume():
+    """The progress is written at the stage transitions, a new recipe (after a reset) resumes it. A finished recipe, or
+    progress of which the stage is overdue for more than STALE, is not resumed; a pending action is never overdue.
+    """
+    with tempfile.TemporaryDirectory(prefix='recipe_') as folder:
+        filename = f'{folder}/progress.json'
+        clock = ManualClock()
+        messages = _Messages()
+        brew = recipe.load(RECIPE, messages, clock, progress=filename)
+        brew.get_target_temperature(20.0)
+        brew.get_target_temperature(65.0)  # The temperature is reached: preheat is started, it waits for the action
+        config._configs.clear()
+        waiting = recipe.load(RECIPE, _Messages(), ManualClock(now=0.0, offset=clock.time() + 2 * STALE),
+                              progress=filename)
+        assert waiting.index == 0 and waiting.schedule.starts[0] != NOT_STARTED, 'a pending action is never overdue'
+        brew.ack_action()
+        brew.get_target_temperature(65.0)
+        brew.get_target_temperature(63.0)  # Maichen phase1 is started
+        writes = brew._progress.writes
+        for _ in range(100):  # Writes only happen at transitions
+            clock.now += 1
+            brew.get_target_temperature(63.0)
+        assert brew._progress.writes == writes and brew.index == 1
+        before = clock.now
+        clock = ManualClock(now=0.0, offset=clock.time() + 1800)  # The monotonic time restarts at the reset
+
+        config._configs.clear()  # Load the progress file again, as after a reset
+        messages = _Messages()
+        resumed = recipe.load(RECIPE, messages, clock, progress=filename)
+        assert resumed.index == 1 and messages.last('recipe') == 'Maichen phase1: resumed'
+        started = [start - before - 1800 if start != NOT_STARTED else start for start in brew.schedule.starts]
+        assert list(resumed.schedule.starts) == started and resumed.schedule.starts[1] == -1900, resumed.schedule.starts
+        assert resumed.get_target_temperature(63.0) == 67 and resumed.index == 2, 'the duration of phase1 passed'
+        config._configs.clear()
+        later = ManualClock(now=0.0, offset=clock.time() + STALE - 1)
+        assert recipe.load(RECIPE, _Messages(), later, progress=filename).index == 2, 'waiting for the temperature'
+        config._configs.clear()
+        later = ManualClock(now=0.0, offset=clock.time() + STALE + 1)
+        stale = recipe.load(RECIPE, _Messages(), later, progress=filename)
+        assert stale.index == 0 and stale.schedule.starts[0] == NOT_STARTED, 'the progress of a previous brew is stale'
+
+        resumed.set_stage(8)
+        resumed.get_target_temperature(30.0)
+        resumed.get_target_temperature(19.0)  # Cooling is started (it has no duration and does not wait)
+        assert resumed.get_target_temperature(19.0) == -273
+        config._configs.clear()
+        fresh = recipe.load(RECIPE, _Messages(), clock, progress=filename)
+        assert fresh.index == 0 and fresh.schedule.starts[0] == NOT_STARTED, 'a finished recipe is not resumed'
+
+
+def _measure(load) -> tuple:
+    """Measure the duration, the peak heap and the memory kept of loading a recipe."""
+    load()  # Warm up (imports)
+    start = time.perf_counter()
+    for _ in range(100):
+        load()
+    elapsed = (time.perf_counter() - start) / 100
+    tracemalloc.start()
+    result = load()
+    kept, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return elapsed, peak, kept
+
+
+class _Published(_Messages):
+    """Callback of the recipe: counts the calls and the messages MQTT publishes (a repeated payload is dropped)."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.calls = 0
+        self.published = 0
+        self._last = dict()
+
+    def __call__(self, **measurements):
+        self.calls += 1
+        for key, value in measurements.items():
+            if self._last.get(key) != value:
+                self._last[key] = value
+                self.published += 1
+                self.messages.append((key, value))
+
+
+def _brew(interval: float = 0.5, delay: float = 60.0):
+    """Brew recipe5.json with a simulated kettle: the recipe is evaluated every control tick (interval), the brewer
+    acknowledges an action after the delay.
+    Return the number of ticks, the calls of the callback, the published messages, the alerts and the peak heap per
+    tick.
+    """
+    alerts = [0]
+    alert = recipe.state.alert
+
+    def counting_alert(key, message):
+        alerts[0] += 1
+        alert(key, message)
+    recipe.state.alert = counting_alert
+    clock = ManualClock()
+    messages = _Published()
+    brew = recipe.load(RECIPE, messages, clock, progress=None)
+    kettle = Kettle()
+    pending = None
+    ticks = 0
+    peak = 0
+    tracemalloc.start()
+    while True:
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        target = brew.get_target_temperature(round(kettle.probe, 1))  # The resolution of the sensor
+        peak += tracemalloc.get_traced_memory()[1] - before
+        if target == -273:
+            break
+        message = messages._last.get('recipe', '')
+        if pending is None and message.startswith('Action:'):
+            pending = clock.now + delay
+        elif pending is not None and clock.now >= pending:
+            if 'cooling' in message:
+                kettle.chiller = 300.0
+            brew.ack_action()
+            pending = None
+        kettle.step(interval, 1 if kettle.probe < target else 0)
+        clock.now += interval
+        ticks += 1
+    tracemalloc.stop()
+    recipe.state.alert = alert
+    return ticks, messages.calls, messages.published, alerts[0], peak / ticks
+
+
+def benchmark():
+    """Compare loading recipe5.json with compiling and importing the previous recipe5.py, and count the messages
+    and allocations of a brew.
+    """
+    def load_python():
+        namespace = dict()
+        exec(compile(OLD_RECIPE, 'recipe5.py', 'exec'), namespace)
+        return namespace['get_recipe'](lambda **_: None, ManualClock())
+
+    def load_json():
+        return recipe.load(RECIPE, lambda **_: None, ManualClock(), progress=None)
+
+    for name, load in (('recipe5.py (compile + import)', load_python), ('recipe5.json (load + compile)', load_json)):
+        elapsed, peak, kept = _measure(load)
+        print(f'{name:30}  {elapsed * 1e6:5.0f} us  peak heap: {peak:5} bytes  kept: {kept:4} bytes')
+    ticks, calls, published, alerts, peak = _brew()
+    print(f'brew of {ticks * 0.5 / 3600:.2f}h ({ticks} ticks)  callbacks: {calls}  published: {published}'
+          f'  alerts: {alerts}  peak heap: {peak:.1f} bytes/tick')
+
+
+if __name__ == '__main__':
+    test_load()
+    test_kinds()
+    test_events()
+    test_time_step()
+    test_set_stage()
+    test_resume()
+    benchmark()
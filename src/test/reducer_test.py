@@ -0,0 +1,75 @@
+"""Test the reducer module against straightforward (sorting) implementations.
+
+It runs on the target, or on the host from the src folder: `python test/reducer_test.py`
+
+>>> import reducer_test
+>>> reducer_test.test()
+"""
+import random
+import sys
+
+sys.path.append('lib')  # Support running on the host from the src folder
+
+import reducer
+
+
+def _median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    return values[middle] if len(values) % 2 else (values[middle - 1] + values[middle]) / 2
+
+
+def _trimmed_mean(values, proportion):
+    values = sorted(values)
+    trim = int(len(values) * proportion)
+    values = values[trim:len(values) - trim]
+    return sum(values) / len(values)
+
+
+def _hampel(values, threshold):
+    median = _median(values)
+    limit = threshold * reducer.Hampel.MAD_SCALE * _median([abs(value - median) for value in values])
+    values = [value for value in values if abs(value - median) <= limit]
+    return sum(values) / len(values)
+
+
+def _check(name, measured, expected):
+    assert abs(measured - expected) < 1e-3 * max(1, abs(expected)), '%s: %f != %f' % (name, measured, expected)
+
+
+def test():
+    """Compare all reducers with the reference implementations, for several window sizes."""
+    random.seed(5)
+    mean = reducer.Mean(capacity=40)
+    median = reducer.Median(capacity=40)
+    trimmed = reducer.TrimmedMean(capacity=40, proportion=0.2)
+    hampel = reducer.Hampel(capacity=40)
+    ewma = reducer.Ewma()
+    buffers = [mean.buffer, median.buffer, median.sorted]
+    for size in (1, 2, 5, 33, 40):
+        for instance in (mean, median, trimmed, hampel, ewma):
+            instance.resize(size)
+        window = list()
+        expected_ewma = None
+        for index in range(200):
+            # Measurements with a few spikes and a lot of repeated values
+            value = round(random.gauss(65, 0.5), 1) if index % 17 else -273.15
+            window = (window + [value])[-size:]
+            expected_ewma = value if expected_ewma is None else expected_ewma + 2 / (size + 1) * (value - expected_ewma)
+            for instance in (mean, median, trimmed, hampel, ewma):
+                instance.add(value)
+            assert list(median.sorted[:median.count]) == sorted(median.buffer[:median.count])
+            _check('mean', mean.get(), sum(window) / len(window))
+            _check('median', median.get(), _median(window))
+            _check('trimmed', trimmed.get(), _trimmed_mean(window, 0.2))
+            _check('hampel', hampel.get(), _hampel(window, 3.0))
+            _check('ewma', ewma.get(), expected_ewma)
+            if size >= 5 and index >= size:
+                assert hampel.get() > 60, 'spike not removed'
+    assert all(a is b for a, b in zip(buffers, [mean.buffer, median.buffer, median.sorted])), 'buffers reallocated'
+    mean.resize(100)
+    assert mean.size == 40, 'size should be limited by the capacity'
+
+
+if __name__ == '__main__':
+    test()
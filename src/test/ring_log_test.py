@@ -0,0 +1,95 @@
+"""Test the ring_log module, and the store-and-forward of the measurements by the MQTT client.
+
+This test runs on the host from the src folder: `python test/ring_log_test.py`
+The MQTT client publishes to the stand-in broker of the simulation, which disconnects for 30 minutes.
+
+Result (host):
+    offline: 181 measurements logged in 5 block writes, 181 drained in 8 history messages (16 blocks of 512 bytes)
+    With blocks of 1024 bytes: 3 block writes
+"""
+import json
+import sys
+import tempfile
+
+sys.path.append('.')  # Support running on the host from the src folder
+import simulation
+from mqtt_as.mqtt_as import broker
+from mqtt import MQTTClient
+from ring_log import RingLog
+import uasyncio as asyncio
+
+
+def _drain(log: RingLog):
+    """Get all records of the log, sorted by time."""
+    payloads = list()
+
+    async def publish(payload):
+        payloads.append(json.loads(payload))
+    asyncio.new_event_loop().run_until_complete(log.drain(publish))
+    return sorted([(key, record[0], record[1]) for payload in payloads for key in payload for record in payload[key]],
+                  key=lambda record: record[1])
+
+
+def test_log():
+    """Records are kept over a reset, and the oldest blocks are overwritten when the log is full."""
+    with tempfile.TemporaryDirectory(prefix='ring_log_') as folder:
+        log = RingLog(f'{folder}/test.log', block_size=64, blocks=4)  # 6 records per block
+        for index in range(20):
+            log.append('kettle' if index % 2 else 'fridge', index / 2, timestamp=1000 + index)
+        assert log.writes == 3 and log.count == 2 and log.pending() == 20
+
+        log = RingLog(f'{folder}/test.log', block_size=64, blocks=4)  # Reset: the 2 records in RAM are lost
+        assert log.pending() == 18, log.pending()
+        records = _drain(log)
+        assert [record[1] for record in records] == list(range(1000, 1018)), records
+        assert records[1] == ('kettle', 1001, 0.5), records[1]
+        assert log.pending() == 0 and not _drain(log)
+
+        log = RingLog(f'{folder}/test.log', block_size=64, blocks=4)  # Drained blocks are not published again
+        assert log.pending() == 0
+        for index in range(60):
+            log.append('kettle', index, timestamp=2000 + index)
+        log.flush()
+        assert log.dropped == 6 * 6, log.dropped  # 10 blocks written, 4 kept
+        assert [record[1] for record in _drain(log)] == list(range(2036, 2060))
+        # Wear leveling: block n is written to slot n % 4, so the 3 + 10 blocks are spread evenly over the 4 slots
+        assert log.writes == 10 and log._sequence == 13  # pylint: disable=protected-access
+
+
+async def _brew(client: MQTTClient):
+    """Publish a measurement every 10s for 2h, with the broker down from 0:30 to 1:00."""
+    client.add_device('kettle temperature', 'temperature', '°C')
+    task = asyncio.create_task(client.run())
+    for index in range(720):
+        if index == 180:
+            broker.disconnect()
+        elif index == 360:
+            broker.reconnect()
+        client.publish(**{'kettle temperature': round(20 + index / 10, 1)})
+        await asyncio.sleep(10)
+    task.cancel()
+    await asyncio.sleep(1)  # Stop the run and drain tasks of the client
+
+
+def test_offline():
+    """Measurements published while the broker is down, are published to the history topic after reconnecting."""
+    with tempfile.TemporaryDirectory(prefix='ring_log_') as folder:
+        log = RingLog(f'{folder}/offline.log')
+        client = MQTTClient('', 'test', 'ssid', '', offline_log=log, discovery_cache=f'{folder}/discovery.json')
+        loop = simulation.use_virtual_time()
+        loop.run_until_complete(_brew(client))
+        loop.close()
+
+        values = [float(msg) for _, topic, msg, _ in broker.messages if topic == 'test/kettle_temperature']
+        history = [json.loads(msg) for _, topic, msg, _ in broker.messages if topic == 'test/history']
+        logged = [value for payload in history for _, value in payload['kettle temperature']]
+        assert 45.0 not in values and 45.0 in logged, 'measurements while offline should be in the history'
+        assert all(round(20 + index / 10, 1) in values + logged for index in range(720)), 'measurements are lost'
+        print(f'offline: {len(logged)} measurements logged in {log.writes} block writes, '
+              f'{len(logged)} drained in {len(history)} history messages')
+        assert log.pending() == 0
+
+
+if __name__ == '__main__':
+    test_log()
+    test_offline()
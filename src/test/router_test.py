@@ -0,0 +1,120 @@
+"""Test the router module, and the commands received by the MQTT client.
+
+This test runs on the host from the src folder: `python test/router_test.py`
+The benchmark measures the latency from publishing a command at the stand-in broker until the output pin is set.
+
+Result (host, CPython 3.11):
+command topic (test/kettle_switch/set)  latency: mean  20 us  p99  47 us
+config topic (test/config, json)        latency: mean  23 us  p99  51 us
+Both include the task switch to the command handler; the trie lookup and scalar parsing save the json decoding.
+"""
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append('.')  # Support running on the host from the src folder
+import simulation  # pylint: disable=unused-import
+from machine import Pin
+from mqtt_as.mqtt_as import broker
+from mqtt import MQTTClient
+from router import Router, scalar
+import uasyncio as asyncio
+
+KETTLE_SWITCH = 13
+
+
+def test_router():
+    """Exact levels take precedence over the + and # wildcards."""
+    router = Router()
+    router.add('brewery/kettle_switch/set', 'kettle')
+    router.add('brewery/+/set', 'any set')
+    router.add('brewery/#', 'any')
+    router.add('homeassistant/status', 'status')
+    assert router.get('brewery/kettle_switch/set') == 'kettle'
+    assert router.get('brewery/fridge_switch/set') == 'any set'
+    assert router.get('brewery/fridge_switch/get') == 'any'
+    assert router.get('brewery') is None
+    assert router.get('homeassistant/status/x') is None
+    assert router.topics == ['brewery/kettle_switch/set', 'brewery/+/set', 'brewery/#', 'homeassistant/status']
+    assert scalar(b'') == () and scalar(b'3') == (3,) and scalar(b'65.5') == (65.5,) and scalar(b'ON') == ('ON',)
+
+
+def test_not_finite():
+    """A number which is not finite is rejected (e.g. a target temperature of nan)."""
+    for payload in (b'nan', b'NaN', b'inf', b'-inf', b'Infinity', b'1e999'):
+        try:
+            scalar(payload)
+        except ValueError:
+            continue
+        raise AssertionError(f'{payload} is accepted')
+
+
+async def _commands(client: MQTTClient, topic: str, payloads, switched: asyncio.Event):
+    """Get the latency of every command: from publishing until the pin is switched. [s]"""
+    latencies = list()
+    for payload in payloads:
+        switched.clear()
+        start = time.perf_counter()
+        broker.publish(topic, payload)
+        await switched.wait()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+async def _test(benchmark: bool):
+    switched = asyncio.Event()
+    stages = list()
+
+    def switch(state):
+        Pin(KETTLE_SWITCH).value(1 if state == 'ON' else 0)
+        switched.set()
+
+    async def set_stage(index):  # A slow command
+        await asyncio.sleep(1)
+        stages.append(index)
+
+    client = MQTTClient('', 'test', 'ssid', '')
+    client.add_device('kettle switch', 'outlet', callback=switch)
+    client.add_device('recipe_stage', 'action', None, set_stage)
+    client.add_device('recipe_ack_action', 'action', None, lambda: stages.append('ack'))
+    task = asyncio.create_task(client.run())
+    await asyncio.sleep(0.1)
+
+    broker.publish('test/recipe_stage/set', '3')
+    await _commands(client, 'test/kettle_switch/set', ['ON'], switched)  # Not blocked by the slow command
+    assert Pin.levels[KETTLE_SWITCH] == 1 and not stages
+    broker.publish('test/config', 'recipe_ack_action')
+    broker.publish('test/config', '{"recipe_stage": 4}')
+    await asyncio.sleep(1.1)
+    assert stages == ['ack', 3, 4], stages
+
+    if benchmark:
+        count = 2000
+        for name, topic, payloads in (
+                ('command topic (test/kettle_switch/set)', 'test/kettle_switch/set', ('ON', 'OFF') * (count // 2)),
+                ('config topic (test/config, json)', 'test/config',
+                 ('{"kettle_switch": "ON"}', '{"kettle_switch": "OFF"}') * (count // 2))):
+            latencies = sorted(await _commands(client, topic, payloads, switched))
+            print(f'{name:38}  latency: mean {sum(latencies) / count * 1e6:3.0f} us  '
+                  f'p99 {latencies[int(0.99 * count)] * 1e6:3.0f} us')
+    task.cancel()
+
+
+def test(benchmark=False):
+    cwd = os.getcwd()
+    os.chdir(tempfile.mkdtemp(prefix='router_'))
+    try:
+        test_router()
+        test_not_finite()
+        with contextlib.redirect_stdout(io.StringIO()) as log:
+            asyncio.run(_test(benchmark))
+        print('\n'.join(line for line in log.getvalue().splitlines() if 'latency' in line))
+    finally:
+        os.chdir(cwd)
+
+
+if __name__ == '__main__':
+    test(benchmark=True)
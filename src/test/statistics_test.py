@@ -0,0 +1,100 @@
+"""Property tests of statistics.RunningStats against the statistics module of CPython.
+
+This test runs on the host from the src folder: `python test/statistics_test.py`
+Note: lib/statistics.py is loaded as "mp_statistics" and the CPython module as "py_statistics", because they have
+the same name: when lib is in the path (e.g. another test imported simulation), `import statistics` loads lib.
+"""
+import importlib.util
+import math
+import os
+import random
+import sysconfig
+from array import array
+
+
+def _load(name: str, path: str):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+mp_statistics = _load('mp_statistics', os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lib',
+                                                    'statistics.py'))
+py_statistics = _load('py_statistics', os.path.join(sysconfig.get_paths()['stdlib'], 'statistics.py'))
+
+
+def _close(measured, expected):
+    return math.isclose(measured, expected, rel_tol=1e-9, abs_tol=1e-9)
+
+
+def _random_data():
+    count = random.randint(2, 200)
+    offset = random.choice((0, 20, 65, 1e6))
+    scale = random.choice((1e-3, 1, 100))
+    return [offset + random.gauss(0, scale) for _ in range(count)]
+
+
+def test(nr_of_examples=500):
+    """Verify the running statistics, the merge and the exponentially weighted mean for random data."""
+    random.seed(6)
+    for _ in range(nr_of_examples):
+        data = _random_data()
+        running = mp_statistics.RunningStats()
+        running.extend(array('d', data))
+        assert running.count == len(data)
+        assert running.min == min(data) and running.max == max(data)
+        assert _close(running.mean(), py_statistics.fmean(data))
+        assert _close(running.variance(), py_statistics.variance(data)), \
+            (running.variance(), py_statistics.variance(data))
+        assert _close(running.pvariance(), py_statistics.pvariance(data))
+        assert _close(running.stdev(), py_statistics.stdev(data))
+        assert _close(running.pstdev(), py_statistics.pstdev(data))
+
+        split = random.randint(0, len(data))
+        first = mp_statistics.RunningStats()
+        first.extend(memoryview(array('d', data[:split])))
+        second = mp_statistics.RunningStats()
+        second.extend(data[split:])
+        merged = first.merge(second)
+        assert merged.count == len(data)
+        assert merged.min == min(data) and merged.max == max(data)
+        assert _close(merged.mean(), py_statistics.fmean(data))
+        assert _close(merged.variance(), py_statistics.variance(data))
+
+        alpha = random.uniform(0.01, 0.9)
+        running = mp_statistics.RunningStats(alpha)
+        running.extend(data)
+        ew_mean = data[0]
+        for value in data[1:]:
+            ew_mean = alpha * value + (1 - alpha) * ew_mean
+        assert _close(running.ew_mean, ew_mean)
+        # The exponentially weighted variance: the weight of the first value is (1 - alpha)^(n-1)
+        weights = [(1 - alpha) ** (len(data) - 1)] + [alpha * (1 - alpha) ** (len(data) - 1 - index)
+                                                      for index in range(1, len(data))]
+        ew_variance = sum(weight * (value - ew_mean) ** 2 for weight, value in zip(weights, data))
+        assert math.isclose(running.ew_variance, ew_variance, rel_tol=1e-6, abs_tol=1e-9 * (1 + ew_mean * ew_mean)), \
+            (running.ew_variance, ew_variance)
+        constant = mp_statistics.RunningStats(alpha)
+        constant.extend([data[0]] * 10)
+        assert constant.ew_variance == 0 and constant.ew_mean == data[0]
+
+
+def test_few():
+    """The mean and the variance of too few data points raise ValueError, like the statistics module of CPython."""
+    running = mp_statistics.RunningStats()
+    for name, nr_of_points in (('mean', 1), ('variance', 2), ('stdev', 2), ('pvariance', 1), ('pstdev', 1)):
+        for count in range(nr_of_points):
+            running.clear()
+            running.extend([1.0] * count)
+            for function in (getattr(running, name), lambda: getattr(py_statistics, name)([1.0] * count)):
+                try:
+                    function()
+                    assert False, f'{name} of {count} data points'
+                except ValueError:  # statistics.StatisticsError is a ValueError
+                    pass
+
+
+if __name__ == '__main__':
+    test()
+    test_few()
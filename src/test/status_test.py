@@ -0,0 +1,169 @@
+"""Test and benchmark the status LEDs.
+
+This test runs on the host from the src folder: `python test/status_test.py`
+The benchmark runs a minute of the event loop on virtual time, with a blinking state, a change of the state and an
+alert, and counts the wakeups of the event loop (the iterations that run a callback), the updates of the LEDs in
+Python and the writes to the outputs. The reference is the previous implementation: a task that polled update().
+
+Result (host, CPython 3.11):
+polling task (0.3s)    loop wakeups:  203/min  LED updates:  203/min  output writes:  161/min
+PWM (event driven)     loop wakeups:    4/min  LED updates:    3/min  output writes:    3/min
+The remaining wakeups are those of the benchmark itself: its start, its two sleeps and its end.
+"""
+import asyncio
+import sys
+import time
+
+sys.path.append('.')  # Support running on the host from the src folder
+import simulation  # pylint: disable=unused-import
+from machine import Pin, PWM
+import status
+from status import BLINK_FREQUENCY, Status2Leds, _Status
+
+RED = 25  # The pins of config.json
+GREEN = 26
+
+
+class OldStatus2Leds(_Status):
+    """Reference implementation: the previous Status2Leds, blinking by a task that polls update()."""
+    BLINK_INTERVAL = 0.3
+
+    def __init__(self, red: int, green: int):
+        self.red = Pin(red, Pin.OUT)
+        self.green = Pin(green, Pin.OUT)
+        self._last_update = 0
+        self.phases = dict()
+        self._blink_on = True
+        self.prev_red_state = 0
+        self.prev_green_state = 0
+        self.updates = 0
+        self.writes = 0
+        super().__init__()
+
+    async def auto_update(self):
+        while True:
+            self.update()
+            await asyncio.sleep(self.BLINK_INTERVAL)
+
+    def update(self, phase: str = None, color: int = None):
+        self.updates += 1
+        if phase in self.phases:
+            del self.phases[phase]
+        if color:
+            self.phases[phase] = color
+        now = time.time()
+        if phase is not None or abs(now - self._last_update) > self.BLINK_INTERVAL:
+            self._last_update = now
+            self._blink_on = True if phase is not None else not self._blink_on
+            red_state = 0
+            green_state = 0
+            for cur_color in self.phases.values():
+                if cur_color & self.RED:
+                    red_state = cur_color
+                if cur_color & self.GREEN:
+                    green_state = cur_color
+            if not self._blink_on:
+                if red_state & self.BLINK:
+                    red_state = 0
+                if green_state & self.BLINK:
+                    green_state = 0
+            if red_state != self.prev_red_state:
+                self.prev_red_state = red_state
+                self.red.value(red_state)
+                self.writes += 1
+            if green_state != self.prev_green_state:
+                self.prev_green_state = green_state
+                self.green.value(green_state)
+                self.writes += 1
+
+
+def test():
+    """The LEDs show the last phase with their color, blinking is done by the PWM outputs."""
+    leds = Status2Leds(red='led.red', green='led.green')
+    red, green = PWM.outputs[RED], PWM.outputs[GREEN]
+    assert red.freq() == green.freq() == BLINK_FREQUENCY
+    assert red.duty() == status.DUTY_BLINK and green.duty() == 0, 'booting: red blinks'
+    leds.start_auto_update()
+    assert red.duty() == 0 and green.duty() == status.DUTY_ON, 'ready: green'
+    leds.set_state('WIFI', leds.GREEN | leds.BLINK, 'Connecting to access point')
+    assert green.duty() == status.DUTY_BLINK
+    levels = set()
+    for _ in range(20):  # The hardware blinks the LED
+        levels.add(green.value())
+        time.sleep_ms(50)  # The simulated time (also when a previous test left it on virtual time)
+    assert levels == {0, 1}, levels
+    leds.set_state('WIFI', leds.GREEN, 'Connected to access point')
+    assert green.duty() == status.DUTY_ON and green.value() == 1
+
+    leds.alert('Recipe', 'add the hops')
+    leds.alert('Fridge', 'door open')
+    assert red.duty() == status.DUTY_BLINK and green.duty() == status.DUTY_ON, 'an alert blinks the red LED'
+    changes = red.changes + green.changes
+    leds.alert('Recipe', 'add the hops')
+    leds.set_info('Recipe', 'Mash')
+    leds.update()
+    assert red.changes + green.changes == changes, 'the outputs are only written when the state changes'
+    leds.alert('Recipe', None)
+    assert red.duty() == status.DUTY_BLINK, 'an alert is still active'
+    leds.alert('Fridge', None)
+    assert red.duty() == 0 and green.duty() == status.DUTY_ON
+    leds.alert('Fridge', None)  # An alert that is not active
+    assert red.duty() == 0
+
+
+async def _minute(leds: _Status):
+    """Run a minute with a blinking state, a change of the state and an alert."""
+    leds.set_state('WIFI', leds.GREEN | leds.BLINK, 'Connecting to access point')
+    await asyncio.sleep(20)
+    leds.set_state('WIFI', leds.GREEN, 'Connected to access point')
+    leds.alert('Recipe', 'add the hops')
+    await asyncio.sleep(40)
+
+
+def _count_wakeups(loop) -> list:
+    """Count the iterations of the event loop that run a callback."""
+    wakeups = [0]
+    run_once = loop._run_once
+
+    def counting_run_once():
+        if loop._ready or (loop._scheduled and loop._scheduled[0].when() <= loop.time()):
+            wakeups[0] += 1
+        run_once()
+    loop._run_once = counting_run_once
+    return wakeups
+
+
+def benchmark():
+    """Count the wakeups of the event loop, the LED updates and the output writes per minute."""
+    loop = simulation.use_virtual_time()
+    old = OldStatus2Leds(RED, GREEN)
+    task = loop.create_task(old.auto_update())
+    loop.run_until_complete(asyncio.sleep(0))  # Start the task
+    old.updates = old.writes = 0
+    wakeups = _count_wakeups(loop)
+    loop.run_until_complete(_minute(old))
+    task.cancel()
+    print(f'polling task (0.3s)    loop wakeups: {wakeups[0]:4}/min  LED updates: {old.updates:4}/min'
+          f'  output writes: {old.writes:4}/min')
+
+    new = Status2Leds(red='led.red', green='led.green')
+    new.start_auto_update()
+    updates = [0]
+    update = new.update
+
+    def counting_update(phase: str = None, color: int = None):
+        updates[0] += 1
+        update(phase, color)
+    new.update = counting_update
+    changes = PWM.outputs[RED].changes + PWM.outputs[GREEN].changes
+    wakeups = _count_wakeups(loop)
+    loop.run_until_complete(_minute(new))
+    writes = PWM.outputs[RED].changes + PWM.outputs[GREEN].changes - changes
+    print(f'PWM (event driven)     loop wakeups: {wakeups[0]:4}/min  LED updates: {updates[0]:4}/min'
+          f'  output writes: {writes:4}/min')
+    loop.close()
+
+
+if __name__ == '__main__':
+    test()
+    benchmark()
@@ -0,0 +1,191 @@
+"""Test and benchmark the temperature_control module with a simulated kettle and fridge.
+
+This test runs on the host from the src folder: `python test/temperature_control_test.py`
+The benchmark compares a task per zone (like the previous KettleControl) with one TemperatureControl task for the
+kettle and the fridge: the callbacks the event loop runs per minute (on virtual time), and the memory allocated per
+tick (tracemalloc).
+
+Result (host, CPython 3.11):
+kettle: 65.2 C after 4 hours (target 65), switched on: 28 times
+fridge: 18.0 C after 12 hours (target 18, ambient 25), compressor switched on: 3 times, shortest on: 1727s, shortest off: 12037s
+fridge: 17.9 C after 12 hours (target 18, ambient 10), heater switched on: 3 times, compressor: 0 times
+task per zone         loop callbacks:  484/min  allocated per tick: peak 216.0 bytes, kept 0.1 bytes
+one task (2 zones)    loop callbacks:  244/min  allocated per tick: peak 216.0 bytes, kept 0.1 bytes
+Every zone adds no task and no memory per tick: the peak is the temporaries of the interpreter (floats, frames).
+"""
+import asyncio
+import collections
+import sys
+import tracemalloc
+try:
+    from typing import Tuple
+except ImportError:
+    ...
+
+sys.path.append('.')  # Support running on the host from the src folder
+import simulation  # pylint: disable=unused-import
+from simulation.plant import Fridge, Kettle
+
+from controller import BangBang
+from switch import MinimumTimeSwitch, PowerSwitch
+from temperature_control import COOL, Actuator, TemperatureControl, Zone
+
+INTERVAL = 0.5
+
+
+class _Probe():
+    """Temperature sensor reading the probe of a plant."""
+
+    def __init__(self, plant) -> None:
+        self.plant = plant
+
+    def get(self) -> float:
+        return self.plant.probe
+
+
+class _Toggles():
+    """Callback of a switch: keeps the times of the toggles."""
+
+    def __init__(self) -> None:
+        self.time = 0.0
+        self.toggles = list()  # (time, state)
+
+    def __call__(self, **measurements):
+        for state in measurements.values():
+            self.toggles.append((self.time, state))
+
+    def on(self) -> int:
+        """Get the number of times the switch was turned on."""
+        return sum(1 for _, state in self.toggles if state == 'ON')
+
+    def shortest(self, state: str) -> float:
+        """Get the shortest duration of the state (the last one is not finished). [s]"""
+        durations = [self.toggles[index + 1][0] - moment for index, (moment, value) in enumerate(self.toggles[:-1])
+                     if value == state]
+        return min(durations) if durations else 0
+
+
+def _fridge(ambient: float, hours: float = 12):
+    """Control the fridge at 18 C, return the fridge, and the toggles of the compressor and the heater."""
+    fridge = Fridge(temperature=ambient, ambient=ambient)
+    compressor_toggles = _Toggles()
+    heater_toggles = _Toggles()
+    compressor = PowerSwitch('fridge switch', 12, callback=compressor_toggles)
+    heater = PowerSwitch('fridge heater switch', 14, callback=heater_toggles)
+    control = TemperatureControl(INTERVAL)
+    zone = control.add(Zone('fridge', _Probe(fridge), None,
+                            [Actuator(compressor, BangBang(0.5), COOL, min_on=180, min_off=300),
+                             Actuator(heater, BangBang(0.5))], deadband=1.0))
+    zone.set_target(18)
+    for tick in range(int(hours * 3600 / INTERVAL)):
+        compressor_toggles.time = heater_toggles.time = tick * INTERVAL
+        fridge.step(INTERVAL, compressor.state or 0, heater.state or 0)
+        control.update()
+    return fridge, compressor_toggles, heater_toggles
+
+
+def test():
+    """The kettle and the fridge are kept at their target, the compressor respects its minimum on and off time."""
+    switch = PowerSwitch('test', 15, callback=lambda **_: None)
+    guarded = MinimumTimeSwitch(switch, min_on=3, min_off=2)
+    states = list()
+    for on in (1, 0, 0, 0, 1, 1, 0, 1, 0, 0, 0, 0):
+        guarded.turn_on() if on else guarded.turn_off()
+        states.append(switch.state)
+    assert states == [1, 1, 1, 0, 0, 1, 1, 1, 0, 0, 0, 0], states
+
+    kettle = Kettle()
+    toggles = _Toggles()
+    heater = PowerSwitch('kettle switch', 13, callback=toggles)
+    control = TemperatureControl(INTERVAL)
+    zone = control.add(Zone('kettle', _Probe(kettle), lambda temperature: 65.0, [Actuator(heater)]))
+    for tick in range(int(4 * 3600 / INTERVAL)):
+        toggles.time = tick * INTERVAL
+        kettle.step(INTERVAL, heater.state or 0)
+        control.update()
+    assert abs(kettle.water - 65) < 1 and zone.temperature == kettle.probe and zone.target == 65.0, kettle.water
+    print(f'kettle: {kettle.water:.1f} C after 4 hours (target 65), switched on: {toggles.on()} times')
+
+    fridge, compressor, heater = _fridge(ambient=25)
+    assert abs(fridge.wort - 18) < 0.5 and not heater.on(), fridge.wort
+    assert compressor.shortest('ON') >= 180 and compressor.shortest('OFF') >= 300
+    print(f'fridge: {fridge.wort:.1f} C after 12 hours (target 18, ambient 25), compressor switched on:'
+          f' {compressor.on()} times, shortest on: {compressor.shortest("ON"):.0f}s,'
+          f' shortest off: {compressor.shortest("OFF"):.0f}s')
+    fridge, compressor, heater = _fridge(ambient=10)
+    assert abs(fridge.wort - 18) < 0.5 and not compressor.on() and heater.on(), fridge.wort
+    print(f'fridge: {fridge.wort:.1f} C after 12 hours (target 18, ambient 10), heater switched on:'
+          f' {heater.on()} times, compressor: {compressor.on()} times')
+
+
+def _zones():
+    """Create the zones of the kettle and the fridge."""
+    callback = lambda **_: None  # noqa: E731
+    kettle = Zone('kettle', _Probe(Kettle()), lambda temperature: 65.0,
+                  [Actuator(PowerSwitch('kettle switch', 13, callback=callback))])
+    fridge = Zone('fridge', _Probe(Fridge()), lambda temperature: 18.0,
+                  [Actuator(PowerSwitch('fridge switch', 12, callback=callback), direction=COOL, min_on=180, min_off=300),
+                   Actuator(PowerSwitch('fridge heater switch', 14, callback=callback))], deadband=1.0)
+    return kettle, fridge
+
+
+class _CountingDeque(collections.deque):
+    """The queue of the callbacks that are ready to run: counts the callbacks that run."""
+    runs = 0
+
+    def popleft(self):
+        self.runs += 1
+        return super().popleft()
+
+
+def _callbacks(controls) -> int:
+    """Run the controls for a minute on virtual time, return the number of callbacks the event loop ran
+    (every resumption of a task that slept is a timer callback and a step of the task).
+    """
+    loop = simulation.use_virtual_time()
+    loop._ready = _CountingDeque(loop._ready)
+    tasks = [loop.create_task(control.run()) for control in controls]
+    loop.run_until_complete(asyncio.sleep(0))  # Start the tasks
+    runs = loop._ready.runs
+    loop.run_until_complete(asyncio.sleep(60))
+    runs = loop._ready.runs - runs
+    for task in tasks:
+        task.cancel()
+    loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+    loop.close()
+    return runs
+
+
+def _allocated(controls, count: int = 1000) -> Tuple[float, float]:
+    """Get the memory allocated per tick of all zones: the peak during a tick, and the memory kept. [bytes]"""
+    for control in controls:
+        control.update()
+    peak = 0
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    for _ in range(count):
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        for control in controls:
+            control.update()
+        peak += tracemalloc.get_traced_memory()[1] - before
+    kept = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+    return peak / count, kept / count
+
+
+def benchmark():
+    """Compare a task per zone with one task for all zones."""
+    for name, create in (('task per zone', lambda: [TemperatureControl(INTERVAL) for _ in range(2)]),
+                         ('one task (2 zones)', lambda: [TemperatureControl(INTERVAL)])):
+        controls = create()
+        for index, zone in enumerate(_zones()):
+            controls[index % len(controls)].add(zone)
+        peak, kept = _allocated(controls)
+        print(f'{name:20}  loop callbacks: {_callbacks(controls):4}/min  allocated per tick: peak {peak:5.1f} bytes,'
+              f' kept {kept:3.1f} bytes')
+
+
+if __name__ == '__main__':
+    test()
+    benchmark()
@@ -0,0 +1,124 @@
+"""Test the time_series module.
+
+This test runs on the host from the src folder: `python test/time_series_test.py`
+The benchmark stores a brew session of 5 hours (8 stages), with the kettle and the environment temperature every 10s.
+
+Result (host, CPython 3.11):
+record: 6 us/measurement  flash: 17928 bytes (last stage 4068, per minute 12600, per 10 minutes 1260), all measurements with an absolute time: 43200 bytes
+query session: stream (generator)  487 records  3.0 ms  peak heap: 7017 bytes
+query session: list                487 records  5.8 ms  peak heap: 48773 bytes
+The query of the session gives the minutes of the previous stages and the measurements of the last stage.
+"""
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.append('.')  # Support running on the host from the src folder
+import simulation  # pylint: disable=unused-import
+from simulation.manual_clock import ManualClock
+from time_series import TimeSeries
+
+START = 1_699_999_800  # At the start of a period of 10 minutes
+
+
+def _size(folder: str, suffix: str) -> int:
+    return sum(os.stat(f'{folder}/{name}')[6] for name in os.listdir(folder) if name.endswith(suffix))
+
+
+def test_store():
+    """Measurements are kept for the current stage, and the rollups for the older stages."""
+    with tempfile.TemporaryDirectory(prefix='time_series_') as folder:
+        clock = ManualClock(START)
+        store = TimeSeries(f'{folder}/store', clock=clock)
+        for index in range(360):  # 1 hour of measurements every 10s
+            clock.now = START + 10 * index
+            store.record(**{'kettle temperature': 20 + index / 10, 'kettle switch': 'ON', 'recipe': 'Mash'})
+        clock.now = START + 4 * 3600 + 0.3  # After a gap that does not fit in the delta of a record
+        store.record(**{'kettle temperature': 99.5})
+        records = list(store.query('kettle temperature'))
+        assert len(records) == 361 and records[0] == (START, 20.0, 20.0, 20.0), records[0]
+        assert abs(records[-1][0] - (START + 4 * 3600 + 0.3)) < 1e-6 and abs(records[-1][1] - 99.5) < 1e-5, \
+            records[-1]
+        assert [record[0] for record in store.query('kettle temperature', START + 600, START + 660)] == \
+            [START + 600 + 10 * index for index in range(6)]
+        assert not list(store.query('kettle switch')) and not list(store.query('fridge temperature'))
+
+        store.new_stage()
+        clock.now = START + 4 * 3600 + 700
+        store.record(**{'kettle temperature': 99.0})
+        records = list(store.query('kettle temperature'))
+        # Per minute of the first hour and after the gap, the new stage
+        assert len(records) == 60 + 1 + 1, len(records)
+        moment, minimum, mean, maximum = records[1]  # The second minute: 20.6 .. 21.1
+        assert moment == START + 60 and abs(minimum - 20.6) < 1e-5 and abs(maximum - 21.1) < 1e-5, records[1]
+        assert abs(mean - 20.85) < 1e-5, mean
+        assert records[-1][0] == START + 4 * 3600 + 700
+
+        store = TimeSeries(f'{folder}/store', clock=clock)  # A reset: the records in RAM are lost, the files stay
+        assert list(store.query('kettle temperature')) == records, 'the written records are kept'
+        clock.now = START + 5 * 3600
+        store.record(**{'kettle temperature': 98.0})
+        assert list(store.query('kettle temperature'))[-1] == (START + 5 * 3600, 98.0, 98.0, 98.0)
+        assert [record[0] for record in store.query('kettle temperature', end=START + 600)] == \
+            [START + 60 * index for index in range(10)]
+
+
+def test_limit():
+    """The oldest half of the records is dropped when a file exceeds its limit."""
+    with tempfile.TemporaryDirectory(prefix='time_series_') as folder:
+        clock = ManualClock(START)
+        store = TimeSeries(folder, limits=(100, 1440, 4320), block_size=60, clock=clock)
+        for index in range(1000):
+            clock.now = START + index
+            store.record(fridge=float(index))
+        store.flush()
+        assert os.stat(f'{folder}/fridge.0')[6] <= 100 * 6
+        values = [record[1] for record in store.query('fridge', START + 900)]
+        assert 40 <= len(values) <= 100 and values == list(range(1000 - len(values), 1000)), values
+        records = list(store.query('fridge'))
+        assert records[0][:2] == (START, 0.0) and records[1][:2] == (START + 60, 60.0), \
+            'older minutes are taken from the rollups'
+        assert all(records[index][0] < records[index + 1][0] for index in range(len(records) - 1))
+        assert len(records) <= 100 + 16, len(records)
+
+
+def _session(store: TimeSeries, clock: ManualClock):
+    """Record a brew session of 5 hours with 8 stages."""
+    for index in range(5 * 360):
+        clock.now = START + 10 * index
+        if index % 225 == 0:
+            store.new_stage()
+        store.record(**{'kettle temperature': 20 + 80 * (index % 225) / 225, 'environment temperature': 18.5,
+                        'target temperature': 65.0, 'kettle switch': 'ON'})
+    store.flush()
+
+
+def benchmark():
+    """Measure the size of the files, the duration and the memory use of a query of the session."""
+    with tempfile.TemporaryDirectory(prefix='time_series_') as folder:
+        clock = ManualClock(START)
+        store = TimeSeries(folder, clock=clock)
+        start = time.perf_counter()
+        _session(store, clock)
+        elapsed = (time.perf_counter() - start) / (5 * 360 * 3)
+        sizes = [_size(folder, suffix) for suffix in ('.0', '.60', '.600')]
+        print(f'record: {elapsed * 1e6:.0f} us/measurement  flash: {sum(sizes)} bytes (last stage {sizes[0]},'
+              f' per minute {sizes[1]}, per 10 minutes {sizes[2]}), all measurements with an absolute time:'
+              f' {5 * 360 * 3 * 8} bytes')
+        for name, query in (('stream (generator)', lambda: sum(1 for _ in store.query('kettle temperature'))),
+                            ('list', lambda: len(list(store.query('kettle temperature'))))):
+            tracemalloc.start()
+            start = time.perf_counter()
+            count = query()
+            elapsed = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(f'query session: {name:18}  {count} records  {elapsed * 1e3:.1f} ms  peak heap: {peak} bytes')
+
+
+if __name__ == '__main__':
+    test_store()
+    test_limit()
+    benchmark()